@@ -0,0 +1,56 @@
+import sys
+import time
+import numpy as np
+from utils.nms import nms
+
+# times junction nms on random detections of growing size, python3 benchmark_nms.py [max_scan]
+# the per-pair reference (nms_scan) only runs up to max_scan detections (default 1000)
+max_scan = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+rng = np.random.RandomState(0)
+
+def nms_scan(junctions, junc_confs, thetas, theta_confs, nms_thresh=4.0):
+
+    # per-pair loop nms replaced, for reference
+    inds = np.argsort(junc_confs)[::-1]
+    junc_confs_sorted = np.array(junc_confs[inds])
+    juncs_sorted = np.array(junctions[inds])
+    thetas_sorted = np.array(thetas[inds])
+    theta_confs_sorted = np.array(theta_confs[inds])
+
+    # get loop
+    dists = np.apply_along_axis(np.linalg.norm, 2,\
+        juncs_sorted[:, None, :] - juncs_sorted[None, :, :])
+
+    # apply nms
+    keep_track = np.zeros(junc_confs_sorted.shape[0])
+    nms_inds = []
+    for i in range(junc_confs_sorted.shape[0]):
+        if (keep_track[i] == 0):
+            nms_inds.append(i)
+            for j in range(junc_confs_sorted.shape[0]):
+                if dists[i, j] < nms_thresh:
+                    keep_track[j] = 1
+
+    return juncs_sorted[nms_inds], junc_confs_sorted[nms_inds], thetas_sorted[nms_inds], theta_confs_sorted[nms_inds]
+
+def detections(n):
+
+    # corners of a 256x256 crop, clustered as the detector outputs them
+    centers = rng.uniform(0, 256, (max(n//10, 1), 2))
+    junctions = centers[rng.randint(0, centers.shape[0], n)] + rng.normal(0, 3.0, (n, 2))
+    return junctions, rng.rand(n), rng.rand(n, 36), rng.rand(n, 36)
+
+def timed(fn, *args, **kwargs):
+    start = time.time()
+    out = fn(*args, **kwargs)
+    return time.time()-start, out
+
+for n in [10, 30, 100, 300, 1000, 3000, 10000]:
+    dets = detections(n)
+    t_new, out = timed(nms, *dets, nms_thresh=8.0)
+    line = '{:>6} detections - {:>5} kept, nms: {:.2f}ms'.format(n, out[0].shape[0], 1000.0*t_new)
+    if n <= max_scan:
+        t_scan, ref = timed(nms_scan, *dets, nms_thresh=8.0)
+        same = all(np.array_equal(a, b) for a, b in zip(ref, out))
+        line += ' scan: {:.2f}ms speedup: {:.1f}x identical: {}'.format(1000.0*t_scan, t_scan/t_new, same)
+    print(line)
@@ -0,0 +1,90 @@
+import time
+import numpy as np
+from utils.utils import load_building, load_shared_edges
+from PIL import Image
+from utils.optimizer import compute_orientation, getOrientationRaster, getIntersection
+
+prefix = '/local-scratch2/nnauata/cities_dataset'
+res_dir = '/local-scratch2/nnauata/outdoor_project/results/junc/3/15/2'
+edge_dir = '{}/edge_map/'.format(prefix)
+region_dir = '/{}/regions_no_bkg/'.format(prefix)
+shared_edges_fname = '{}/shared_edges_no_bkg.pkl'.format(prefix)
+bundle_dir = '{}/bundles'.format(prefix)
+
+# compares compute_orientation against the per-angle rendering on every shared edge mask,
+# the normals are expected to match exactly (0 degrees tolerance)
+n_buildings = 50
+
+with open('{}/valid_list.txt'.format(prefix)) as f:
+    _ids = [x.strip() for x in f.readlines()][:n_buildings]
+
+shared_edges = load_shared_edges(_ids, shared_edges_fname, bundle_dir)
+
+def compute_orientation_raster(edge_mask, imsize=256):
+
+    # per-angle rendering compute_orientation replaced, for reference
+    inds = np.array(np.where(edge_mask>0))
+    deltas = 127-np.mean(inds, -1)[:, np.newaxis]
+    new_inds = (inds+deltas).astype('int')
+    centralized_edge_mask = np.zeros_like(edge_mask)
+    centralized_edge_mask[new_inds[0, :], new_inds[1, :]] = 1.0
+    centralized_edge_mask = Image.fromarray((centralized_edge_mask*255).astype('uint8'))
+
+    max_inliers = 0.0
+    best_norm = None
+    for an in range(360):
+        rad = np.radians(an)
+        dy = np.sin(rad)*100.0
+        dx = np.cos(rad)*100.0
+        x0, y0 = 127+dx, 127+dy
+        x1, y1 = 127-dx, 127-dy
+
+        intersec = getIntersection(centralized_edge_mask, (x0, y0), (x1, y1), width=4)
+        if intersec > max_inliers:
+            max_inliers = intersec
+            rad = np.radians(an+90.0)
+            dy = np.sin(rad)*8.0
+            dx = np.cos(rad)*8.0
+            x0, y0 = 127+dx, 127+dy
+            x1, y1 = 127-dx, 127-dy
+            best_norm = (int(x0), int(y0), int(x1), int(y1))
+
+    if best_norm is None:
+        return None
+    return (best_norm[0]-deltas[1], best_norm[1]-deltas[0], best_norm[2]-deltas[1], best_norm[3]-deltas[0])
+
+def norm_angle(norm):
+    x0, y0, x1, y1 = [float(np.ravel(v)[0]) for v in norm]
+    return np.degrees(np.arctan2(y1-y0, x1-x0))%180.0
+
+# build the angle templates before timing
+getOrientationRaster()
+
+times = {'raster': [], 'batched': []}
+diffs = []
+for _id in _ids:
+
+    # every shared edge mask of the building
+    b = load_building(_id, res_dir, edge_dir, region_dir, shared_edges, bundle_dir=bundle_dir)
+    masks = [msk for key in sorted(b['shared_edges']) for msk in b['shared_edges'][key]]
+    for edge_msk in masks:
+        start = time.time()
+        ref = compute_orientation_raster(edge_msk)
+        times['raster'].append(time.time()-start)
+        start = time.time()
+        norm = compute_orientation(edge_msk)
+        times['batched'].append(time.time()-start)
+        if ref is None or norm is None:
+            diffs.append(0.0 if ref is norm else 90.0)
+            continue
+        diff = abs(norm_angle(ref)-norm_angle(norm))
+        diffs.append(min(diff, 180.0-diff))
+    print('{} - {} masks'.format(_id, len(masks)))
+
+# summary
+diffs = np.array(diffs)
+for name in times:
+    t = np.array(times[name])
+    print('{} - mean: {:.2f}ms total: {:.1f}s'.format(name, 1000.0*t.mean(), t.sum()))
+print('{} masks, speedup: {:.1f}x, angle difference max: {:.1f} deg, identical: {}'.format(diffs.shape[0], \
+    np.sum(times['raster'])/np.sum(times['batched']), diffs.max() if diffs.shape[0] > 0 else 0.0, int((diffs == 0).sum())))
@@ -0,0 +1,117 @@
+import pickle as p
+import csv
+import time
+import sys
+import os
+import numpy as np
+from utils.utils import load_building, load_shared_edges
+from utils.optimizer import reconstructBuilding
+from utils.regions import PreparedRegions
+
+prefix = '/local-scratch2/nnauata/cities_dataset'
+res_dir = '/local-scratch2/nnauata/outdoor_project/results/junc/3/15/2'
+edge_dir = '{}/edge_map/'.format(prefix)
+region_dir = '/{}/regions_no_bkg/'.format(prefix)
+shared_edges_fname = '{}/shared_edges_no_bkg.pkl'.format(prefix)
+bundle_dir = '{}/bundles'.format(prefix)
+
+# backends to compare, e.g. python benchmark_solvers.py gurobi gurobi_linear cbc highs
+# the '_linear' suffix uses the linearized formulation and '_pruned' the candidate-edge pruning,
+# e.g. gurobi_linear_pruned, deltas are reported against the first one
+solvers = sys.argv[1:] if len(sys.argv) > 1 else ['gurobi', 'gurobi_linear', 'cbc', 'highs']
+n_buildings = 50
+
+# one record per building and backend (phase times, model size, status, gap, nodes)
+stats_fname = '../results/solver_stats.csv'
+records = []
+
+with open('{}/valid_list.txt'.format(prefix)) as f:
+    _ids = [x.strip() for x in f.readlines()][:n_buildings]
+
+shared_edges = load_shared_edges(_ids, shared_edges_fname, bundle_dir)
+
+# same setup as experiment VI
+def run(solver, cs, cs_c, edge_map, th, th_c, region_mks, shared_edges, _id, stats, region_prep=None):
+    return reconstructBuilding(cs, edge_map,
+                               use_junctions_with_var=True,
+                               thetas=th,
+                               angle_thresh=5,
+                               with_corner_edge_confidence=True,
+                               corner_confs=cs_c,
+                               theta_confs=th_c,
+                               theta_threshold=0.25,
+                               corner_edge_thresh=0.125,
+                               edge_map_weight=10.0,
+                               intersection_constraint=True,
+                               post_process=True,
+                               corner_min_degree_constraint=True,
+                               with_corner_variables=True,
+                               junctions_soft=True,
+                               use_regions=True,
+                               region_intersection_constraint=True,
+                               region_hit_threshold=0.1,
+                               regions=region_mks,
+                               region_prep=region_prep,
+                               shared_edges=shared_edges,
+                               closed_region_constraint=True,
+                               _id=_id,
+                               solver=solver.split('_')[0],
+                               linearize='_linear' in solver,
+                               prune_edges='_pruned' in solver,
+                               stats=stats)
+
+times = {s: [] for s in solvers}
+solve_times = {s: [] for s in solvers}
+sizes = {s: [] for s in solvers}
+for _id in _ids:
+
+    # load post-nms detections, edge map and filtered regions
+    b = load_building(_id, res_dir, edge_dir, region_dir, shared_edges, bundle_dir=bundle_dir)
+    cs, cs_c, th, th_c = b['cs'], b['cs_c'], b['th'], b['th_c']
+    edge_map, region_mks = b['edge_map'], b['region_mks']
+
+    # regions eroded once, shared by every backend
+    region_prep = PreparedRegions(region_mks)
+
+    # time each backend on the same inputs
+    line = [_id]
+    outputs = []
+    for solver in solvers:
+        stats = {}
+        start = time.time()
+        junctions, juncs_on, lines_on, _ = run(solver, cs, cs_c, edge_map, th, th_c, region_mks, b['shared_edges'], _id, stats, region_prep)
+        times[solver].append(time.time()-start)
+        records.append(dict(stats, config=solver))
+        solve_times[solver].append(stats['solve_time'])
+        sizes[solver].append((stats['num_vars'], stats['num_constrs']+stats['num_qconstrs']))
+        outputs.append(sorted(tuple(sorted(e)) for e in lines_on))
+        line.append('{}: {:.2f}s (solve {:.2f}s, {} vars, {} constrs, {} qconstrs, {}/{} edges pruned)'.format(solver, times[solver][-1], \
+            stats['solve_time'], stats['num_vars'], stats['num_constrs'], stats['num_qconstrs'], \
+            stats['num_pruned_edges'], stats['num_candidate_edges']))
+    line.append('same edges' if all(o == outputs[0] for o in outputs) else 'edges differ')
+    print(' '.join(line))
+
+# per-call records, e.g. to find the buildings that stall the solver
+os.makedirs(os.path.dirname(stats_fname), exist_ok=True)
+with open(stats_fname, 'w') as f:
+    writer = csv.DictWriter(f, fieldnames=list(records[0].keys()))
+    writer.writeheader()
+    writer.writerows(records)
+
+# summary
+ref = np.array(solve_times[solvers[0]])
+ref_size = np.array(sizes[solvers[0]])
+for solver in solvers:
+    t = np.array(times[solver])
+    st = np.array(solve_times[solver])
+    size = np.array(sizes[solver])
+    print('{} - mean: {:.2f}s median: {:.2f}s max: {:.2f}s total: {:.1f}s solve: {:.1f}s ({:+.1f}s vs {})'.format(solver, \
+        t.mean(), np.median(t), t.max(), t.sum(), st.sum(), st.sum()-ref.sum(), solvers[0]))
+    print('{} - vars: {} ({:+d}) constrs: {} ({:+d})'.format(solver, size[:, 0].sum(), size[:, 0].sum()-ref_size[:, 0].sum(), \
+        size[:, 1].sum(), size[:, 1].sum()-ref_size[:, 1].sum()))
+
+# where the time goes, summed over buildings
+phases = [k for k in records[0] if k.startswith('time_') and k != 'time_total']
+for solver in solvers:
+    total = dict((k, sum(r[k] for r in records if r['config'] == solver)) for k in phases)
+    print('{} - phases: {}'.format(solver, ' '.join('{}: {:.1f}s'.format(k[5:], total[k]) for k in sorted(phases, key=total.get, reverse=True))))
@@ -8,7 +8,7 @@ import numpy as np
 import os
 
 # Experiment IV - Enforcing closed polygons
-def run_experiment_4(cs, cs_c, edge_map, th, th_c, metric, graph_annot, region_mks, rgb_dir, _id):
+def run_experiment_4(cs, cs_c, edge_map, th, th_c, metric, graph_annot, region_mks, rgb_dir, _id, region_prep=None):
 
 	# Run experiment
 	junctions, juncs_on, lines_on, regs_sm_on = reconstructBuilding(cs, edge_map,
@@ -31,6 +31,7 @@ def run_experiment_4(cs, cs_c, edge_map, th, th_c, metric, graph_annot, region_m
 																	closed_region_constraint=True,
 																	region_hit_threshold=0.1,
 																	regions=region_mks,
+																	region_prep=region_prep,
 																	_id=_id)
 
 	# Draw regions
@@ -8,7 +8,7 @@ import numpy as np
 import os
 
 # Experiment V - Removing edges intersecting regions
-def run_experiment_5(cs, cs_c, edge_map, th, th_c, metric, graph_annot, region_mks, shared_edges, rgb_dir, _id):
+def run_experiment_5(cs, cs_c, edge_map, th, th_c, metric, graph_annot, region_mks, shared_edges, rgb_dir, _id, region_prep=None):
 
 	# Run experiment
 	junctions, juncs_on, lines_on, regs_sm_on = reconstructBuilding(cs, edge_map,
@@ -31,6 +31,7 @@ def run_experiment_5(cs, cs_c, edge_map, th, th_c, metric, graph_annot, region_m
 																	region_intersection_constraint=True,
 																	region_hit_threshold=0.1,
 																	regions=region_mks,
+																	region_prep=region_prep,
 																	shared_edges=None,
 																	closed_region_constraint=True,
 _id=_id)
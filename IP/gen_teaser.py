@@ -11,6 +11,7 @@ from models.graph import EdgeClassifier
 from models.resnet import resnet152, resnet18
 import torch
 from utils import * 
+from utils.regions import PreparedRegions
 from experiments.exp_0 import *
 from experiments.exp_1 import *
 from experiments.exp_2 import *
@@ -26,13 +27,13 @@ edge_dir = '{}/edge_map/'.format(prefix)
 annot_dir = '{}/annot/'.format(prefix)
 region_dir = '/{}/regions_no_bkg/'.format(prefix)
 shared_edges_fname = '{}/shared_edges_no_bkg.pkl'.format(prefix)
-
-with open(shared_edges_fname, 'rb') as f:
-    shared_edges = p.load(f, encoding='latin1')
+bundle_dir = '{}/bundles'.format(prefix)
 
 with open('{}/all_list.txt'.format(prefix)) as f:
 	_ids = [x.strip() for x in f.readlines()]
 
+shared_edges = load_shared_edges(_ids, shared_edges_fname, bundle_dir)
+
 for _id in _ids:
 
 # 	if _id not in ['1554148701.17']:
@@ -40,29 +41,18 @@ for _id in _ids:
 
 	print(_id)
 
-	# load detections
-	fname = '{}/{}.jpg_5.pkl'.format(res_dir, _id)
-	with open(fname, 'rb') as f:
-		c = p.load(f, encoding='latin1')
-
-	# apply non maxima supression
-	cs, cs_c, th, th_c = nms(c['junctions'], c['junc_confs'], c['thetas'], c['theta_confs'], nms_thresh=8.0)
-
-	# load annotations
-	p_path = '{}/{}.npy'.format(annot_dir, _id)
-	v_set = np.load(open(p_path, 'rb'),  encoding='bytes', allow_pickle=True)
-	graph_annot = dict(v_set[()])[b'graph']
+	# load post-nms detections, annotations, edge map and filtered region masks
+	b = load_building(_id, res_dir, edge_dir, region_dir, shared_edges, annot_dir=annot_dir, bundle_dir=bundle_dir)
+	cs, cs_c, th, th_c = b['cs'], b['cs_c'], b['th'], b['th_c']
+	graph_annot = b['graph_annot']
 	cs_annot, es_annot = load_annots(graph_annot)
-
-	# load edge map
-	edge_map_path = '{}/{}.jpg'.format(edge_dir, _id)
+	edge_map = b['edge_map']
+	region_mks, shared_edges_per_id = b['region_mks'], b['shared_edges_per_id']
+	bld_shared_edges = b['shared_edges']
 	im_path = '{}/{}.jpg'.format(rgb_dir, _id)
-	edge_map = np.array(Image.open(edge_map_path).convert('L'))/255.0
 
-	# load region masks
-	region_path = '{}/{}.npy'.format(region_dir, _id)
-	region_mks = np.load(region_path)
-	region_mks, shared_edges_per_id = filter_regions(region_mks, shared_edges, _id)
+	# region masks eroded and contoured once for experiments 4-6
+	region_prep = PreparedRegions(region_mks)
 
 	# compute edge scores from classifier
 	lw_from_cls = None #get_edge_scores(cs, region_mks, rgb_dir, _id)
@@ -88,9 +78,9 @@ for _id in _ids:
 # 	run_experiment_1(cs, edge_map, th_filtered, metrics[1], graph_annot, rgb_dir, _id)
 # 	run_experiment_2(cs, cs_c, edge_map, th_filtered, metrics[2], graph_annot, rgb_dir, _id)
 # 	run_experiment_3(cs, cs_c, edge_map, th, th_c, metrics[3], graph_annot, rgb_dir, _id)
-# 	run_experiment_4(cs, cs_c, edge_map, th, th_c, metrics[4], graph_annot, region_mks, rgb_dir, _id)
-# 	run_experiment_5(cs, cs_c, edge_map, th, th_c, metrics[5], graph_annot, region_mks, shared_edges, rgb_dir, _id)
-	run_experiment_6(cs, cs_c, edge_map, th, th_c, None, graph_annot, region_mks, shared_edges, rgb_dir, _id)
+# 	run_experiment_4(cs, cs_c, edge_map, th, th_c, metrics[4], graph_annot, region_mks, rgb_dir, _id, region_prep=region_prep)
+# 	run_experiment_5(cs, cs_c, edge_map, th, th_c, metrics[5], graph_annot, region_mks, bld_shared_edges, rgb_dir, _id, region_prep=region_prep)
+	run_experiment_6(cs, cs_c, edge_map, th, th_c, None, graph_annot, region_mks, bld_shared_edges, rgb_dir, _id, region_prep=region_prep)
 # 	draw_junctions(_id, cs, th, th_c)
 # 	show_shared_edges(im_path, shared_edges_per_id, _id)
     
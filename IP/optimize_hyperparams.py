@@ -1,17 +1,15 @@
 import pickle as p
+import sys
 import glob
 import svgwrite
 import os
 import numpy as np
-from utils.optimizer import reconstructBuildingBaseline
+from utils.optimizer import reconstructBuilding, resolveBuilding
 from utils.metrics import Metrics
-from utils.utils import nms
+from utils.utils import nms, get_edge_scores, suppress_regions
 from PIL import Image, ImageDraw, ImageFilter
 import matplotlib.pyplot as plt
 from bayes_opt import BayesianOptimization
-from model.resnet import resnet152, resnet18
-from model.graph import EdgeClassifier
-import torch
 
 def draw_junctions(dwg, junctions, thetas=None, theta_confs=None):
 
@@ -44,54 +42,9 @@ def filter_angles(th, th_c, thresh=0.5):
 
 def filter_regions(region_mks, filter_size=11):
 
-    # sort by size
-    sizes = []
-    reg_sm = []
-    for i, reg_i in enumerate(region_mks):
-
-        # apply min filter 
-        reg_i_sm = Image.fromarray(reg_i*255.0)
-        reg_i_sm = reg_i_sm.filter(ImageFilter.MinFilter(filter_size))
-        reg_i_sm = np.array(reg_i_sm)/255.0
-        reg_sm.append(reg_i_sm)
-        sizes.append(reg_i_sm.sum())
-
-    inds = np.argsort(sizes)[::-1]
-    sizes_sorted = np.array(sizes)[inds]
-    region_mks_sorted = np.array(region_mks)[inds]
-    reg_sm_sorted = np.array(reg_sm)[inds]
-
-    # filter zero sized
-    inds = np.where(sizes_sorted>0)
-    sizes_sorted = sizes_sorted[inds]
-    region_mks_sorted = region_mks_sorted[inds]
-    reg_sm_sorted = reg_sm_sorted[inds]
-
-    # suppress regions
-    suppressed = np.zeros(region_mks_sorted.shape[0])
-    for i, reg_i in enumerate(region_mks_sorted):
-        for j, reg_j in enumerate(region_mks_sorted):
-            if i != j and not suppressed[i] and not suppressed[j]:
-                intersec = np.logical_and(reg_sm_sorted[i], reg_sm_sorted[j])
-                intersec = np.array(np.where(intersec>0))
-                if intersec.shape[1] > 0:
-                    suppressed[j] = 1
-
-                    # # DEBUG
-                    # deb_1 = Image.fromarray(reg_i*255.0)
-                    # deb_2 = Image.fromarray(reg_j*255.0)
-                    # plt.figure()
-                    # plt.imshow(deb_1)
-                    # plt.figure()
-                    # plt.imshow(deb_2)
-                    # plt.show()
-
-    regions_filtered = [m for i, m in enumerate(region_mks_sorted) if not suppressed[i]]
-    regions_filtered = np.array(regions_filtered)
-    sizes_filtered = [s for i, s in enumerate(sizes_sorted) if not suppressed[i]]
-    sizes_filtered = np.array(sizes_filtered)
-
-    return regions_filtered
+    # regions kept after suppression, largest first
+    region_mks = np.array(region_mks)
+    return np.array([region_mks[i] for i in suppress_regions(region_mks, filter_size)])
 
 def load_annots(graph):
 
@@ -145,64 +98,6 @@ def draw_building(dwg, junctions, juncs_on, lines_on):
         dwg.add(dwg.circle(center=(x, y), r=2, stroke='green', fill='white', stroke_width=1, opacity=.8))
     return 
 
-def get_edge_scores(junctions, regions, rgb_folder, _id, epoch=1, model='resnet152'):
-
-    # load model
-    resnet = resnet152(pretrained=False).cuda()
-    edge_classifier = EdgeClassifier(resnet)
-    edge_classifier = edge_classifier.cuda()
-    edge_classifier = edge_classifier.eval()
-
-    # open RGB image
-    split = 'det'
-    out_size = 256
-    rgb_path = os.path.join(rgb_folder, _id +'.jpg')
-    rgb = Image.open(rgb_path).resize((out_size, out_size))
-    rgb = np.array(rgb)/255.0
-    model_path = '/home/nelson/Workspace/building_reconstruction/working_model/binary_edge_classifier_with_regions/saved_models/edge_classifier_{}_{}_iter_{}.pth'.format(model, split, epoch)
-    edge_classifier.load_state_dict(torch.load(model_path))
-
-    # check backup -- save time
-    temp_dir = './temp/{}/'.format(model)
-    if not os.path.isdir(temp_dir):
-        os.makedirs(temp_dir)
-
-    backup_path = '{}/{}_{}_{}.npy'.format(temp_dir, _id, epoch, split)
-    if os.path.isfile(backup_path):
-        return np.load(open(backup_path, 'rb'),  encoding='bytes').item()
-
-
-    # combine regions
-    all_reg = np.zeros((out_size, out_size))
-    for k, reg in enumerate(regions):
-        reg = Image.fromarray(reg*255.0).resize((out_size, out_size))
-        reg = np.array(reg)/255.0
-        inds = np.array(np.where(reg==1))
-        all_reg[inds[0, :], inds[1, :]] = k
-
-    # draw edge
-    lw_from_cls = {}
-    for k, c1 in enumerate(junctions):
-        for l, c2 in enumerate(junctions):
-            if k > l:
-                edge = Image.new('L', (out_size, out_size))
-                dr = ImageDraw.Draw(edge)
-                x1, y1 = c1
-                x2, y2 = c2
-                div = 256.0/out_size
-                dr.line((int(x1/div), int(y1/div), int(x2/div), int(y2/div)), fill="white", width=int(4/div))
-                edge = np.array(edge)/255.0
-                imgs = np.concatenate([rgb.transpose(2, 0, 1), edge[np.newaxis, :, :], all_reg[np.newaxis, :, :]], 0)
-                imgs = torch.from_numpy(imgs).cuda().float()
-                prob = edge_classifier(imgs.unsqueeze(0))
-                prob = prob.detach().cpu().numpy()
-                lw_from_cls[(k, l)] = prob[0]
-
-    # save backup
-    np.save(open(backup_path, 'wb'), lw_from_cls)
-
-    return lw_from_cls
-
 res_dir = '/home/nelson/Workspace/building_reconstruction/working_model/wireframe/result/junc/3/15/1'
 rgb_dir = '/home/nelson/Workspace/cities_dataset/rgb/'
 edge_dir = '/home/nelson/Workspace/cities_dataset/edge_map/'
@@ -212,66 +107,26 @@ region_dir = '/home/nelson/Workspace/cities_dataset/regions/'
 with open('/home/nelson/Workspace/cities_dataset/train_list.txt') as f:
     _ids = [x.strip() for x in f.readlines()][:50]
 
+# sweep mode - every building's model is built once and kept, later trials
+# only update the objective weights and re-solve from the previous solution;
+# python optimize_hyperparams.py rebuild builds the models at every trial
+sweep = not (len(sys.argv) > 1 and sys.argv[1] == 'rebuild')
+models = {}
+
 def predict_batch(region_weight, edge_map_weight, junctions_weight):
 
     metrics = Metrics()
     for _id in _ids:
 
-        # load detections
-        fname = '{}/{}.jpg_5.pkl'.format(res_dir, _id)
-        with open(fname, 'rb') as f:
-            c = p.load(f, encoding='latin1')
-
-        # apply non maxima supression
-        cs, cs_c, th, th_c = nms(c['junctions'], c['junc_confs'], c['thetas'], c['theta_confs'], nms_thresh=8.0)
-
-        # load annotations
-        p_path = '{}/{}.npy'.format(annot_dir, _id)
-        v_set = np.load(open(p_path, 'rb'),  encoding='bytes')
-        graph_annot = dict(v_set[()])
-        cs_annot, es_annot = load_annots(graph_annot)
-
-        # load edge map
-        edge_map_path = '{}/{}.jpg'.format(edge_dir, _id)
-        im_path = '{}/{}.jpg'.format(rgb_dir, _id)
-        edge_map = np.array(Image.open(edge_map_path).convert('L'))/255.0
-
-        # load region masks
-        region_path = '{}/{}.npy'.format(region_dir, _id)
-        region_mks = np.load(region_path)
-        region_mks = filter_regions(region_mks)
-
-        # compute edge scores from classifier
-        lw_from_cls = get_edge_scores(cs, region_mks, rgb_dir, _id)
-
-        # Reconstruct
-        junctions, juncs_on, lines_on, regs_sm_on = reconstructBuildingBaseline(cs, edge_map,
-            use_junctions_with_var=True,
-            use_regions=True,
-            thetas=th,
-            regions=region_mks,
-            angle_thresh=5,
-            with_corner_edge_confidence=True,
-            corner_confs=cs_c,
-            corner_edge_thresh=0.125,
-            theta_confs=th_c,
-            theta_threshold=0.25,
-            region_hit_threshold=0.1,
-            lw_from_cls=lw_from_cls,
-            use_edge_classifier=True,
-            closed_region_lowerbound=True,
-            closed_region_upperbound=True,
-            with_corner_variables=True,
-            corner_min_degree_constraint=True,
-            junctions_soft=True,
-            region_intersection_constraint=True,
-            inter_region_constraint=True,
-            post_process=True,
-
-            region_weight=region_weight,    
-            edge_map_weight=edge_map_weight, 
-            junctions_weight=junctions_weight, 
-            )
+        if sweep and _id in models:
+            model, graph_annot, edge_map_path = models[_id]
+            junctions, juncs_on, lines_on, regs_sm_on = resolveBuilding(model,
+                region_weight=region_weight,
+                edge_map_weight=edge_map_weight,
+                junctions_weight=junctions_weight)
+        else:
+            junctions, juncs_on, lines_on, regs_sm_on, graph_annot, edge_map_path = build_and_solve(_id, \
+                region_weight, edge_map_weight, junctions_weight)
         dwg = svgwrite.Drawing('../result/svg/{}.svg'.format(_id), (128, 128))
         dwg.add(svgwrite.image.Image(edge_map_path, size=(128, 128)))
         im_path = os.path.join(rgb_dir, _id + '.jpg')
@@ -279,7 +134,71 @@ def predict_batch(region_weight, edge_map_weight, junctions_weight):
         dwg.save()
         metrics.forward(graph_annot, junctions, juncs_on, lines_on, _id)
 
-    return metrics.edge_f_score()
+    recall, precision = metrics.calc_edge_metrics()
+    return 2.0*precision*recall/(precision+recall+1e-8)
+
+def build_and_solve(_id, region_weight, edge_map_weight, junctions_weight):
+
+    # load detections
+    fname = '{}/{}.jpg_5.pkl'.format(res_dir, _id)
+    with open(fname, 'rb') as f:
+        c = p.load(f, encoding='latin1')
+
+    # apply non maxima supression
+    cs, cs_c, th, th_c = nms(c['junctions'], c['junc_confs'], c['thetas'], c['theta_confs'], nms_thresh=8.0)
+
+    # load annotations
+    p_path = '{}/{}.npy'.format(annot_dir, _id)
+    v_set = np.load(open(p_path, 'rb'),  encoding='bytes', allow_pickle=True)
+    graph_annot = dict(v_set[()])
+    cs_annot, es_annot = load_annots(graph_annot)
+
+    # load edge map
+    edge_map_path = '{}/{}.jpg'.format(edge_dir, _id)
+    im_path = '{}/{}.jpg'.format(rgb_dir, _id)
+    edge_map = np.array(Image.open(edge_map_path).convert('L'))/255.0
+
+    # load region masks
+    region_path = '{}/{}.npy'.format(region_dir, _id)
+    region_mks = np.load(region_path)
+    region_mks = filter_regions(region_mks)
+
+    # compute edge scores from classifier
+    lw_from_cls = get_edge_scores(cs, region_mks, rgb_dir, _id)
+
+    # Reconstruct
+    model = {} if sweep else None
+    junctions, juncs_on, lines_on, regs_sm_on = reconstructBuilding(cs, edge_map,
+        use_junctions_with_var=True,
+        use_regions=True,
+        thetas=th,
+        regions=region_mks,
+        angle_thresh=5,
+        with_corner_edge_confidence=True,
+        corner_confs=cs_c,
+        corner_edge_thresh=0.125,
+        theta_confs=th_c,
+        theta_threshold=0.25,
+        region_hit_threshold=0.1,
+        lw_from_cls=lw_from_cls,
+        use_edge_classifier=True,
+        closed_region_constraint=True,
+        with_corner_variables=True,
+        corner_min_degree_constraint=True,
+        junctions_soft=True,
+        region_intersection_constraint=True,
+        inter_region_constraint=True,
+        post_process=True,
+
+        region_weight=region_weight,    
+        edge_map_weight=edge_map_weight, 
+        junctions_weight=junctions_weight, 
+        keep_model=model,
+        )
+    if sweep:
+        models[_id] = (model, graph_annot, edge_map_path)
+
+    return junctions, juncs_on, lines_on, regs_sm_on, graph_annot, edge_map_path
 
 # define hyperparams boundary
 pbounds = {'region_weight': (1.0, 10),
@@ -0,0 +1,53 @@
+import pickle as p
+import os
+import numpy as np
+from PIL import Image
+from utils.utils import nms, filter_regions
+from utils.bundle import save_bundle
+from utils.shared_edges import open_shared_edges
+
+prefix = '/local-scratch2/nnauata/cities_dataset'
+res_dir = '/local-scratch2/nnauata/outdoor_project/results/junc/3/15/2'
+edge_dir = '{}/edge_map/'.format(prefix)
+annot_dir = '{}/annot/'.format(prefix)
+region_dir = '/{}/regions_no_bkg/'.format(prefix)
+shared_edges_fname = '{}/shared_edges_no_bkg.pkl'.format(prefix)
+bundle_dir = '{}/bundles'.format(prefix)
+
+# sharded store if there is one, else the global pickle grouped per building
+shared_edges = open_shared_edges(shared_edges_fname)
+
+with open('{}/valid_list.txt'.format(prefix)) as f:
+    _ids = [x.strip() for x in f.readlines()]
+
+# write one bundle per building with the inputs used by the IP scripts
+os.makedirs(bundle_dir, exist_ok=True)
+for _id in _ids:
+
+    print(_id)
+
+    # load detections and apply non maxima supression
+    fname = '{}/{}.jpg_5.pkl'.format(res_dir, _id)
+    with open(fname, 'rb') as f:
+        c = p.load(f, encoding='latin1')
+    cs, cs_c, th, th_c = nms(c['junctions'], c['junc_confs'], c['thetas'], c['theta_confs'], nms_thresh=8.0)
+
+    # load annotations
+    p_path = '{}/{}.npy'.format(annot_dir, _id)
+    v_set = np.load(open(p_path, 'rb'),  encoding='bytes', allow_pickle=True)
+    graph_annot = dict(v_set[()])
+    # unwrapped as in load_building
+    if b'graph' in graph_annot:
+        graph_annot = graph_annot[b'graph']
+
+    # load edge map
+    edge_map = np.array(Image.open('{}/{}.jpg'.format(edge_dir, _id)).convert('L'))
+
+    # filter regions, reindexing (i, j) pairs instead of the masks themselves
+    region_mks = np.load('{}/{}.npy'.format(region_dir, _id))
+    pairs = {key: key[1:] for key in shared_edges.building(_id)}
+    region_mks, reindex = filter_regions(region_mks, pairs, _id)
+    reindex = {v: k[1:] for k, v in reindex.items()}
+
+    save_bundle('{}/{}.npz'.format(bundle_dir, _id), _id, cs, cs_c, th, th_c, edge_map, region_mks, \
+        shared_edges.building(_id), reindex, graph_annot)
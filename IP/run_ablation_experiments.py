@@ -1,6 +1,8 @@
 
 import pickle as p
 import glob
+import sys
+from multiprocessing import Pool
 import svgwrite
 import os
 import numpy as np
@@ -11,6 +13,7 @@ from models.graph import EdgeClassifier
 from models.resnet import resnet152, resnet18
 import torch
 from utils import * 
+from utils.regions import PreparedRegions
 from experiments_aux.exp_0 import *
 from experiments_aux.exp_1 import *
 from experiments_aux.exp_2 import *
@@ -27,44 +30,37 @@ corner_dir = '{}/dets/corners/'.format(prefix)
 annot_dir = '{}/annot/'.format(prefix)
 region_dir = '/{}/regions_no_bkg/'.format(prefix)
 shared_edges_fname = '{}/shared_edges_no_bkg.pkl'.format(prefix)
+bundle_dir = '{}/bundles'.format(prefix)
 
-metrics = [Metrics(), Metrics(), Metrics(), Metrics(), Metrics(), Metrics(), Metrics()]
-with open(shared_edges_fname, 'rb') as f:
-    shared_edges = p.load(f, encoding='latin1')
+# buildings run in a process pool, e.g. python run_ablation_experiments.py 32
+# finished buildings are recorded in the ledger so a crashed sweep resumes where it stopped
+n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+ledger_dir = '../results/ablation_ledger'
+n_experiments = 7
 
 with open('{}/valid_list.txt'.format(prefix)) as f:
 	_ids = [x.strip() for x in f.readlines()]
 
-for _id in _ids:
+shared_edges = load_shared_edges(_ids, shared_edges_fname, bundle_dir)
 
-# 	if _id not in ['1554691947.62']:
-# 		continue
+def run_building(_id):
 
+	# per-building metrics, streamed to the records by the main process
+	metrics = [Metrics() for _ in range(n_experiments)]
 	print(_id)
 
-	# load detections
-	fname = '{}/{}.jpg_5.pkl'.format(res_dir, _id)
-	with open(fname, 'rb') as f:
-		c = p.load(f, encoding='latin1')
-
-	# apply non maxima supression
-	cs, cs_c, th, th_c = nms(c['junctions'], c['junc_confs'], c['thetas'], c['theta_confs'], nms_thresh=8.0)
-
-	# load annotations
-	p_path = '{}/{}.npy'.format(annot_dir, _id)
-	v_set = np.load(open(p_path, 'rb'),  encoding='bytes', allow_pickle=True)
-	graph_annot = dict(v_set[()])
+	# load post-nms detections, annotations, edge map and filtered region masks
+	b = load_building(_id, res_dir, edge_dir, region_dir, shared_edges, annot_dir=annot_dir, bundle_dir=bundle_dir)
+	cs, cs_c, th, th_c = b['cs'], b['cs_c'], b['th'], b['th_c']
+	graph_annot = b['graph_annot']
 	cs_annot, es_annot = load_annots(graph_annot)
-
-	# load edge map
-	edge_map_path = '{}/{}.jpg'.format(edge_dir, _id)
+	edge_map = b['edge_map']
+	region_mks, shared_edges_per_id = b['region_mks'], b['shared_edges_per_id']
+	bld_shared_edges = b['shared_edges']
 	im_path = '{}/{}.jpg'.format(rgb_dir, _id)
-	edge_map = np.array(Image.open(edge_map_path).convert('L'))/255.0
 
-	# load region masks
-	region_path = '{}/{}.npy'.format(region_dir, _id)
-	region_mks = np.load(region_path)
-	region_mks, shared_edges_per_id = filter_regions(region_mks, shared_edges, _id)
+	# region masks eroded and contoured once for experiments 4-6
+	region_prep = PreparedRegions(region_mks)
 
 	# compute edge scores from classifier
 	lw_from_cls = None #get_edge_scores(cs, region_mks, rgb_dir, _id)
@@ -90,17 +86,56 @@ for _id in _ids:
 	run_experiment_1(cs, cs_c, edge_map, th_filtered, metrics[1], graph_annot, rgb_dir, _id)
 	run_experiment_2(cs, cs_c, edge_map, th, th_c, metrics[2], graph_annot, rgb_dir, _id)
 # 	run_experiment_3(cs, cs_c, edge_map, th, th_c, metrics[3], graph_annot, rgb_dir, _id)
-# 	run_experiment_4(cs, cs_c, edge_map, th, th_c, metrics[4], graph_annot, region_mks, rgb_dir, _id)
-# 	run_experiment_5(cs, cs_c, edge_map, th, th_c, metrics[5], graph_annot, region_mks, shared_edges, rgb_dir, _id)
-# 	run_experiment_6(cs, cs_c, edge_map, th, th_c, metrics[6], graph_annot, region_mks, shared_edges, rgb_dir, _id)
+# 	run_experiment_4(cs, cs_c, edge_map, th, th_c, metrics[4], graph_annot, region_mks, rgb_dir, _id, region_prep=region_prep)
+# 	run_experiment_5(cs, cs_c, edge_map, th, th_c, metrics[5], graph_annot, region_mks, bld_shared_edges, rgb_dir, _id, region_prep=region_prep)
+# 	run_experiment_6(cs, cs_c, edge_map, th, th_c, metrics[6], graph_annot, region_mks, bld_shared_edges, rgb_dir, _id, region_prep=region_prep)
 # 	draw_junctions(_id, cs, th, th_c)
 # 	show_shared_edges(im_path, shared_edges_per_id, _id)
-    
-# print metrics
-all_results = []
-for k, m in enumerate(metrics):
-	print('experiment %d'%(k))
-	values =  m.print_metrics()
-	values = [x*100.0 for x in values]
-	all_results.append(values)
-stress(all_results)
\ No newline at end of file
+
+	return _id, metrics
+
+if __name__ == '__main__':
+
+	# skip buildings already in the ledger
+	os.makedirs(ledger_dir, exist_ok=True)
+	ledger_fname = '{}/completed.txt'.format(ledger_dir)
+	records_fname = ledger_dir + '/experiment_{}.csv'
+	done = set()
+	if os.path.exists(ledger_fname):
+		with open(ledger_fname) as f:
+			done = set([x.strip() for x in f.readlines()])
+	todo = [_id for _id in _ids if _id not in done]
+	print('{} buildings done, {} to run'.format(len(_ids)-len(todo), len(todo)))
+
+	with open(ledger_fname, 'a') as ledger:
+		if n_workers > 1:
+			pool = Pool(n_workers)
+			# buildings come back in _ids order so the records are appended in that order
+			results = pool.imap(run_building, todo)
+		else:
+			results = map(run_building, todo)
+		for _id, metrics in results:
+
+			# stream the per-building counts before marking the building as done
+			for k, m in enumerate(metrics):
+				m.save_samples(records_fname.format(k), append=True)
+			ledger.write(_id + '\n')
+			ledger.flush()
+		if n_workers > 1:
+			pool.close()
+			pool.join()
+
+	# recompute the metrics from the records, a building rerun after a crash counts once;
+	# the records are written back once per building, in _ids order
+	metrics = [Metrics.load_samples(records_fname.format(k), order=_ids) for k in range(n_experiments)]
+	for k, m in enumerate(metrics):
+		m.save_samples(records_fname.format(k))
+
+	# print metrics
+	all_results = []
+	for k, m in enumerate(metrics):
+		print('experiment %d'%(k))
+		values =  m.print_metrics()
+		values = [x*100.0 for x in values]
+		all_results.append(values)
+	stress(all_results)
\ No newline at end of file
@@ -0,0 +1,10 @@
+import sys
+from utils.metrics import Metrics
+
+# recomputes precision/recall/f_score from per-building records (Metrics.save_samples)
+# without running anything, one summary per argument; shards of the same run are joined with commas:
+# python3 summarize_metrics.py ../results/ablation_ledger/experiment_0.csv run_a_0.csv,run_a_1.npz
+for arg in sys.argv[1:]:
+    metrics = Metrics.load_samples(arg.split(','))
+    print('{} - {} buildings'.format(arg, len(metrics.sample_counts)))
+    metrics.print_metrics()
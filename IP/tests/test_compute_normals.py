@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.optimizer import compute_normals, getAngle
+from utils.regions import PreparedRegions, sample_contour
+
+
+def compute_normals_loop(contour, reg_sm):
+    # reference: the per-point loop compute_normals replaced
+    thetas = []
+    points = []
+    p1 = contour[-1]
+    for k, p2 in enumerate(contour):
+
+        # compute ray
+        p3 = contour[(k+1)%contour.shape[0]]
+        a21 = getAngle(p2, p1)
+        a23 = getAngle(p2, p3)
+        an = (a21+a23)/2.0
+        ray_im = Image.new('L', (256, 256))
+        draw = ImageDraw.Draw(ray_im)
+        x1, y1 = p2
+        rad = np.radians(an)
+        dy = np.sin(rad)*10.0
+        dx = np.cos(rad)*10.0
+        x2, y2 = x1+dx, y1+dy
+        draw.line((x1, y1, x2, y2), fill='white')
+        ray = np.array(ray_im)/255.0
+        intersect = np.logical_and(ray, reg_sm).sum()/(ray.sum()+1e-8)
+        if intersect > 0.2:
+            an = (an+180)%360
+        thetas.append(an)
+        points.append(p2)
+        p1 = np.array(p2)
+    return thetas, points
+
+
+def random_regions(rng, n):
+    # quads anywhere in the image, some cut by its border
+    regions = []
+    for _ in range(n):
+        im = Image.new('L', (256, 256))
+        x, y = rng.randint(-40, 240, 2)
+        w, h = rng.randint(30, 120, 2)
+        ImageDraw.Draw(im).polygon([(x, y), (x+w, y+rng.randint(-15, 15)), (x+w, y+h), (x+rng.randint(-15, 15), y+h)], fill=255)
+        regions.append(np.array(im)/255.0)
+    regions.append(np.ones((256, 256)))
+    return np.array(regions)
+
+
+class TestComputeNormals(unittest.TestCase):
+    def check(self, contour, reg_sm, density):
+        expected = compute_normals_loop(sample_contour(contour, density), reg_sm)
+        result = compute_normals(contour, reg_sm, density)
+        self.assertEqual(len(result[0]), len(expected[0]))
+        np.testing.assert_array_equal(np.array(result[0]), np.array(expected[0]))
+        np.testing.assert_array_equal(np.array(result[1]), np.array(expected[1]))
+
+    def test_matches_loop(self):
+        rng = np.random.RandomState(0)
+        prep = PreparedRegions(random_regions(rng, 8), filter_size=3)
+        border = 0
+        for i in prep.reg_list:
+            contour = prep.contours[i]
+            border += np.any((contour == 0) | (contour == 255))
+            for density in (0.5, 1.0):
+                self.check(contour, prep.reg_sm[i], density)
+        self.assertGreater(border, 0)
+
+    def test_empty_sample(self):
+        contour = np.array([(10, 10), (20, 10), (20, 20)])
+        self.assertEqual(compute_normals(contour, np.zeros((256, 256)), 0.1), ([], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.optimizer import compute_orientation, getIntersection, reconstructBuilding
+from utils.solvers import pulp
+from test_solution_decoding import two_rooms, config
+
+
+def compute_orientation_loop(edge_mask, imsize=256):
+    # reference: the per-angle rendering compute_orientation replaced, None without inliers
+    inds = np.array(np.where(edge_mask>0))
+    deltas = 127-np.mean(inds, -1)[:, np.newaxis]
+    new_inds = (inds+deltas).astype('int')
+    centralized_edge_mask = np.zeros_like(edge_mask)
+    centralized_edge_mask[new_inds[0, :], new_inds[1, :]] = 1.0
+    centralized_edge_mask = Image.fromarray((centralized_edge_mask*255).astype('uint8'))
+
+    max_inliers = 0.0
+    best_norm = None
+    for an in range(360):
+        rad = np.radians(an)
+        dy = np.sin(rad)*100.0
+        dx = np.cos(rad)*100.0
+        x0, y0 = 127+dx, 127+dy
+        x1, y1 = 127-dx, 127-dy
+
+        intersec = getIntersection(centralized_edge_mask, (x0, y0), (x1, y1), width=4)
+        if intersec > max_inliers:
+            max_inliers = intersec
+            rad = np.radians(an+90.0)
+            dy = np.sin(rad)*8.0
+            dx = np.cos(rad)*8.0
+            x0, y0 = 127+dx, 127+dy
+            x1, y1 = 127-dx, 127-dy
+            best_norm = (int(x0), int(y0), int(x1), int(y1))
+
+    if best_norm is None:
+        return None
+    return (best_norm[0]-deltas[1], best_norm[1]-deltas[0], best_norm[2]-deltas[1], best_norm[3]-deltas[0])
+
+
+def random_masks(rng, n):
+    # short polylines of width 1 to 3, as the shared edges between two regions
+    masks = []
+    for _ in range(n):
+        im = Image.new('L', (256, 256))
+        pts = [tuple(p) for p in rng.randint(20, 236, (rng.randint(2, 4), 2))]
+        ImageDraw.Draw(im).line(pts, fill=255, width=int(rng.randint(1, 4)))
+        masks.append(np.array(im)/255.0)
+    return masks
+
+
+class TestComputeOrientation(unittest.TestCase):
+    def check(self, edge_mask):
+        expected = compute_orientation_loop(edge_mask)
+        result = compute_orientation(edge_mask)
+        if expected is None:
+            self.assertIsNone(result)
+            return
+        self.assertEqual(len(result), 4)
+        for a, b in zip(result, expected):
+            np.testing.assert_array_equal(a, b)
+
+    def test_matches_loop(self):
+        rng = np.random.RandomState(0)
+        for edge_mask in random_masks(rng, 30):
+            self.check(edge_mask)
+
+    def test_small_masks(self):
+        # a single pixel is on every line through it, the first angle wins
+        edge_mask = np.zeros((256, 256))
+        edge_mask[40, 200] = 1.0
+        self.check(edge_mask)
+        self.assertIsNotNone(compute_orientation(edge_mask))
+
+    def test_no_inliers(self):
+        # no mask pixel, or pixels too far from their center for any line
+        self.assertIsNone(compute_orientation(np.zeros((256, 256))))
+        edge_mask = np.zeros((256, 256))
+        edge_mask[2, 2] = edge_mask[253, 253] = 1.0
+        self.check(edge_mask)
+        self.assertIsNone(compute_orientation(edge_mask))
+
+    @unittest.skipIf(pulp is None, 'pulp is not installed')
+    def test_shared_edge_skipped(self):
+        # a shared edge without an orientation adds no constraint
+        junctions, edge_map, regions = two_rooms()
+        kwargs = dict(config, solver='highs', _id='b')
+        expected = reconstructBuilding(junctions, edge_map, regions=regions, **kwargs)
+        result = reconstructBuilding(junctions, edge_map, regions=regions, shared_edges={('b', 0, 1): [np.zeros((256, 256))]}, **kwargs)
+        self.assertEqual(result[2], expected[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+from utils.metrics import Metrics
+
+
+def match_corners(gts, dets, thresh=8.0):
+    # reference: the per-pair loop Metrics.forward matched corners with
+    found = [False] * gts.shape[0]
+    c_det_annot = {}
+    tp, fp = 0.0, 0.0
+    for i, det in enumerate(dets):
+        near_gt = [0, 9999999.0, (0.0, 0.0)]
+        for k, gt in enumerate(gts):
+            dist = np.linalg.norm(gt-det)
+            if dist < near_gt[1]:
+                near_gt = [k, dist, gt]
+        if near_gt[1] <= thresh and not found[near_gt[0]]:
+            tp += 1.0
+            found[near_gt[0]] = True
+            c_det_annot[i] = near_gt[0]
+        else:
+            fp += 1.0
+    return tp, fp, c_det_annot
+
+
+def on_threshold(rng, gt, thresh=8.0):
+    # a point at thresh from gt that the vectorized and the per-pair norms put on different sides
+    while True:
+        theta = rng.uniform(0, 2*np.pi)
+        det = gt+thresh*np.array([np.cos(theta), np.sin(theta)])
+        if (np.linalg.norm(gt-det) <= thresh) != (np.linalg.norm((gt-det)[np.newaxis], axis=-1)[0] <= thresh):
+            return det
+
+
+class TestCornerMatching(unittest.TestCase):
+    def test_matches_loop(self):
+        rng = np.random.RandomState(0)
+        n_hits = 0
+        for t in range(40):
+            # a ring of gt corners, detections at thresh from them (within rounding) or halfway between two
+            n = rng.randint(3, 12)
+            ang = np.sort(rng.uniform(0, 2*np.pi, n))
+            gts = np.stack([128+80*np.cos(ang), 128+80*np.sin(ang)], -1)
+            gts = np.round(gts) if t % 2 else gts
+            graph_gt = dict((tuple(gts[k]), [tuple(gts[(k+1)%n]), tuple(gts[k-1])]) for k in range(n))
+            dets = np.array([on_threshold(rng, gt) for gt in gts])
+            dets = np.concatenate([dets, (gts+np.roll(gts, 1, 0))/2.0, rng.uniform(0, 256, (3, 2))])
+            dets = dets[rng.permutation(dets.shape[0])]
+            lines_on = [tuple(rng.choice(dets.shape[0], 2, replace=False)) for _ in range(n)]
+
+            tp, fp, c_det_annot = match_corners(gts, dets)
+            edge_set = set((k, (k+1)%n) for k in range(n)) | set(((k+1)%n, k) for k in range(n))
+            edge_tp = sum(1.0 for c1, c2 in lines_on if c1 in c_det_annot and c2 in c_det_annot and \
+                (c_det_annot[c1], c_det_annot[c2]) in edge_set)
+
+            metrics = Metrics()
+            metrics.forward(graph_gt, dets, list(range(dets.shape[0])), lines_on, 'b{}'.format(t))
+            self.assertEqual((metrics.curr_corner_tp, metrics.curr_corner_fp), (tp, fp))
+            self.assertEqual(metrics.curr_edge_tp, edge_tp)
+            n_hits += tp
+        self.assertGreater(n_hits, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from utils.utils import erode_regions, suppress_regions, filter_regions
+
+
+def min_filter_regions(region_mks, filter_size=11):
+    # reference: one PIL MinFilter per region
+    return [np.array(Image.fromarray(m*255.0).filter(ImageFilter.MinFilter(filter_size)))/255.0 for m in region_mks]
+
+
+def suppress_pairwise(region_mks, filter_size=11):
+    # reference: every pair of eroded masks compared in full, largest first
+    reg_sm = min_filter_regions(region_mks, filter_size)
+    inds = [i for i in np.argsort([m.sum() for m in reg_sm])[::-1] if reg_sm[i].sum() > 0]
+    kept = []
+    for i in inds:
+        if not any(np.logical_and(reg_sm[i], reg_sm[j]).any() for j in kept):
+            kept.append(i)
+    return kept
+
+
+def random_regions(rng, n):
+    region_mks = []
+    for k in range(n):
+        im = Image.new('L', (256, 256))
+        x, y = rng.randint(-20, 256, 2)
+        w, h = rng.randint(3, 120, 2)
+        ImageDraw.Draw(im).polygon([(x, y), (x+w, y+rng.randint(-10, 10)), (x+w, y+h), (x+rng.randint(-10, 10), y+h)], fill=255)
+        region_mks.append(np.array(im)/255.0)
+    return np.array(region_mks)
+
+
+class TestFilterRegions(unittest.TestCase):
+    def test_erode(self):
+        rng = np.random.RandomState(0)
+        region_mks = random_regions(rng, 6)
+        region_mks[0] *= rng.rand(256, 256)
+        for filter_size in (3, 11):
+            eroded = erode_regions(region_mks, filter_size)
+            for a, b in zip(eroded, min_filter_regions(region_mks, filter_size)):
+                self.assertEqual(a.dtype, b.dtype)
+                np.testing.assert_array_equal(a, b)
+
+    def test_suppress(self):
+        rng = np.random.RandomState(1)
+        n_suppressed = 0
+        for _ in range(10):
+            region_mks = random_regions(rng, rng.randint(1, 15))
+            kept = suppress_regions(region_mks)
+            self.assertEqual(kept, suppress_pairwise(region_mks))
+            n_suppressed += len(region_mks)-len(kept)
+        self.assertGreater(n_suppressed, 0)
+
+    def test_reindex_shared_edges(self):
+        # the small square inside the large one is suppressed, the far one is kept
+        region_mks = np.zeros((3, 256, 256))
+        region_mks[0, 100:130, 100:130] = 1.0
+        region_mks[1, 50:200, 50:200] = 1.0
+        region_mks[2, 10:40, 210:250] = 1.0
+        shared_edges = {('b', 0, 1): 'e01', ('b', 1, 2): 'e12', ('b', 2, 1): 'e21', ('c', 1, 2): 'c12'}
+        regions, shared_edges_per_id = filter_regions(region_mks, shared_edges, 'b')
+        np.testing.assert_array_equal(regions, region_mks[[1, 2]])
+        self.assertEqual(shared_edges_per_id, {('b', 0, 1): 'e12', ('b', 1, 0): 'e21'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.labeling import fill_regions
+
+
+def flood_fill_regions(edge_mask):
+    # reference: breadth-first fill from every zero pixel, in raster order
+    edge_mask = np.array(edge_mask)
+    tag = 2
+    for i in range(edge_mask.shape[0]):
+        for j in range(edge_mask.shape[1]):
+            if edge_mask[i, j] == 0:
+                edge_mask[i, j] = tag
+                nodes = [(i, j)]
+                while len(nodes) > 0:
+                    x, y = nodes.pop()
+                    for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+                        if 0 <= x+dx < edge_mask.shape[0] and 0 <= y+dy < edge_mask.shape[1] and edge_mask[x+dx, y+dy] == 0:
+                            edge_mask[x+dx, y+dy] = tag
+                            nodes.append((x+dx, y+dy))
+                tag += 1
+    return edge_mask
+
+
+class TestFillRegions(unittest.TestCase):
+    def test_tags_in_raster_order(self):
+        edge_mask = np.array([[0, 255, 0, 0],
+                              [255, 255, 0, 255],
+                              [0, 0, 255, 0],
+                              [0, 255, 0, 0]], dtype='uint8')
+        expected = np.array([[2, 255, 3, 3],
+                             [255, 255, 3, 255],
+                             [4, 4, 255, 5],
+                             [4, 255, 5, 5]], dtype='uint8')
+        np.testing.assert_array_equal(fill_regions(edge_mask), expected)
+
+    def test_drawn_edges(self):
+        rng = np.random.RandomState(0)
+        for _ in range(5):
+            im = Image.new('L', (64, 64))
+            dr = ImageDraw.Draw(im)
+            for _ in range(rng.randint(0, 10)):
+                dr.line(tuple(rng.randint(-5, 69, 4)), fill=255, width=int(rng.choice([1, 3])))
+            edge_mask = np.array(im)
+            filled = fill_regions(edge_mask)
+            self.assertEqual(filled.dtype, edge_mask.dtype)
+            np.testing.assert_array_equal(filled, flood_fill_regions(edge_mask))
+
+
+if __name__ == "__main__":
+    unittest.main()
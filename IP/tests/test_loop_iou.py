@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+from utils.loop_iou import PackedRegions
+from utils.metrics import draw_polygons
+
+
+def mask_iou(r_det, r_gt):
+    # reference: IoU of the full size masks as Metrics.forward computed it
+    return np.logical_and(r_gt, r_det).sum()/float(np.logical_or(r_gt, r_det).sum())
+
+
+class TestPackedRegions(unittest.TestCase):
+    def test_iou_matches_masks(self):
+        rng = np.random.RandomState(0)
+        junctions = rng.uniform(-20, 276, (40, 2))
+        polys = [list(rng.choice(40, rng.randint(3, 7), replace=False)) for _ in range(30)]
+        polys = [poly + poly[:1] for poly in polys]
+        masks = draw_polygons(junctions, polys)
+        dets, gts = PackedRegions.from_masks(masks[:12]), PackedRegions.from_polygons(junctions, polys[12:])
+        np.testing.assert_array_equal(gts.masks(), masks[12:] > 0)
+
+        ious = dets.iou(gts)
+        self.assertEqual(ious.shape, (12, 18))
+        for i in range(12):
+            for k in range(18):
+                self.assertEqual(ious[i, k], mask_iou(masks[i], masks[12+k]))
+
+    def test_boxes(self):
+        mask = np.zeros((256, 256))
+        mask[10:20, 100:131] = 1.0
+        regions = PackedRegions.from_masks([mask, np.zeros((256, 256))])
+        self.assertEqual(regions.boxes, [(10, 100, 20, 131), (0, 0, 0, 0)])
+        self.assertEqual(regions.areas, [310, 0])
+
+        # disjoint boxes and empty masks give 0, as do pairs without pixels in common
+        other = np.zeros((256, 256))
+        other[20:30, 100:131] = 1.0
+        np.testing.assert_array_equal(regions.iou(PackedRegions.from_masks([mask, other])), [[1.0, 0.0], [0.0, 0.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
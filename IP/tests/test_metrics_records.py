@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from utils.metrics import Metrics, SAMPLE_COLUMNS
+
+
+def random_metrics(ids, rng):
+    metrics = Metrics()
+    for _id in ids:
+        n = rng.randint(1, 10, 4)
+        tp = rng.randint(0, n+1)
+        fp = rng.randint(0, 5, 4)
+        metrics.add_sample(_id, [x for k in range(4) for x in (float(tp[k]), float(fp[k]), int(n[k]))])
+    return metrics
+
+
+def totals(metrics):
+    keys = [k for k in vars(metrics) if k != 'sample_counts']
+    return dict((k, getattr(metrics, k)) for k in keys)
+
+
+class TestMetricsRecords(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_shards(self):
+        rng = np.random.RandomState(0)
+        ids = ['b{}'.format(k) for k in range(30)]
+        shards = [random_metrics(ids[k::3], rng) for k in range(3)]
+        full = Metrics()
+        for m in shards:
+            for _id, counts in m.sample_counts.items():
+                full.add_sample(_id, counts)
+
+        # csv, npz and a csv streamed one building at a time
+        shards[0].save_samples(os.path.join(self.tmp, 's0.csv'))
+        shards[1].save_samples(os.path.join(self.tmp, 's1.npz'))
+        for _id, counts in shards[2].sample_counts.items():
+            m = Metrics()
+            m.add_sample(_id, counts)
+            m.save_samples(os.path.join(self.tmp, 's2.csv'), append=True)
+        loaded = Metrics.load_samples([os.path.join(self.tmp, f) for f in ('s0.csv', 's1.npz', 's2.csv')])
+        self.assertEqual(totals(loaded), totals(full))
+        self.assertEqual(dict(loaded.sample_counts), dict(full.sample_counts))
+        self.assertEqual(loaded.print_metrics(), full.print_metrics())
+
+    def test_rerun_counts_once(self):
+        rng = np.random.RandomState(1)
+        fname = os.path.join(self.tmp, 'records.csv')
+        first = random_metrics(['b', 'a'], rng)
+        first.save_samples(fname, append=True)
+        rerun = random_metrics(['b'], rng)
+        rerun.save_samples(fname, append=True)
+        loaded = Metrics.load_samples(fname)
+        self.assertEqual(list(loaded.sample_counts.keys()), ['a', 'b'])
+        self.assertEqual(loaded.sample_counts['b'], rerun.sample_counts['b'])
+        with open(fname) as f:
+            self.assertEqual(f.readline().strip().split(','), ['_id'] + SAMPLE_COLUMNS)
+
+        # totals count b once, with its rerun
+        expected = Metrics()
+        expected.add_sample('a', first.sample_counts['a'])
+        expected.add_sample('b', rerun.sample_counts['b'])
+        self.assertEqual(totals(loaded), totals(expected))
+
+    def test_stable_order(self):
+        rng = np.random.RandomState(2)
+        fname = os.path.join(self.tmp, 'records.csv')
+        for _id in ['c', 'a', 'b', 'a']:
+            random_metrics([_id], rng).save_samples(fname, append=True)
+        self.assertEqual(list(Metrics.load_samples(fname).sample_counts.keys()), ['a', 'b', 'c'])
+        loaded = Metrics.load_samples(fname, order=['b', 'c'])
+        self.assertEqual(list(loaded.sample_counts.keys()), ['b', 'c', 'a'])
+
+        # written back, the records load the same
+        loaded.save_samples(fname)
+        self.assertEqual(Metrics.load_samples(fname, order=['b', 'c']).sample_counts, loaded.sample_counts)
+
+if __name__ == "__main__":
+    unittest.main()
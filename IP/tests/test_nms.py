@@ -0,0 +1,64 @@
+import unittest
+
+import numpy as np
+from utils.nms import nms, suppress_points
+
+
+def nms_scan(junctions, junc_confs, thetas, theta_confs, nms_thresh=4.0):
+    # reference: the per-pair loop nms replaced
+    inds = np.argsort(junc_confs)[::-1]
+    junc_confs_sorted = np.array(junc_confs[inds])
+    juncs_sorted = np.array(junctions[inds])
+    thetas_sorted = np.array(thetas[inds])
+    theta_confs_sorted = np.array(theta_confs[inds])
+
+    # get loop
+    dists = np.apply_along_axis(np.linalg.norm, 2,\
+        juncs_sorted[:, None, :] - juncs_sorted[None, :, :])
+
+    # apply nms
+    keep_track = np.zeros(junc_confs_sorted.shape[0])
+    nms_inds = []
+    for i in range(junc_confs_sorted.shape[0]):
+        if (keep_track[i] == 0):
+            nms_inds.append(i)
+            for j in range(junc_confs_sorted.shape[0]):
+                if dists[i, j] < nms_thresh:
+                    keep_track[j] = 1
+
+    return juncs_sorted[nms_inds], junc_confs_sorted[nms_inds], thetas_sorted[nms_inds], theta_confs_sorted[nms_inds]
+
+
+class TestJunctionNms(unittest.TestCase):
+    def test_matches_scan(self):
+        rng = np.random.RandomState(0)
+        for t in range(100):
+            n = rng.randint(1, 120)
+
+            # integer and float corners, tied confidences, thresholds hit exactly by integer offsets
+            junctions = rng.randint(0, 60, (n, 2)).astype('float64') if t % 2 else rng.uniform(0, 256, (n, 2))
+            junc_confs = rng.choice([0.1, 0.5, 0.9], n) if t % 3 == 0 else rng.rand(n)
+            thetas, theta_confs = rng.rand(n, 4), rng.rand(n, 4)
+            nms_thresh = [4.0, 8.0, 5.0, np.sqrt(2)][t % 4]
+            expected = nms_scan(junctions, junc_confs, thetas, theta_confs, nms_thresh=nms_thresh)
+            result = nms(junctions, junc_confs, thetas, theta_confs, nms_thresh=nms_thresh)
+            for a, b in zip(result, expected):
+                np.testing.assert_array_equal(a, b)
+
+    def test_grid_matches_dense(self):
+        rng = np.random.RandomState(1)
+        for _ in range(20):
+            points = rng.randint(0, 100, (rng.randint(1, 400), 2)) + rng.choice([0.0, 0.5], (1, 2))
+            for thresh in (3.0, 5.0, 10.0):
+                self.assertEqual(suppress_points(points, thresh, max_dense=0), suppress_points(points, thresh, max_dense=10**6))
+
+    def test_suppress_points(self):
+        points = np.array([(0, 0), (3, 0), (5, 0), (4, 4), (np.nan, 0), (0, 0)])
+        self.assertEqual(suppress_points(points, 4.0), [0, 2, 3, 4])
+        self.assertEqual(suppress_points(points, 4.0, max_dense=0), [0, 2, 3, 4])
+        self.assertEqual(suppress_points(points, 0.0), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(suppress_points(np.zeros((0, 2)), 4.0), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
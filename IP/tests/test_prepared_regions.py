@@ -0,0 +1,96 @@
+import unittest
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from utils.regions import PreparedRegions, sample_contour
+
+
+def preprocess_regions(regions, filter_size=11):
+    # reference: the per-region loop reconstructBuilding ran before PreparedRegions
+    reg_sm, reg_contour = {}, {}
+    for i, reg in enumerate(regions):
+        reg_small = Image.fromarray(reg*255.0)
+        reg_small = reg_small.filter(ImageFilter.MinFilter(filter_size))
+        reg_small = np.array(reg_small)/255.0
+        if np.argwhere(reg_small > 0).shape[0] > 0:
+            ret, thresh = cv2.threshold(np.array(reg_small*255.0).astype('uint8'), 127, 255, 0)
+            contours, _ = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
+            lg_contour = [None, 0]
+            for c in contours:
+                cont = Image.new('L', (256, 256))
+                dr = ImageDraw.Draw(cont)
+                c = [(x, y) for x, y in c.reshape(-1, 2)]
+                if len(c) <= 2:
+                    continue
+                dr.polygon(c, fill='white')
+                size = (np.array(cont)/255.0).sum()
+                if size > lg_contour[1]:
+                    lg_contour = [c, size]
+            contours = np.array(lg_contour[0])
+            if len(contours.shape) > 0:
+                reg_contour[i] = contours.reshape(-1, 2)
+                reg_sm[i] = reg_small
+    return reg_sm, reg_contour
+
+
+def random_regions(rng, n):
+    # quads, some with holes or split in parts, some too thin to survive erosion
+    regions = []
+    for k in range(n):
+        im = Image.new('L', (256, 256))
+        dr = ImageDraw.Draw(im)
+        for _ in range(rng.randint(1, 4)):
+            x, y = rng.randint(-20, 256, 2)
+            w, h = rng.randint(3, 100, 2)
+            dr.polygon([(x, y), (x+w, y+rng.randint(-10, 10)), (x+w, y+h), (x+rng.randint(-10, 10), y+h)], fill=255)
+        if k % 3 == 0:
+            x, y = rng.randint(0, 256, 2)
+            dr.ellipse((x, y, x+rng.randint(15, 40), y+rng.randint(15, 40)), fill=0)
+        regions.append(np.array(im)/255.0)
+    return np.array(regions)
+
+
+class TestPreparedRegions(unittest.TestCase):
+    def test_matches_per_region_loop(self):
+        rng = np.random.RandomState(0)
+        n_multi = 0
+        for _ in range(10):
+            regions = random_regions(rng, rng.randint(1, 12))
+            reg_sm, reg_contour = preprocess_regions(regions)
+            prep = PreparedRegions(regions)
+            self.assertEqual(prep.reg_list, sorted(reg_contour))
+            for i in prep.reg_list:
+                np.testing.assert_array_equal(prep.reg_sm[i], reg_sm[i])
+                np.testing.assert_array_equal(prep.contours[i], reg_contour[i])
+            for reg_small in reg_sm.values():
+                thresh = ((reg_small*255.0).astype('uint8') > 127).astype('uint8')
+                n_multi += len(cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[0]) > 1
+        self.assertGreater(n_multi, 0)
+
+    def test_eroded_image(self):
+        regions = random_regions(np.random.RandomState(1), 4)
+        for filter_size in (3, 11):
+            prep = PreparedRegions(regions, filter_size)
+            for i, reg in enumerate(regions):
+                expected = Image.fromarray(reg*255.0).filter(ImageFilter.MinFilter(filter_size))
+                im = prep.eroded_image(i)
+                self.assertEqual(im.mode, expected.mode)
+                np.testing.assert_array_equal(np.array(im), np.array(expected))
+
+    def test_contour_points(self):
+        regions = np.zeros((2, 256, 256))
+        regions[0, 50:120, 60:200] = 1.0
+        regions[1, 10:14, 10:14] = 1.0
+        prep = PreparedRegions(regions)
+        self.assertEqual(prep.reg_list, [0])
+        self.assertEqual(prep.sizes[1], 0)
+        for density in (0.5, 1.0):
+            pts = prep.contour_points(0, density)
+            np.testing.assert_array_equal(pts, sample_contour(prep.contours[0], density))
+            self.assertIs(prep.contour_points(0, density), pts)
+        self.assertEqual(prep.contour_points(0, 0.5).shape[0], prep.contours[0].shape[0]//2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.metrics import extract_loops, extract_regions_v2, draw_polygons
+
+# random graphs (delaunay edges, a quarter dropped, crossing and dangling extras, random
+# directions) with the loops and false positives of the edge-scanning extract_regions_v2
+CASES = os.path.join(os.path.dirname(__file__), 'data', 'region_loops_cases.json')
+
+
+class TestRegionLoops(unittest.TestCase):
+    def test_saved_graphs(self):
+        with open(CASES) as f:
+            cases = json.load(f)
+        for case in cases:
+            junctions = np.array(case['junctions'], dtype=case['dtype'])
+            lines_on = np.array(case['lines_on'])
+            _, loops, false_pos = extract_loops(junctions, np.ones(junctions.shape[0]), lines_on)
+            self.assertEqual([[int(k) for k in poly] for poly in loops], case['expected_loops'])
+            self.assertEqual(false_pos, case['expected_false_pos'])
+
+    def test_two_squares(self):
+        # two squares sharing a side and a dangling tail, then crossing edges in the right square
+        junctions = np.array([(50, 50), (50, 100), (100, 100), (100, 50), (150, 50), (150, 100), (160, 120), (170, 130)])
+        lines_on = np.array([(0, 1), (1, 2), (2, 3), (3, 0), (3, 4), (4, 5), (5, 2), (5, 6), (6, 7)])
+        _, loops, false_pos = extract_loops(junctions, np.ones(8), lines_on)
+        self.assertEqual(loops, [[0, 3, 2, 1, 0], [3, 4, 5, 2, 3]])
+        self.assertEqual(false_pos, [])
+        region_mks, _ = extract_regions_v2(junctions, np.ones(8), lines_on)
+        self.assertEqual((region_mks[0][75, 75], region_mks[0][75, 125]), (1, 0))
+        self.assertEqual((region_mks[1][75, 75], region_mks[1][75, 125]), (0, 1))
+
+        lines_on = np.concatenate([lines_on, [(2, 4), (3, 5)]])
+        region_mks, false_pos = extract_regions_v2(junctions, np.ones(8), lines_on)
+        self.assertEqual(len(region_mks), 5)
+        self.assertEqual(false_pos, [1, 2, 3, 4])
+
+    def test_draw_polygons(self):
+        rng = np.random.RandomState(0)
+        junctions = rng.uniform(-20, 276, (30, 2))
+        polys = [list(rng.choice(30, rng.randint(3, 7), replace=False)) for _ in range(20)]
+        polys = [poly + poly[:1] for poly in polys]
+        masks = draw_polygons(junctions, polys)
+        for poly, mask in zip(polys, masks):
+            im = Image.new('L', (256, 256))
+            ImageDraw.Draw(im).polygon([tuple(junctions[k]) for k in poly], fill='white')
+            np.testing.assert_array_equal(mask, np.array(im)/255.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
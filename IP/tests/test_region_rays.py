@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.optimizer import castRay
+from utils.rays import RegionRays
+
+
+def random_building(rng, n_regions):
+    # quads for the regions and random segments between random corners
+    regions = []
+    for _ in range(n_regions):
+        im = Image.new('L', (256, 256))
+        x, y = rng.randint(0, 220, 2)
+        w, h = rng.randint(10, 80, 2)
+        ImageDraw.Draw(im).polygon([(x, y), (x+w, y+rng.randint(-8, 8)), (x+w, y+h), (x+rng.randint(-8, 8), y+h)], fill=255)
+        regions.append(np.array(im)/255.0)
+    junctions = rng.randint(0, 256, (rng.randint(2, 20), 2))
+    ls_list = [tuple(rng.choice(junctions.shape[0], 2, replace=False)) for _ in range(rng.randint(0, 25))]
+    return regions, junctions, ls_list
+
+
+class TestRegionRays(unittest.TestCase):
+    def test_matches_cast_ray(self):
+        rng = np.random.RandomState(0)
+        n_rays = 0
+        for _ in range(30):
+            regions, junctions, ls_list = random_building(rng, rng.randint(1, 5))
+            for i, region in enumerate(regions):
+                others = [reg for j, reg in enumerate(regions) if j != i]
+
+                # points inside, along the border and around the region, any direction
+                inds = np.argwhere(region > 0)[:, ::-1]
+                pts = list(inds[rng.randint(0, inds.shape[0], 15)]) + list(rng.randint(-5, 260, (10, 2)))
+                ths = list(rng.uniform(0, 360, len(pts)))
+                rays = RegionRays(region, others, ls_list, junctions, ray_length=1000.0)
+                for pt, th, result in zip(pts, ths, rays.cast(pts, ths)):
+                    expected = castRay(pt, th, ls_list, junctions, None, region, others, ray_length=1000.0)
+                    self.assertEqual(result, expected)
+                    n_rays += 1
+        self.assertGreater(n_rays, 1000)
+
+    def test_no_segments_or_other_regions(self):
+        region = np.zeros((256, 256))
+        region[100:150, 100:150] = 1.0
+        rays = RegionRays(region, [], [], np.zeros((0, 2)))
+        self.assertEqual(rays.cast([], []), [])
+        pts, ths = [(99, 120), (125, 125)], [180.0, 0.0]
+        for pt, th, result in zip(pts, ths, rays.cast(pts, ths)):
+            self.assertEqual(result, castRay(pt, th, [], np.zeros((0, 2)), None, region, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import os
+import unittest
+
+import numpy as np
+from utils.optimizer import remove_junctions, getAngle
+
+# post-processor inputs recorded from reconstructBuilding(post_process=True) runs on polygons
+# with extra corners along their sides, and the output of remove_junctions_scan on them
+CASES = os.path.join(os.path.dirname(__file__), 'data', 'remove_junctions_cases.json')
+
+
+def remove_junctions_scan(junctions, juncs_on, lines_on, delta=10.0):
+    # reference: the scan remove_junctions replaced
+    curr_juncs_on, curr_lines_on = list(juncs_on), list(lines_on)
+    while True:
+        new_lines_on, new_juncs_on = [], []
+        is_mod = False
+        for j1 in curr_juncs_on:
+            adj_js, adj_as, ls = [], [], []
+            for j2 in curr_juncs_on:
+                if ((j1, j2) in curr_lines_on) or ((j2, j1) in curr_lines_on):
+                    adj_js.append(j2)
+                    pt1 = junctions[j1]
+                    pt2 = junctions[j2]
+                    adj_as.append(getAngle(pt1, pt2))
+                    ls.append((j1, j2))
+
+            if len(adj_js) > 2 or is_mod or len(adj_js) == 1:
+                new_juncs_on.append(j1)
+                new_lines_on += ls
+            elif len(adj_js) == 2:
+                diff = np.abs(180.0-np.abs(adj_as[0]-adj_as[1]))
+                if diff >= delta:
+                    new_juncs_on.append(j1)
+                    new_lines_on += ls
+                else:
+                    new_lines_on.append((adj_js[0], adj_js[1]))
+                    is_mod = True
+        curr_juncs_on, curr_lines_on = list(new_juncs_on), list(new_lines_on)
+        if not is_mod:
+            break
+
+    # clean repeated edges
+    clean_lines_on = []
+    for j1, j2 in curr_lines_on:
+        in_list = False
+        for j3, j4 in clean_lines_on:
+            if (j1 == j3 and j2 == j4) or (j1 == j4 and j2 == j3):
+                  in_list = True
+        if not in_list:
+            clean_lines_on.append((j1, j2))
+
+    return curr_juncs_on, clean_lines_on
+
+
+class TestRemoveJunctions(unittest.TestCase):
+    def test_saved_solver_outputs(self):
+        with open(CASES) as f:
+            cases = json.load(f)
+        for case in cases:
+            junctions = np.array(case['junctions'])
+            juncs_on, lines_on = remove_junctions(junctions, case['juncs_on'], [tuple(e) for e in case['lines_on']])
+            self.assertEqual(juncs_on, case['expected_juncs_on'])
+            self.assertEqual(lines_on, [tuple(e) for e in case['expected_lines_on']])
+
+    def test_random_graphs(self):
+        rng = np.random.RandomState(0)
+        for _ in range(200):
+            n = rng.randint(1, 30)
+            junctions = rng.uniform(0, 256, (n, 2))
+
+            # chains with every other point nearly halfway between its neighbours,
+            # plus random edges, in both directions
+            for k in range(1, n-1, 2):
+                junctions[k] = (junctions[k-1]+junctions[k+1])/2.0 + rng.normal(0, 1.0, 2)
+            lines_on = [(k, k+1) for k in range(n-1) if rng.rand() < 0.8]
+            lines_on += [tuple(rng.choice(n, 2, replace=False)) for _ in range(rng.randint(0, n))]
+            lines_on = [(l, k) if rng.rand() < 0.3 else (k, l) for k, l in lines_on]
+            juncs_on = np.array(list(set(sum(lines_on, ())))) if rng.rand() < 0.5 else list(rng.permutation(n))
+            for delta in (10.0, 30.0):
+                expected = remove_junctions_scan(junctions, juncs_on, lines_on, delta=delta)
+                result = remove_junctions(junctions, juncs_on, lines_on, delta=delta)
+                self.assertEqual(list(result[0]), list(expected[0]))
+                self.assertEqual(result[1], expected[1])
+
+    def test_collapse_chain(self):
+        # a square with one extra point per side collapses to its 4 corners
+        junctions = np.array([(0, 0), (50, 0), (100, 0), (100, 50), (100, 100), (50, 100), (0, 100), (0, 50)])
+        lines_on = [(k, (k+1) % 8) for k in range(8)]
+        juncs_on, lines_on = remove_junctions(junctions, list(range(8)), lines_on)
+        self.assertEqual(juncs_on, [0, 2, 4, 6])
+        self.assertEqual(sorted(tuple(sorted(e)) for e in lines_on), [(0, 2), (0, 6), (2, 4), (4, 6)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.optimizer import reconstructBuilding
+from utils.solvers import gurobipy, pulp
+
+
+def two_rooms():
+    # two boxes sharing a wall, with a stray corner and both regions
+    junctions = np.array([(40, 40), (100, 40), (160, 40), (160, 120), (100, 120), (40, 120), (200, 200)])
+    edges = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 0), (1, 4)]
+    im = Image.new('L', (256, 256))
+    dr = ImageDraw.Draw(im)
+    for k, l in edges:
+        dr.line(tuple(junctions[k])+tuple(junctions[l]), fill=255, width=3)
+    regions = []
+    for poly in [(0, 1, 4, 5), (1, 2, 3, 4)]:
+        reg = Image.new('L', (256, 256))
+        ImageDraw.Draw(reg).polygon([tuple(junctions[j]) for j in poly], fill=255)
+        regions.append(np.array(reg)/255.0)
+    return junctions, np.array(im)/255.0, np.array(regions)
+
+config = dict(use_regions=True, closed_region_constraint=True, with_corner_variables=True, corner_min_degree_constraint=True, \
+    with_edge_confidence=True, edge_threshold=0.3, intersection_constraint=True, region_intersection_constraint=True, \
+    region_hit_threshold=0.1, post_process=False, contour_density=0.1)
+
+
+class TestSolutionDecoding(unittest.TestCase):
+    def check_names(self, solver):
+        junctions, edge_map, regions = two_rooms()
+        outputs = []
+        for with_names in (False, True):
+            out = reconstructBuilding(junctions, edge_map, regions=regions, solver=solver, with_names=with_names, **config)
+            outputs.append((list(out[1]), out[2], [np.array(m) for m in out[3]]))
+        (juncs, lines, regs), (juncs_named, lines_named, regs_named) = outputs
+        self.assertEqual(juncs, juncs_named)
+        self.assertEqual(lines, lines_named)
+        self.assertEqual(len(regs), len(regs_named))
+        for a, b in zip(regs, regs_named):
+            np.testing.assert_array_equal(a, b)
+
+        # the box outline and the shared wall, in creation order, with both regions on
+        self.assertEqual(juncs, [0, 1, 2, 3, 4, 5])
+        self.assertEqual(lines, [(0, 1), (0, 5), (1, 2), (1, 4), (2, 3), (3, 4), (4, 5)])
+        self.assertEqual(len(regs), 2)
+
+    @unittest.skipIf(pulp is None, 'pulp is not installed')
+    def test_pulp(self):
+        self.check_names('highs')
+
+    @unittest.skipIf(gurobipy is None, 'gurobipy is not installed')
+    def test_gurobi(self):
+        self.check_names('gurobi')
+
+        # names only when asked for
+        junctions, edge_map, regions = two_rooms()
+        for with_names in (False, True):
+            model = {}
+            reconstructBuilding(junctions, edge_map, regions=regions, with_names=with_names, keep_model=model, **config)
+            names = set(v.VarName for v in model['m'].m.getVars())
+            self.assertEqual('line_0_1' in names and 'reg_0' in names, with_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.optimizer import reconstructBuilding, resolveBuilding, reconstructBuildingWithBudget, PhaseTimer
+from utils.solvers import pulp
+
+
+def square_building():
+    # a square with its edges in the edge map and one region inside
+    junctions = np.array([(60, 60), (160, 60), (160, 160), (60, 160)])
+    im = Image.new('L', (256, 256))
+    ImageDraw.Draw(im).polygon([tuple(j) for j in junctions], outline=255)
+    reg = Image.new('L', (256, 256))
+    ImageDraw.Draw(reg).polygon([tuple(j) for j in junctions], fill=255)
+    return junctions, np.array(im)/255.0, np.array([np.array(reg)/255.0])
+
+
+@unittest.skipIf(pulp is None, 'pulp is not installed')
+class TestSolverStats(unittest.TestCase):
+    def test_record(self):
+        junctions, edge_map, regions = square_building()
+        stats = {}
+        reconstructBuilding(junctions, edge_map, regions=regions, use_regions=True, closed_region_constraint=True, \
+            with_edge_confidence=True, edge_threshold=0.1, intersection_constraint=True, solver='highs', stats=stats, _id='sq')
+        self.assertEqual(stats['_id'], 'sq')
+        self.assertEqual(stats['solver'], 'highs')
+        self.assertEqual(stats['status'], 'optimal')
+        self.assertEqual((stats['num_junctions'], stats['num_regions'], stats['num_candidate_edges']), (4, 1, 6))
+        for phase in PhaseTimer.phases:
+            self.assertGreaterEqual(stats['time_{}'.format(phase)], 0.0)
+        self.assertGreater(stats['time_closed_region_rays'], 0.0)
+        self.assertEqual(stats['time_shared_edges'], 0.0)
+        self.assertAlmostEqual(stats['time_total'], sum(stats['time_{}'.format(phase)] for phase in PhaseTimer.phases))
+
+    def test_resolve_record(self):
+        junctions, edge_map, regions = square_building()
+        model, stats = {}, {}
+        reconstructBuilding(junctions, edge_map, with_edge_confidence=True, edge_threshold=0.1, solver='highs', keep_model=model)
+        resolveBuilding(model, stats=stats, edge_map_weight=2.0)
+        self.assertEqual(stats['status'], 'optimal')
+        self.assertGreater(stats['time_optimize'], 0.0)
+        self.assertEqual(stats['time_corner_to_edge'], 0.0)
+
+
+@unittest.skipIf(pulp is None, 'pulp is not installed')
+class TestTimeBudget(unittest.TestCase):
+    config = dict(use_regions=True, closed_region_constraint=True, with_edge_confidence=True, edge_threshold=0.1, \
+        intersection_constraint=True, solver='highs')
+
+    def test_within_budget(self):
+        junctions, edge_map, regions = square_building()
+        expected = reconstructBuilding(junctions, edge_map, regions=regions, **self.config)
+        stats = {}
+        result = reconstructBuildingWithBudget(junctions, edge_map, 60.0, regions=regions, stats=stats, **self.config)
+        self.assertEqual(result[2], expected[2])
+        self.assertEqual((stats['fallback_tier'], stats['tiers']), ('full', 'full:optimal'))
+        self.assertLessEqual(stats['time_limit'], 60.0)
+        self.assertFalse(stats['time_limit_reached'])
+
+    def test_fallback(self):
+        # the full tier gets no solver time and ends without a solution, the next tier is used
+        junctions, edge_map, regions = square_building()
+        for solver in ('highs', 'cbc'):
+            stats = {}
+            result = reconstructBuildingWithBudget(junctions, edge_map, 30.0, fallback_share=1.0, regions=regions, stats=stats, \
+                **dict(self.config, solver=solver))
+            self.assertEqual(stats['tiers'].split(',')[0].split(':')[0], 'full')
+            self.assertEqual(stats['fallback_tier'], 'no_closed_region')
+            self.assertEqual((stats['sol_count'], len(result[2]), len(result[3])), (1, 4, 1))
+
+    def test_baseline_without_regions(self):
+        # no other tier changes this model, the baseline drops the region variables
+        junctions, edge_map, regions = square_building()
+        config = dict(use_regions=True, region_intersection_constraint=True, region_hit_threshold=0.1, \
+            with_edge_confidence=True, edge_threshold=0.1, solver='highs')
+        stats = {}
+        result = reconstructBuildingWithBudget(junctions, edge_map, 30.0, fallback_share=1.0, regions=regions, stats=stats, **config)
+        self.assertEqual(stats['fallback_tier'], 'baseline')
+        self.assertEqual((stats['num_regions'], len(result), result[3]), (0, 4, []))
+
+    def test_budget_spent(self):
+        # nothing is left for the fallback tiers
+        junctions, edge_map, regions = square_building()
+        stats = {}
+        result = reconstructBuildingWithBudget(junctions, edge_map, 0.0, regions=regions, stats=stats, **self.config)
+        self.assertEqual((stats['fallback_tier'], stats['tiers']), ('empty', 'full:not_solved'))
+        self.assertEqual((len(result[1]), result[2], result[3]), (0, [], []))
+
+if __name__ == "__main__":
+    unittest.main()
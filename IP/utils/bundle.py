@@ -0,0 +1,108 @@
+import struct
+import zipfile
+import numpy as np
+
+BUNDLE_VERSION = 1
+
+def save_bundle(fname, _id, cs, cs_c, th, th_c, edge_map, region_mks, shared_edges, reindex, graph_annot):
+    """Write the preprocessed inputs of one building to an uncompressed .npz, shared edges reindexed as in filter_regions."""
+
+    # ragged per-corner angles
+    th_offsets = np.cumsum([0] + [len(x) for x in th])
+    th_flat = np.concatenate([np.asarray(x, dtype='float64').ravel() for x in th] + [np.zeros(0)])
+    th_c_flat = np.concatenate([np.asarray(x, dtype='float64').ravel() for x in th_c] + [np.zeros(0)])
+
+    # binary regions are packed as uint8 and cast back on load
+    region_mks = np.asarray(region_mks)
+    regions_dtype = region_mks.dtype.str
+    if region_mks.size > 0 and np.all((region_mks == 0) | (region_mks == 1)):
+        region_mks = region_mks.astype('uint8')
+
+    # one copy of every mask, both key sets point into it
+    keys, new_keys, masks = [], [], []
+    for (_, i, j), ms in sorted(shared_edges.items()):
+        for m in ms:
+            keys.append((i, j))
+            new_keys.append(reindex.get((i, j), (-1, -1)))
+            masks.append(np.asarray(m))
+    masks = np.stack(masks) if len(masks) > 0 else np.zeros((0, 256, 256), dtype='uint8')
+
+    # annotation graph as corners + neighbour coordinates, in dict order
+    annot_corners = np.array([list(v) for v in graph_annot]).reshape(-1, 2)
+    annot_offsets = np.cumsum([0] + [len(graph_annot[v]) for v in graph_annot])
+    annot_nbrs = np.array([list(u) for v in graph_annot for u in graph_annot[v]]).reshape(-1, 2)
+
+    np.savez(fname, version=np.array(BUNDLE_VERSION), _id=np.array(_id),
+             cs=np.asarray(cs), cs_c=np.asarray(cs_c),
+             th=th_flat, th_c=th_c_flat, th_offsets=th_offsets,
+             edge_map=np.asarray(edge_map, dtype='uint8'),
+             region_mks=region_mks, regions_dtype=np.array(regions_dtype),
+             shared_keys=np.array(keys, dtype='int64').reshape(-1, 2),
+             shared_keys_reindexed=np.array(new_keys, dtype='int64').reshape(-1, 2),
+             shared_masks=masks,
+             annot_corners=annot_corners, annot_offsets=annot_offsets, annot_nbrs=annot_nbrs)
+
+def _load_npz_mmap(fname, mmap_mode='c'):
+
+    # members of an uncompressed npz are plain .npy files at a fixed offset
+    arrays = {}
+    with zipfile.ZipFile(fname) as zf, open(fname, 'rb') as f:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[name] = np.load(zf.open(info))
+                continue
+            f.seek(info.header_offset)
+            header = struct.unpack('<4s2B4HL2L2H', f.read(30))
+            f.seek(info.header_offset + 30 + header[10] + header[11])
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or int(np.prod(shape)) == 0:
+                f.seek(info.header_offset + 30 + header[10] + header[11])
+                arrays[name] = np.lib.format.read_array(f)
+            else:
+                arrays[name] = np.memmap(fname, dtype=dtype, mode=mmap_mode, offset=f.tell(), \
+                    shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+def open_bundle(fname, mmap_mode='c'):
+    """Open a bundle written by save_bundle, large arrays are memory-mapped unless mmap_mode=None."""
+    if mmap_mode is None:
+        with np.load(fname) as f:
+            arrays = dict(f.items())
+    else:
+        arrays = _load_npz_mmap(fname, mmap_mode)
+    if int(arrays['version']) != BUNDLE_VERSION:
+        raise ValueError('bundle {} has version {}, expected {}'.format(fname, int(arrays['version']), BUNDLE_VERSION))
+    _id = str(arrays['_id'])
+
+    # ragged angles back to one array per corner
+    offsets = arrays['th_offsets']
+    th = np.empty(len(offsets)-1, dtype=object)
+    th_c = np.empty(len(offsets)-1, dtype=object)
+    for k in range(len(offsets)-1):
+        th[k] = np.array(arrays['th'][offsets[k]:offsets[k+1]])
+        th_c[k] = np.array(arrays['th_c'][offsets[k]:offsets[k+1]])
+
+    # shared edges, raw and reindexed keys
+    shared_edges, shared_edges_per_id = {}, {}
+    masks = arrays['shared_masks']
+    for (i, j), (new_i, new_j), m in zip(arrays['shared_keys'], arrays['shared_keys_reindexed'], masks):
+        shared_edges.setdefault((_id, int(i), int(j)), []).append(m)
+        if new_i >= 0:
+            shared_edges_per_id.setdefault((_id, int(new_i), int(new_j)), []).append(m)
+
+    # annotation graph
+    graph_annot = {}
+    offsets = arrays['annot_offsets']
+    for k, v in enumerate(arrays['annot_corners']):
+        graph_annot[tuple(v)] = [tuple(u) for u in arrays['annot_nbrs'][offsets[k]:offsets[k+1]]]
+
+    return {'_id': _id, 'cs': arrays['cs'], 'cs_c': arrays['cs_c'], 'th': th, 'th_c': th_c,
+            'edge_map': arrays['edge_map']/255.0,
+            'region_mks': arrays['region_mks'].astype(str(arrays['regions_dtype']), copy=False),
+            'shared_edges': shared_edges, 'shared_edges_per_id': shared_edges_per_id,
+            'graph_annot': graph_annot}
@@ -93,6 +93,113 @@ def doIntersect(p1, q1, p2, q2):
     # do not share any endpoint
     return helperDoIntersect(p1, q1, p2, q2)
 
+def _orientations(p, q, r):
+    val = (q[:, 1] - p[:, 1]) * (r[:, 0] - q[:, 0]) - (q[:, 0] - p[:, 0]) * (r[:, 1] - q[:, 1])
+    return np.where(val == 0, 0, np.where(val > 0, 1, 2))
+
+def _on_segments(p, q, r):
+    return (q[:, 0] <= np.maximum(p[:, 0], r[:, 0])) & (q[:, 0] >= np.minimum(p[:, 0], r[:, 0])) & \
+        (q[:, 1] <= np.maximum(p[:, 1], r[:, 1])) & (q[:, 1] >= np.minimum(p[:, 1], r[:, 1]))
+
+def doIntersectBatch(p1, q1, p2, q2):
+
+    # vectorized doIntersect over rows of (N, 2) arrays, any row may be broadcast
+    p1, q1, p2, q2 = np.broadcast_arrays(*[np.atleast_2d(np.array(x, dtype='float64')) for x in (p1, q1, p2, q2)])
+    p1, q1, p2, q2 = p1.copy(), q1.copy(), p2.copy(), q2.copy()
+
+    # same line segment - intersect
+    eq_p1p2 = np.all(p1 == p2, -1)
+    eq_p1q2 = np.all(p1 == q2, -1)
+    eq_q1p2 = np.all(q1 == p2, -1)
+    eq_q1q2 = np.all(q1 == q2, -1)
+    same = (eq_p1p2 & eq_q1q2) | (eq_p1q2 & eq_q1p2)
+
+    # line segment shares only one of the endpoints - same precedence as doIntersect
+    s1 = eq_p1p2 & ~same
+    s2 = eq_p1q2 & ~same & ~s1
+    s3 = eq_q1p2 & ~same & ~s1 & ~s2
+    s4 = eq_q1q2 & ~same & ~s1 & ~s2 & ~s3
+    np1 = scale_dimension(p1, q1, .999)
+    nq1 = scale_dimension(q1, p1, .999)
+    np2 = scale_dimension(p2, q2, .999)
+    nq2 = scale_dimension(q2, p2, .999)
+    shrink_p1, shrink_q1 = s1 | s2, s3 | s4
+    shrink_p2, shrink_q2 = s1 | s3, s2 | s4
+    p1[shrink_p1], q1[shrink_q1] = np1[shrink_p1], nq1[shrink_q1]
+    p2[shrink_p2], q2[shrink_q2] = np2[shrink_p2], nq2[shrink_q2]
+
+    # orientations as in helperDoIntersect
+    o1 = _orientations(p1, q1, p2)
+    o2 = _orientations(p1, q1, q2)
+    o3 = _orientations(p2, q2, p1)
+    o4 = _orientations(p2, q2, q1)
+    hit = (o1 != o2) & (o3 != o4)
+    hit |= (o1 == 0) & _on_segments(p1, p2, q1)
+    hit |= (o2 == 0) & _on_segments(p1, q2, q1)
+    hit |= (o3 == 0) & _on_segments(p2, p1, q2)
+    hit |= (o4 == 0) & _on_segments(p2, q1, q2)
+    return same | hit
+
+class SegmentIndex():
+    """Bounding-box index over a fixed set of segments, query() tests one segment and pairs() every intersecting pair."""
+    def __init__(self, ps, qs, chunk_size=1000000):
+        self.ps = np.array(ps, dtype='float64').reshape(-1, 2)
+        self.qs = np.array(qs, dtype='float64').reshape(-1, 2)
+        self.mins = np.minimum(self.ps, self.qs)
+        self.maxs = np.maximum(self.ps, self.qs)
+        self.chunk_size = chunk_size
+
+        # sweep order along x
+        self.order = np.argsort(self.mins[:, 0], kind='stable')
+        self.sorted_xmin = self.mins[self.order, 0]
+
+    def __len__(self):
+        return self.ps.shape[0]
+
+    def query(self, p, q):
+
+        # indices (ascending) of segments intersecting pq
+        p, q = np.array(p, dtype='float64'), np.array(q, dtype='float64')
+        lo, hi = np.minimum(p, q), np.maximum(p, q)
+        cands = np.where(np.all(self.mins <= hi, -1) & np.all(self.maxs >= lo, -1))[0]
+        if cands.shape[0] == 0:
+            return cands
+        hit = doIntersectBatch(p[np.newaxis, :], q[np.newaxis, :], self.ps[cands], self.qs[cands])
+        return cands[hit]
+
+    def pairs(self):
+
+        # all intersecting pairs (i, j), i < j, in lexicographic order
+        n = len(self)
+        if n < 2:
+            return np.zeros((0, 2), dtype='int64')
+
+        # sweep: j overlaps i in x iff xmin_j in [xmin_i, xmax_i]
+        ends = np.searchsorted(self.sorted_xmin, self.maxs[self.order, 0], side='right')
+        counts = np.maximum(ends - np.arange(n) - 1, 0)
+        found = []
+        start = 0
+        while start < n:
+            stop = start + 1
+            budget = counts[start]
+            while stop < n and budget + counts[stop] <= self.chunk_size:
+                budget += counts[stop]
+                stop += 1
+            rank_i = np.repeat(np.arange(start, stop), counts[start:stop])
+            offsets = np.arange(rank_i.shape[0]) - np.repeat(np.cumsum(counts[start:stop]) - counts[start:stop], counts[start:stop])
+            rank_j = rank_i + 1 + offsets
+            i, j = self.order[rank_i], self.order[rank_j]
+
+            # overlap in y
+            keep = (self.mins[i, 1] <= self.maxs[j, 1]) & (self.mins[j, 1] <= self.maxs[i, 1])
+            i, j = np.minimum(i[keep], j[keep]), np.maximum(i[keep], j[keep])
+            hit = doIntersectBatch(self.ps[i], self.qs[i], self.ps[j], self.qs[j])
+            found.append(np.stack([i[hit], j[hit]], -1))
+            start = stop
+
+        found = np.concatenate(found, 0)
+        return found[np.lexsort((found[:, 1], found[:, 0]))]
+
 if __name__ == '__main__':
 
     p1 = (-10, -10)
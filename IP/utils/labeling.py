@@ -0,0 +1,21 @@
+import cv2
+import numpy as np
+
+def fill_regions(edge_mask):
+    """Tag the 4-connected areas of zeros in edge_mask 2, 3, ... in scan order, as the flood fill did."""
+    edge_mask = np.array(edge_mask)
+    n, labels = cv2.connectedComponents((edge_mask == 0).astype('uint8'), connectivity=4)
+    if n <= 1:
+        return edge_mask
+
+    # relabel by first pixel in raster order, whatever order the labeling used
+    labels = labels.ravel()
+    first = np.zeros(n, dtype='int64')
+    ids, inds = np.unique(labels, return_index=True)
+    first[ids] = inds
+    tags = np.zeros(n, dtype='int64')
+    tags[1+np.argsort(first[1:])] = 2+np.arange(n-1)
+    filled = edge_mask.ravel()
+    inds = np.where(labels > 0)[0]
+    filled[inds] = tags[labels[inds]]
+    return filled.reshape(edge_mask.shape)
@@ -0,0 +1,96 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+# set bits of every byte value
+POPCOUNT = np.array([bin(v).count('1') for v in range(256)], dtype='int64')
+
+def polygon_crops(junctions, polys, imsize=256):
+    """Fill every polygon as ImageDraw.polygon on an imsize image, yields (y0, x0, crop) around each."""
+    canvas = Image.new('L', (imsize, imsize))
+    dr = ImageDraw.Draw(canvas)
+    for poly in polys:
+        poly_coords = [tuple(junctions[x]) for x in poly]
+        dr.polygon(poly_coords, fill='white')
+        xs, ys = [x for x, y in poly_coords], [y for x, y in poly_coords]
+        x0, y0 = max(int(np.floor(min(xs)))-2, 0), max(int(np.floor(min(ys)))-2, 0)
+        x1, y1 = min(int(np.ceil(max(xs)))+3, imsize), min(int(np.ceil(max(ys)))+3, imsize)
+        if x0 >= x1 or y0 >= y1:
+            yield 0, 0, np.zeros((0, 0), dtype='uint8')
+            continue
+        box = (x0, y0, x1, y1)
+        yield y0, x0, np.array(canvas.crop(box))
+        canvas.paste(0, box)
+
+class PackedRegions():
+    """Binary region masks as bit-packed rows with bounding boxes."""
+
+    def __init__(self, shape=(256, 256)):
+        self.shape = tuple(shape)
+        self.bits = []
+        self.boxes = [] # y0, x0, y1, x1 (exclusive), zeros for an empty mask
+        self.areas = []
+
+    def __len__(self):
+        return len(self.bits)
+
+    def add(self, mask):
+        mask = np.asarray(mask) != 0
+        rows, cols = np.flatnonzero(mask.any(1)), np.flatnonzero(mask.any(0))
+        if rows.shape[0] == 0:
+            self.boxes.append((0, 0, 0, 0))
+        else:
+            self.boxes.append((rows[0], cols[0], rows[-1]+1, cols[-1]+1))
+        self.bits.append(np.packbits(mask, axis=-1))
+        self.areas.append(int(np.count_nonzero(mask)))
+
+    @classmethod
+    def from_masks(cls, masks, shape=(256, 256)):
+        regions = cls(shape)
+        for mask in masks:
+            regions.add(mask)
+        return regions
+
+    @classmethod
+    def from_polygons(cls, junctions, polys, imsize=256):
+        """Regions of the polygons filled as in draw_polygons (metrics.py)."""
+        regions = cls((imsize, imsize))
+        mask = np.zeros((imsize, imsize), dtype='bool')
+        for y0, x0, crop in polygon_crops(junctions, polys, imsize):
+            h, w = crop.shape
+            mask[y0:y0+h, x0:x0+w] = crop > 0
+            regions.add(mask)
+            mask[y0:y0+h, x0:x0+w] = False
+        return regions
+
+    def masks(self):
+        """Unpacked boolean masks, (n, h, w)."""
+        if len(self) == 0:
+            return np.zeros((0,)+self.shape, dtype='bool')
+        return np.unpackbits(np.array(self.bits), axis=-1, count=self.shape[1]).astype('bool')
+
+    def _overlaps(self, other):
+
+        # pairs whose bounding boxes intersect, with the row and byte ranges to compare
+        a, b = np.array(self.boxes).reshape(-1, 4), np.array(other.boxes).reshape(-1, 4)
+        y0 = np.maximum(a[:, np.newaxis, 0], b[np.newaxis, :, 0])
+        x0 = np.maximum(a[:, np.newaxis, 1], b[np.newaxis, :, 1])
+        y1 = np.minimum(a[:, np.newaxis, 2], b[np.newaxis, :, 2])
+        x1 = np.minimum(a[:, np.newaxis, 3], b[np.newaxis, :, 3])
+        for i, k in zip(*np.nonzero((y0 < y1) & (x0 < x1))):
+            yield i, k, slice(y0[i, k], y1[i, k]), slice(x0[i, k]//8, (x1[i, k]+7)//8)
+
+    def intersects(self, other):
+        """Whether every region shares a pixel with every region of other, (len(self), len(other))."""
+        touching = np.zeros((len(self), len(other)), dtype='bool')
+        for i, k, rs, cs in self._overlaps(other):
+            touching[i, k] = np.any(self.bits[i][rs, cs] & other.bits[k][rs, cs])
+        return touching
+
+    def iou(self, other):
+        """Pixel IoU of every region against every region of other, (len(self), len(other))."""
+        ious = np.zeros((len(self), len(other)))
+        for i, k, rs, cs in self._overlaps(other):
+            inter = POPCOUNT[self.bits[i][rs, cs] & other.bits[k][rs, cs]].sum()
+            if inter > 0:
+                ious[i, k] = inter/float(self.areas[i]+other.areas[k]-inter)
+        return ious
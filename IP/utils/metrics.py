@@ -1,9 +1,19 @@
+import os
+import csv
+import bisect
 import numpy as np
 from collections import OrderedDict
 import matplotlib.pyplot as plt
 from PIL import Image, ImageDraw
 from collections import defaultdict
-from utils.intersections import doIntersect
+from utils.intersections import doIntersect, SegmentIndex
+from utils.labeling import fill_regions
+from utils.loop_iou import PackedRegions, polygon_crops
+from utils.nms import point_dists
+
+# per-building counts kept by Metrics, columns of the exported records
+SAMPLE_COLUMNS = ['corner_tp', 'corner_fp', 'corner_n', 'edge_tp', 'edge_fp', 'edge_n',
+                  'loop_tp', 'loop_fp', 'loop_n', 'loop_v2_tp', 'loop_v2_fp', 'loop_v2_n']
 
 
 class Metrics(): 
@@ -33,6 +43,9 @@ class Metrics():
         self.n_loop_samples_v2 = 0.0
         self.per_loop_sample_score_v2 = {}
 
+        # per-building counts, in SAMPLE_COLUMNS order
+        self.sample_counts = OrderedDict()
+
     def calc_corner_metrics(self):
         recall = self.curr_corner_tp/(self.n_corner_samples+1e-8)
         precision = self.curr_corner_tp/(self.curr_corner_tp+self.curr_corner_fp+1e-8)
@@ -105,12 +118,91 @@ class Metrics():
         self.curr_loop_fp_v2 = 0.0
         self.n_loop_samples_v2 = 0.0
         self.per_loop_sample_score_v2 = {}
+        self.sample_counts = OrderedDict()
+        return
+
+    def add_sample(self, _id, counts):
+
+        # accumulate the counts of one building, in SAMPLE_COLUMNS order
+        corner_tp, corner_fp, corner_n, edge_tp, edge_fp, edge_n, loop_tp, loop_fp, loop_n, loop_tp_v2, loop_fp_v2, loop_n_v2 = counts
+        self.sample_counts[_id] = [float(x) for x in counts]
+
+        # corners
+        self.curr_corner_tp += corner_tp
+        self.curr_corner_fp += corner_fp
+        self.n_corner_samples += corner_n
+        self.per_corner_sample_score.update({_id: {'recall': corner_tp/corner_n, 'precision': corner_tp/(corner_tp+corner_fp+1e-8)}})
+
+        # edges
+        self.curr_edge_tp += edge_tp
+        self.curr_edge_fp += edge_fp
+        self.n_edge_samples += edge_n
+        self.per_edge_sample_score.update({_id: {'recall': edge_tp/edge_n, 'precision': edge_tp/(edge_tp+edge_fp+1e-8)}})
+
+        # loops
+        self.curr_loop_tp += loop_tp
+        self.curr_loop_fp += loop_fp
+        self.n_loop_samples += loop_n
+        self.per_loop_sample_score.update({_id: {'recall': loop_tp/loop_n, 'precision': loop_tp/(loop_tp+loop_fp+1e-8)}})
+
+        # loops_v2
+        self.curr_loop_tp_v2 += loop_tp_v2
+        self.curr_loop_fp_v2 += loop_fp_v2
+        self.n_loop_samples_v2 += loop_n_v2
+        self.per_loop_sample_score_v2.update({_id: {'recall': loop_tp_v2/loop_n_v2, 'precision': loop_tp_v2/(loop_tp_v2+loop_fp_v2+1e-8)}})
+        return
+
+    def save_samples(self, fname, append=False):
+        """Write the per-building counts to fname, .csv (one row per building) or .npz."""
+        if fname.endswith('.npz'):
+            np.savez(fname, ids=np.array(list(self.sample_counts.keys()), dtype='str'), columns=np.array(SAMPLE_COLUMNS),
+                     counts=np.array(list(self.sample_counts.values()), dtype='float64').reshape(-1, len(SAMPLE_COLUMNS)))
+            return
+        write_header = not (append and os.path.exists(fname) and os.path.getsize(fname) > 0)
+        with open(fname, 'a' if append else 'w', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(['_id'] + SAMPLE_COLUMNS)
+            for _id, counts in self.sample_counts.items():
+                writer.writerow([_id] + [repr(x) for x in counts])
         return
 
+    @classmethod
+    def load_samples(cls, fnames, order=None):
+        """Metrics recomputed from save_samples files, the last record of every building is kept."""
+        if isinstance(fnames, str):
+            fnames = [fnames]
+        samples = dict()
+        for fname in fnames:
+            if fname.endswith('.npz'):
+                with np.load(fname) as f:
+                    assert list(f['columns']) == SAMPLE_COLUMNS, 'unknown columns in {}'.format(fname)
+                    for _id, counts in zip(f['ids'], f['counts']):
+                        samples[str(_id)] = [float(x) for x in counts]
+            else:
+                with open(fname, newline='') as f:
+                    reader = csv.reader(f)
+                    header = next(reader, None)
+                    if header is None:
+                        continue
+                    assert header == ['_id'] + SAMPLE_COLUMNS, 'unknown columns in {}'.format(fname)
+                    for row in reader:
+                        samples[row[0]] = [float(x) for x in row[1:]]
+
+        # ids missing from order go last, by id
+        rank = dict((_id, k) for k, _id in enumerate(order or []))
+        metrics = cls()
+        for _id in sorted(samples, key=lambda _id: (rank.get(_id, len(rank)), _id)):
+            metrics.add_sample(_id, samples[_id])
+        return metrics
+
     def forward(self, graph_gt, junctions, juncs_on, lines_on, _id, thresh=8.0, iou_thresh=0.7):
 
+        # ground truth corners, edges and regions, computed once per building
+        annot = get_annot(graph_gt, _id)
+
         ## Compute corners precision/recall
-        gts = np.array([list(x) for x in graph_gt])
+        gts = annot['corners']
 
         if len(juncs_on) > 0:
             dets = np.array(junctions)[juncs_on]
@@ -122,95 +214,75 @@ class Metrics():
         found = [False] * gts.shape[0]
         c_det_annot = {}
 
-        # for each corner detection
-        for i, det in enumerate(dets):
-
-            # get closest gt
-            near_gt = [0, 9999999.0, (0.0, 0.0)]
-            for k, gt in enumerate(gts):
-                dist = np.linalg.norm(gt-det)
-                if dist < near_gt[1]:
-                    near_gt = [k, dist, gt] 
+        # closest gt of every detection, first one on ties; distances within rounding of
+        # thresh or of the closest one are recomputed pair by pair, as np.linalg.norm(gt-det)
+        near_gts, near_dists = [], []
+        if dets.shape[0] > 0 and gts.shape[0] > 0:
+            diffs = gts[np.newaxis, :, :]-dets[:, np.newaxis, :]
+            dists = point_dists(diffs, thresh)
+            near_dists = dists.min(-1)
+            for i in np.flatnonzero(np.sum(dists-near_dists[:, np.newaxis] <= 1e-6*np.maximum(near_dists, 1.0)[:, np.newaxis], -1) > 1):
+                dists[i] = [np.linalg.norm(d) for d in diffs[i]]
+            near_gts = np.argmin(dists, -1)
+            near_dists = dists[np.arange(dets.shape[0]), near_gts]
+
+        # for each corner detection, in order
+        for i in range(dets.shape[0]):
+            k = int(near_gts[i]) if gts.shape[0] > 0 else 0
 
             # hit (<= thresh) and not found yet 
-            if near_gt[1] <= thresh and not found[near_gt[0]]:
+            if gts.shape[0] > 0 and near_dists[i] <= thresh and not found[k]:
                 per_sample_corner_tp += 1.0
-                found[near_gt[0]] = True
-                c_det_annot[juncs_on[i]] = near_gt[0]
+                found[k] = True
+                c_det_annot[juncs_on[i]] = k
 
             # not hit or already found
             else:
                 per_sample_corner_fp += 1.0
 
-        # update counters for corners
-        self.curr_corner_tp += per_sample_corner_tp
-        self.curr_corner_fp += per_sample_corner_fp
-        self.n_corner_samples += gts.shape[0]
-        self.per_corner_sample_score.update({_id: {'recall': per_sample_corner_tp/gts.shape[0], 'precision': per_sample_corner_tp/(per_sample_corner_tp+per_sample_corner_fp+1e-8)}}) 
 
         ## Compute edges precision/recall
         per_sample_edge_tp = 0.0
         per_sample_edge_fp = 0.0
-        edge_corner_annots = edges_from_annots(graph_gt)
+        edge_corner_annots = annot['edges']
+        edge_set = annot['edge_set']
 
         # for each detected edge 
-#         print(lines_on)
         for l, e_det in enumerate(lines_on):
             c1, c2 = e_det
             
             # check if corners are mapped
-            if (c1 not in c_det_annot.keys()) or (c2 not in c_det_annot.keys()):
+            if (c1 not in c_det_annot) or (c2 not in c_det_annot):
                 per_sample_edge_fp += 1.0                
                 continue
 
-            # check hit
-            c1_prime = c_det_annot[c1]
-            c2_prime = c_det_annot[c2]
-            is_hit = False
-            
-            for k, e_annot in enumerate(edge_corner_annots):
-                c3, c4 = e_annot
-                if ((c1_prime == c3) and (c2_prime == c4)) or ((c1_prime == c4) and (c2_prime == c3)):
-                    is_hit = True
-
-            # hit
-            if is_hit == True:
+            # hit, in either direction
+            if (c_det_annot[c1], c_det_annot[c2]) in edge_set:
                 per_sample_edge_tp += 1.0
             # not hit 
             else:
                 per_sample_edge_fp += 1.0
 
-        # update counters for edges
-        self.curr_edge_tp += per_sample_edge_tp
-        self.curr_edge_fp += per_sample_edge_fp
-        self.n_edge_samples += edge_corner_annots.shape[0]
-        self.per_edge_sample_score.update({_id: {'recall': per_sample_edge_tp/edge_corner_annots.shape[0], \
-            'precision': per_sample_edge_tp/(per_sample_edge_tp+per_sample_edge_fp+1e-8)}}) 
 
         ## Compute loops precision/recall
         per_sample_loop_tp = 0.0
         per_sample_loop_fp = 0.0
 
-        corners_annots = np.array([list(x) for x in graph_gt])
         pred_edge_map = draw_edges(lines_on, junctions)
         pred_edge_map = fill_regions(pred_edge_map)
-        annot_edge_map = draw_edges(edge_corner_annots, corners_annots)
-        annot_edge_map = fill_regions(annot_edge_map)
-
-        pred_rs = extract_regions(pred_edge_map)
-        annot_rs = extract_regions(annot_edge_map)
+        pred_rs = extract_regions_packed(pred_edge_map)
+        annot_rs = annot['regions']
+        ious = pred_rs.iou(annot_rs)
 
         # for each predicted region
         found = [False] * len(annot_rs)
-        for i, r_det in enumerate(pred_rs):
+        for i in range(len(pred_rs)):
 
-            # get closest gt
-            near_gt = [0, 0, None]
-            for k, r_gt in enumerate(annot_rs):
-                iou = np.logical_and(r_gt, r_det).sum()/float(np.logical_or(r_gt, r_det).sum())
-                # print(i, k, iou)
-                if iou > near_gt[1]:
-                    near_gt = [k, iou, r_gt] 
+            # get closest gt, first one on ties
+            near_gt = [0, 0]
+            if len(annot_rs) > 0 and ious[i].max() > 0:
+                k = int(np.argmax(ious[i]))
+                near_gt = [k, ious[i, k]]
 
             # hit (<= thresh) and not found yet 
             if near_gt[1] >= iou_thresh and not found[near_gt[0]]:
@@ -221,38 +293,31 @@ class Metrics():
             else:
                 per_sample_loop_fp += 1.0
         
-        # update counters for corners
-        self.curr_loop_tp += per_sample_loop_tp
-        self.curr_loop_fp += per_sample_loop_fp
-        self.n_loop_samples += len(annot_rs)
-        self.per_loop_sample_score.update({_id: {'recall': per_sample_loop_tp/len(annot_rs), 'precision': per_sample_loop_tp/(per_sample_loop_tp+per_sample_loop_fp+1e-8)}})
-
 
         ###########################################################################################################
         # Compute loop metrics V2
         per_sample_loop_tp_v2 = 0.0
         per_sample_loop_fp_v2 = 0.0
 
-        corners_annots = np.array([list(x) for x in graph_gt])
-        annot_rs_v2, _ = extract_regions_v2(corners_annots, np.ones(corners_annots.shape[0]), edge_corner_annots)
-        pred_rs_v2, pred_fp = extract_regions_v2(junctions, juncs_on, lines_on)
+        annot_rs_v2 = annot['regions_v2']
+        pred_juncs, pred_loops, pred_fp = extract_loops(junctions, juncs_on, lines_on)
+        pred_rs_v2 = PackedRegions.from_polygons(pred_juncs, pred_loops)
+        ious = pred_rs_v2.iou(annot_rs_v2)
 
         # for each predicted region
         found = [False] * len(annot_rs_v2)
-        for i, r_det in enumerate(pred_rs_v2):
+        for i in range(len(pred_rs_v2)):
 
             # if loop contains intersection there is no need to check it's FP
             if i in pred_fp:
                 per_sample_loop_fp_v2 += 1.0
                 continue
 
-            # get closest gt
-            near_gt = [0, 0, None]
-            for k, r_gt in enumerate(annot_rs_v2):
-                iou = np.logical_and(r_gt, r_det).sum()/float(np.logical_or(r_gt, r_det).sum())
-                # print(i, k, iou)
-                if iou > near_gt[1]:
-                    near_gt = [k, iou, r_gt] 
+            # get closest gt, first one on ties
+            near_gt = [0, 0]
+            if len(annot_rs_v2) > 0 and ious[i].max() > 0:
+                k = int(np.argmax(ious[i]))
+                near_gt = [k, ious[i, k]]
 
             # # debug
             # im_arr1 = np.zeros((256, 256, 3))
@@ -284,16 +349,47 @@ class Metrics():
             else:
                 per_sample_loop_fp_v2 += 1.0
         
-        # update counters for corners
-        self.curr_loop_tp_v2 += per_sample_loop_tp_v2
-        self.curr_loop_fp_v2 += per_sample_loop_fp_v2
-        self.n_loop_samples_v2 += len(annot_rs_v2)
 #         print('tp:{} fp: {}, tot:{}'.format(per_sample_loop_tp, per_sample_loop_fp, len(annot_rs)))
 #         print('tp_v2:{} fp_v2: {}, tot_v2:{}'.format(per_sample_loop_tp_v2, per_sample_loop_fp_v2, len(annot_rs_v2)))
-        self.per_loop_sample_score_v2.update({_id: {'recall': per_sample_loop_tp_v2/len(annot_rs_v2), 'precision': per_sample_loop_tp_v2/(per_sample_loop_tp_v2+per_sample_loop_fp_v2+1e-8)}})
 
+        # update counters
+        self.add_sample(_id, [per_sample_corner_tp, per_sample_corner_fp, gts.shape[0],
+                              per_sample_edge_tp, per_sample_edge_fp, edge_corner_annots.shape[0],
+                              per_sample_loop_tp, per_sample_loop_fp, len(annot_rs),
+                              per_sample_loop_tp_v2, per_sample_loop_fp_v2, len(annot_rs_v2)])
         return
 
+# ground truth side of Metrics.forward, shared by all Metrics objects (e.g. the seven
+# experiments) evaluating the same building; the last gt_cache_size buildings are kept
+_gt_cache = OrderedDict()
+gt_cache_size = 64
+
+def get_annot(graph_gt, _id):
+
+    # corners and edges are cheap, they also tell if the cached entry is still valid
+    corners = np.array([list(x) for x in graph_gt])
+    edges = edges_from_annots(graph_gt)
+    key = (corners.shape, corners.tobytes(), edges.shape, edges.tobytes())
+    if _id in _gt_cache and _gt_cache[_id]['key'] == key:
+        _gt_cache.move_to_end(_id)
+        return _gt_cache[_id]
+
+    # rasterized and polygon regions, as packed bits
+    annot_edge_map = fill_regions(draw_edges(edges, corners))
+    regions = extract_regions_packed(annot_edge_map)
+    loop_juncs, loops, _ = extract_loops(corners, np.ones(corners.shape[0]), edges)
+    regions_v2 = PackedRegions.from_polygons(loop_juncs, loops)
+    edge_set = set()
+    for c1, c2 in edges:
+        edge_set.add((int(c1), int(c2)))
+        edge_set.add((int(c2), int(c1)))
+    annot = {'key': key, 'corners': corners, 'edges': edges, 'edge_set': edge_set,
+             'regions': regions, 'regions_v2': regions_v2}
+    _gt_cache[_id] = annot
+    if len(_gt_cache) > gt_cache_size:
+        _gt_cache.popitem(last=False)
+    return annot
+
 def draw_edges(edge_corner, corners, mode="det"):
 
     im = Image.new('L', (256, 256))
@@ -370,6 +466,14 @@ def extract_regions(region_mask):
     #     plt.show()
     return rs
 
+def extract_regions_packed(region_mask):
+
+    # same regions and order as extract_regions, without the full size masks
+    inds = np.where((region_mask > 1) & (region_mask < 255))
+    tags = set(region_mask[inds])
+    outer = set([region_mask[0][0], region_mask[-1][0], region_mask[0][-1], region_mask[-1][-1]])
+    return PackedRegions.from_masks((region_mask == t).T for t in tags if t > 0 and t not in outer)
+
 
 # def getAngle(pt1, pt2, pt3):
 
@@ -406,345 +510,267 @@ def getAngle(pt1, pt2, pt3):
         ang += 360
     return  ang
 
-def get_sequence(edges, junctions, start_corner):
-    poly = [start_corner]
-    for i, j in edges[1:]:
-        if i in poly:
-            poly.append(j)
-        else:
-            poly.append(i)
-    return poly + [poly[0]]
-
-def is_clockwise(edges, junctions, start_corner):
-    poly = [junctions[start_corner]]
-    keep_track = [start_corner]
-    for i, j in edges[1:]:
-        if i in keep_track:
-            poly.append(junctions[j])
-            keep_track.append(j)
-        else:
-            poly.append(junctions[i])
-            keep_track.append(i)
-    
-    poly_shifted = np.array([poly[-1]] + poly[:-1])
-    poly = np.array(poly)
-
-    ### DEBUG
-    # print(keep_track)
-    # print(np.sum((poly_shifted[:, 0]-poly[:, 0])*(poly_shifted[:, 1]+poly[:, 1])))
-    # im_deb = Image.new('RGB', (256, 256))
-    # dr = ImageDraw.Draw(im_deb)
-    # for k, (x, y) in enumerate(poly):
-    #   dr.text((x, y), str(k),(0, 255, 0))
-    # plt.figure()
-    # plt.imshow(im_deb)
-    # plt.show()
-
-    if np.sum((poly_shifted[:, 0]-poly[:, 0])*(poly_shifted[:, 1]+poly[:, 1])) > 0:
-        return True
-    return False
-
-def sort_clockwise(junctions, curr_corner, curr_edge, edges):
-    
-    if len(edges) == 0:
-        return None
-
-    # compute outcoming angles
-    out_angles = []
-    prev_corner = curr_edge[1] if curr_corner == curr_edge[0] else curr_edge[0]
-    for i, j in edges:
-        next_corner = i if curr_corner == j else j
-        out_angles.append(getAngle(junctions[prev_corner], junctions[curr_corner], junctions[next_corner])) 
-    next_edge_ind = sorted(range(len(out_angles)), key=lambda k: out_angles[k], reverse=True)[0]
-
-    # ### DEBUG
-    # im_deb = Image.new('RGB', (256, 256))
-    # dr = ImageDraw.Draw(im_deb)
-    # x0, y0 = junctions[curr_edge[0]]
-    # x1, y1 = junctions[curr_edge[1]]
-    # dr.line((x0, y0, x1, y1), width=3, fill='blue')
-    # for i, j in edges:
-    #     x0, y0 = junctions[i]
-    #     x1, y1 = junctions[j]
-    #     dr.line((x0, y0, x1, y1), width=3, fill='red')
-    # next_edge = edges[next_edge_ind]
-    # x0, y0 = junctions[next_edge[0]]
-    # x1, y1 = junctions[next_edge[1]]
-    # dr.line((x0, y0, x1, y1), width=3, fill='green')
-    # for k , (x, y) in enumerate(junctions):
-    #     dr.text((x, y), str(k),(0, 255, 0))
-    # plt.imshow(im_deb)
-    # plt.show()
-
-    return next_edge_ind
-
-def check_polygon(edges, degree_list=False):
-    degs = defaultdict(int)
-    for e in edges:
-        c1 = e[0]
-        c2 = e[1]
-        degs[c1] += 1
-        degs[c2] += 1
-    for k in degs.keys():
-        if degs[k] < 2:
-            if degree_list:
-                return False, degs
-            return False
-    if degree_list:
-        return True, degs
-    return True
-
-def find_loop(junctions, curr_edge, start_corner, lines_on, tracker, is_contour=False):
-
-    visited_edges = [curr_edge]
-    curr_corner = start_corner
-    is_broken = False
-    while check_polygon(visited_edges) == False:
-        # print(visited_edges, check_polygon(visited_edges))
-        # print(curr_edge, curr_corner)
-
-        # sort not visited edges and pick closest one
-        not_visited = [x for x in lines_on if x not in visited_edges]
-
-        # pick next edge candidates
-        candidates = [[], []]
-        # print(not_visited)
-        for (p1, p2) in not_visited:
-            if (p1 == curr_corner):
-                candidates[0].append((p1, p2))
-                candidates[1].append([p1, p2])
-            elif (p2 == curr_corner):
-                candidates[0].append((p2, p1))
-                candidates[1].append((p1, p2))
-
-        # sort edges clockwise
-        next_edge_ind = sort_clockwise(junctions, curr_corner, curr_edge, candidates[0])
-        if next_edge_ind is None:
-            is_broken = True
-            break
-        else:
-            # if no visited edge stop and return loop
-            next_edge = candidates[1][next_edge_ind]
-            visited_edges.append(tuple(next_edge))
-            curr_corner = next_edge[0] if curr_corner == next_edge[1] else next_edge[1]
-            curr_edge = next_edge
-    poly = get_sequence(visited_edges, junctions, start_corner)
-
-    # ############## DEBUG
-    # print(poly)
-    # print(tracker)
-    # im_deb = Image.new('RGB', (256, 256))
-    # dr = ImageDraw.Draw(im_deb)
-    # for i, j in visited_edges:
-    #     x0, y0 = junctions[i]
-    #     x1, y1 = junctions[j]
-    #     dr.line((x0, y0, x1, y1), width=3, fill='blue')
-    # for k , (x, y) in enumerate(junctions):
-    #     dr.text((x, y), str(k),(0, 255, 0))
-    # # check if is repeated
-    # is_repeated = True
-    # for k in range(len(poly)-1):
-    #     if tuple([poly[k], poly[k+1]]) not in tracker:
-    #         is_repeated = False
-    # print('is_contour:{} is_repeated:{}, is_clockwise:{}, is_broken:{}'.format(is_contour, is_repeated, is_clockwise(visited_edges, junctions, start_corner), is_broken))
-    # plt.imshow(im_deb)
-    # plt.show()
-        
-    if is_clockwise(visited_edges, junctions, start_corner) and not is_broken:
-
-        # check if is repeated
-        is_repeated = True
-        for k in range(len(poly)-1):
-            if tuple([poly[k], poly[k+1]]) not in tracker:
-                is_repeated = False
-
-        # update tracker with visited edges
-        if not is_repeated:
-            # init new tracker
-            updated_tracker = tracker.copy()
-            for k in range(len(poly)-1):
-                updated_tracker.add(tuple([poly[k], poly[k+1]]))
-            return poly, updated_tracker, False
-        else:
-            return poly, tracker.copy(), True
-    else:
-        if is_contour:
-            updated_tracker = tracker.copy()
-            for k in range(len(poly)-1):
-                updated_tracker.add(tuple([poly[k], poly[k+1]]))
-            return poly, updated_tracker, False
-        return None, tracker.copy(), True
-    
+def getDirection(pt1, pt2):
+
+    # angle of the unit vector from pt1 to pt2, as the terms of getAngle
+    x, y = (pt2-pt1)
+    x, y = (x, y)/np.linalg.norm([x, y])
+    return np.arctan2(y, x)
+
+class PlanarLoops():
+    """Loops of the graph (junctions, lines_on) as traced by extract_regions_v2."""
+
+    def __init__(self, junctions, lines_on):
+        self.junctions = junctions
+        self.lines_on = [tuple(e) for e in lines_on]
+
+        # (edge index, other corner, whether the edge starts at the corner)
+        self.incident = defaultdict(list)
+        for n, (p1, p2) in enumerate(self.lines_on):
+            self.incident[p1].append((n, p2, True))
+            if p2 != p1:
+                self.incident[p2].append((n, p1, False))
+        self.directions = dict()
+
+        # incident edges of every corner sorted by direction once, corners with a
+        # zero length edge (no direction) are left to turn_scan
+        self.rotation = dict()
+        for i, inc in self.incident.items():
+            dirs = [self.direction(i, k) for n, k, fwd in inc]
+            if not any(np.isnan(d) for d in dirs):
+                order = sorted(range(len(inc)), key=lambda m: (dirs[m], m))
+                self.rotation[i] = (order, [dirs[m] for m in order])
+
+    def direction(self, i, j):
+        if (i, j) not in self.directions:
+            self.directions[(i, j)] = getDirection(self.junctions[i], self.junctions[j])
+        return self.directions[(i, j)]
+
+    def is_clockwise(self, poly):
+        pts = [self.junctions[k] for k in poly[:-1]]
+        pts_shifted = np.array([pts[-1]] + pts[:-1])
+        pts = np.array(pts)
+        return np.sum((pts_shifted[:, 0]-pts[:, 0])*(pts_shifted[:, 1]+pts[:, 1])) > 0
+
+    def turn(self, i, prev, visited):
+
+        # incident edges from the one to prev, rotating clockwise: the turn angles only
+        # decrease along the way, so the first not visited edge wins unless the next
+        # ones tie with it (then the first in incident order, as the scan)
+        th_prev = self.direction(i, prev)
+        if i not in self.rotation or np.isnan(th_prev):
+            return self.turn_scan(i, th_prev, visited)
+        inc = self.incident[i]
+        order, dirs = self.rotation[i]
+        p = bisect.bisect_left(dirs, th_prev)
+        best, best_ang = None, None
+        for r in range(p-1, p-1-len(order), -1):
+            n, k, fwd = inc[order[r]]
+            if self.lines_on[n] in visited:
+                continue
+            ang = np.degrees(dirs[r]-th_prev)
+            if ang < 0:
+                ang += 360
+            if best is None or ang > best_ang or (ang == best_ang and order[r] < best):
+                best, best_ang = order[r], ang
+            elif ang < best_ang:
+                break
+        return None if best is None else inc[best]
+
+    def turn_scan(self, i, th_prev, visited):
+
+        # every not visited edge scored, for corners without a rotation
+        candidates = [(n, k, fwd) for n, k, fwd in self.incident[i] if self.lines_on[n] not in visited]
+        if len(candidates) == 0:
+            return None
+        out_angles = []
+        for n, k, fwd in candidates:
+            ang = np.degrees(self.direction(i, k)-th_prev)
+            if ang < 0:
+                ang += 360
+            out_angles.append(ang)
+        return candidates[sorted(range(len(out_angles)), key=lambda k: out_angles[k], reverse=True)[0]]
+
+    def walk(self, curr_edge, start_corner, tracker, is_contour=False):
+        """Walk from start_corner until every visited corner has two visited edges, returns (poly, is_repeated)."""
+
+        # visited edges match lines_on as given, a list start edge (see contour) matches none
+        visited = set()
+        if isinstance(curr_edge, tuple):
+            visited.add(curr_edge)
+        degs = defaultdict(int)
+        n_open = 0
+        path = []
+        curr_corner = start_corner
+        is_broken = False
+        edge = curr_edge
+        while True:
+            for c in (edge[0], edge[1]):
+                degs[c] += 1
+                if degs[c] == 1:
+                    n_open += 1
+                elif degs[c] == 2:
+                    n_open -= 1
+            if n_open == 0:
+                break
 
-def find_contour(junctions, lines_on, tracker):
-
-    # get right most corner
-    max_x = -1
-    min_y = -1
-    max_j = -1
-    for k, (x, y) in enumerate(junctions):
-        if max_x < x:
-            min_y = y
-            max_x = x
-            max_j = k
-        elif max_x == x:
-            if min_y > y:
+            # pick the not visited edge with the largest clockwise turn
+            prev_corner = curr_edge[1] if curr_corner == curr_edge[0] else curr_edge[0]
+            picked = self.turn(curr_corner, prev_corner, visited)
+            if picked is None:
+                is_broken = True
+                break
+            n, k, fwd = picked
+            edge = self.lines_on[n]
+            visited.add(edge)
+            path.append(edge)
+            curr_edge = list(edge) if fwd else edge
+            curr_corner = curr_edge[0] if curr_corner == curr_edge[1] else curr_edge[1]
+
+        # corner sequence
+        poly = [start_corner]
+        in_poly = set(poly)
+        for i, j in path:
+            k = j if i in in_poly else i
+            poly.append(k)
+            in_poly.add(k)
+        poly = poly + [poly[0]]
+        poly_edges = [(poly[k], poly[k+1]) for k in range(len(poly)-1)]
+
+        if self.is_clockwise(poly) and not is_broken:
+            if all(e in tracker for e in poly_edges):
+                return poly, True
+        elif not is_contour:
+            return None, True
+        tracker.update(poly_edges)
+        return poly, False
+
+    def contour(self, tracker):
+
+        # get right most corner
+        max_x = -1
+        min_y = -1
+        max_j = -1
+        for k, (x, y) in enumerate(self.junctions):
+            if max_x < x:
                 min_y = y
                 max_x = x
-                max_j = k 
-    curr_corner = max_j
-
-    # get edge in contour
-    candidates = [[], []] 
-    for (p1, p2) in lines_on:
-        if (p1 == curr_corner):
-            candidates[0].append((p1, p2))
-            candidates[1].append([p1, p2])
-        elif (p2 == curr_corner):
-            candidates[0].append((p2, p1))
-            candidates[1].append((p1, p2))            
-
-    # sort angles
-    junc_prev = np.array(junctions[curr_corner])
-    junc_prev[1] -= 50.0
-    out_angles = []
-    for i, j in candidates[0]:
-        next_corner = i if curr_corner == j else j
-        out_angles.append(getAngle(junc_prev, junctions[curr_corner], junctions[next_corner])) 
-        next_edge_ind = sorted(range(len(out_angles)), key=lambda k: out_angles[k], reverse=True)[0]
-    next_edge = candidates[1][next_edge_ind]
-    start_corner = next_edge[1] if curr_corner == next_edge[0] else next_edge[0]
-
-    # ### DEBUG
-    # print(out_angles)
-    # im_deb = Image.new('RGB', (256, 256))
-    # dr = ImageDraw.Draw(im_deb)
-    # x0, y0 = junc_prev
-    # x1, y1 = junctions[curr_corner]
-    # dr.line((x0, y0, x1, y1), width=3, fill='blue')
-    # for i, j in candidates[0]:
-    #     x0, y0 = junctions[i]
-    #     x1, y1 = junctions[j]
-    #     dr.line((x0, y0, x1, y1), width=3, fill='red')
-    # next_edge = candidates[0][next_edge_ind]
-    # x0, y0 = junctions[next_edge[0]]
-    # x1, y1 = junctions[next_edge[1]]
-    # dr.line((x0, y0, x1, y1), width=3, fill='green')
-    # for k , (x, y) in enumerate(junctions):
-    #     dr.text((x, y), str(k),(0, 255, 0))
-    # plt.figure()
-    # plt.imshow(im_deb)
-    # plt.show()
-
-    poly, updated_tracker, _ = find_loop(junctions, next_edge, start_corner, lines_on, tracker, is_contour=True)
-
-    # ### DEBUG - contour
-    # im_deb = Image.new('RGB', (256, 256))
-    # dr = ImageDraw.Draw(im_deb)
-    # for k in range(len(poly)-1):
-    #     x0, y0 = junctions[poly[k]]
-    #     x1, y1 = junctions[poly[k+1]]
-    #     dr.line((x0, y0, x1, y1), width=3, fill='magenta')
-    # for k , (x, y) in enumerate(junctions):
-    #     dr.text((x, y), str(k),(0, 255, 0))
-    # print(updated_tracker)
-    # plt.imshow(im_deb)
-    # plt.show()
-
-    return updated_tracker
+                max_j = k
+            elif max_x == x:
+                if min_y > y:
+                    min_y = y
+                    max_x = x
+                    max_j = k
+        curr_corner = max_j
+
+        # first contour edge turning clockwise from straight up
+        junc_prev = np.array(self.junctions[curr_corner])
+        junc_prev[1] -= 50.0
+        out_angles = []
+        for n, k, fwd in self.incident[curr_corner]:
+            out_angles.append(getAngle(junc_prev, self.junctions[curr_corner], self.junctions[k]))
+        n, k, fwd = self.incident[curr_corner][sorted(range(len(out_angles)), key=lambda k: out_angles[k], reverse=True)[0]]
+        next_edge = list(self.lines_on[n]) if fwd else self.lines_on[n]
+        return self.walk(next_edge, k, tracker, is_contour=True)
+
+    def loops(self):
+        """Region loops (closed corner sequences), outer contour excluded."""
+        tracker = set() # (clockwise, anticlockwise)
+        self.contour(tracker)
+
+        # walk from every edge direction not yet in tracker
+        regions = []
+        start_edge = self.lines_on[0]
+        next_ind = 0
+        while True:
+            region, is_repeated = self.walk(start_edge, start_edge[1], tracker)
+            if region is None:
+                region, is_repeated = self.walk(start_edge, start_edge[0], tracker)
+            if not is_repeated:
+                regions.append(region)
+
+            # edges before next_ind are in tracker both ways
+            start_edge = None
+            while next_ind < len(self.lines_on):
+                i, j = self.lines_on[next_ind]
+                if (i, j) not in tracker:
+                    start_edge = (i, j)
+                elif (j, i) not in tracker:
+                    start_edge = (j, i)
+                if start_edge is not None:
+                    tracker.add(start_edge)
+                    break
+                next_ind += 1
+            if start_edge is None:
+                break
+        return regions
 
 def remove_dangling(junctions, juncs_on, lines_on):
 
-    # remove dangling edges
-    filtered_edges = list(lines_on)
-    is_closed, degree_list = check_polygon(filtered_edges, degree_list=True)
-    while (is_closed == False) and (len(filtered_edges) > 0):
-        for i in degree_list:
-            if degree_list[i] == 1:
-                to_remove = None
-                for n, (k, l) in enumerate(filtered_edges):
-                    if (i == l) or (i == k):
-                        to_remove = n
-                        break
-                if to_remove is not None:
-                    filtered_edges.pop(n)
-        is_closed, degree_list = check_polygon(filtered_edges, degree_list=True)
+    # peel edges at corners of degree one until none is left
+    degs = defaultdict(int)
+    incident = defaultdict(list)
+    for n, (k, l) in enumerate(lines_on):
+        degs[k] += 1
+        degs[l] += 1
+        incident[k].append(n)
+        incident[l].append(n)
+    removed = np.zeros(len(lines_on), dtype='bool')
+    leaves = [i for i in degs if degs[i] == 1]
+    while len(leaves) > 0:
+        i = leaves.pop()
+        for n in incident[i]:
+            if not removed[n]:
+                removed[n] = True
+                k, l = lines_on[n]
+                for c in (k, l):
+                    degs[c] -= 1
+                    if degs[c] == 1:
+                        leaves.append(c)
+                break
+    filtered_edges = [e for n, e in enumerate(lines_on) if not removed[n]]
 
     # remove junctions with degree zero
     new_junctions = []
-    tracker = []
     old_to_new_map = dict()
     for k, l in filtered_edges:
-        if k not in tracker:
-            tracker.append(k)
-            old_to_new_map[k] = len(new_junctions)
-            new_junctions.append(junctions[k])
-        if l not in tracker:
-            tracker.append(l)
-            old_to_new_map[l] = len(new_junctions)
-            new_junctions.append(junctions[l])    
+        for c in (k, l):
+            if c not in old_to_new_map:
+                old_to_new_map[c] = len(new_junctions)
+                new_junctions.append(junctions[c])
 
     # remap edges
     new_lines_on = np.array([(old_to_new_map[i], old_to_new_map[j]) for i, j in filtered_edges])
 
-
     return np.array(new_junctions), np.ones(junctions.shape[0]), new_lines_on
 
-def extract_regions_v2(junctions, juncs_on, lines_on):
-    
-    # is_closed, degree_list = check_polygon(lines_on, degree_list=True)
-    # print(is_closed, degree_list)
+def draw_polygons(junctions, polys, imsize=256):
+
+    # fill every polygon into one preallocated stack
+    masks = np.zeros((len(polys), imsize, imsize))
+    for n, (y0, x0, crop) in enumerate(polygon_crops(junctions, polys, imsize)):
+        h, w = crop.shape
+        masks[n, y0:y0+h, x0:x0+w] = crop/255.0
+    return masks
+
+def extract_loops(junctions, juncs_on, lines_on):
+    """Region loops of a graph without its dangling edges, returns (junctions, loops, false_pos)."""
 
     # handle intersections
     edges_intersect = set()
-    for k, (p1, q1) in enumerate(lines_on):
-        for l, (p2, q2) in enumerate(lines_on):
-            if k > l:
-                if doIntersect(junctions[p1], junctions[q1], junctions[p2], junctions[q2]):
-                    edges_intersect.add((p1, q1))
-                    edges_intersect.add((p2, q2))
+    lines_index = SegmentIndex([junctions[p1] for p1, q1 in lines_on], [junctions[q1] for p1, q1 in lines_on])
+    for k, l in lines_index.pairs():
+        (p1, q1), (p2, q2) = lines_on[k], lines_on[l]
+        edges_intersect.add((p1, q1))
+        edges_intersect.add((p2, q2))
 
     # remove dangling edges
     junctions, juncs_on, lines_on = remove_dangling(junctions, juncs_on, lines_on)
-
-    # init variables
-    lines_on = [tuple([x, y]) for x, y in lines_on]
-    tracker = set() # (clockwise, anticlockwise)
-
     if len(junctions) == 0:
-        return [], []
-
-    # find contour
-    tracker = find_contour(junctions, lines_on, tracker)
+        return junctions, [], []
 
     # extract regions
-    start_edge = lines_on[0]
-    regions = []
-    while True: 
-
-        # find loop, updating tracker
-        region, updated_tracker, is_repeated = find_loop(junctions, start_edge, start_edge[1], lines_on, tracker)
-        if region is None:
-            region, updated_tracker, is_repeated = find_loop(junctions, start_edge, start_edge[0], lines_on, tracker)
-        tracker = updated_tracker
-        if not is_repeated:
-            regions.append(region)
-
-        # find next edge that does not appear twice in tracker
-        start_edge = None
-        for (i, j) in lines_on:
-            if ((i, j) not in tracker):
-                start_edge = (i, j)
-                tracker.add((i, j))
-                break
-            if ((j, i) not in tracker):
-                start_edge = (j, i)
-                tracker.add((j, i))
-                break
-
-        # else stop
-        if start_edge is None:
-            break
+    regions = PlanarLoops(junctions, lines_on).loops()
 
     # mark regions using edges with intersection
     false_pos = []
@@ -754,47 +780,15 @@ def extract_regions_v2(junctions, juncs_on, lines_on):
             if ((i, j) in edges_intersect) or ((j, i) in edges_intersect):
                false_pos.append(l)
                break
+    return junctions, regions, false_pos
 
-    # extract region masks
-    region_mks = []
-    for poly in regions:
-        rm = Image.new('L', (256, 256))
-        dr = ImageDraw.Draw(rm)
-        poly_coords = [tuple(junctions[x]) for x in poly]
-        dr.polygon(poly_coords, fill='white')
-        region_mks.append(np.array(rm)/255.0)
-
-    #     ### DEBUG
-    #     print(false_pos)
-    #     print(poly_coords)
-    #     plt.imshow(rm)
-    #     plt.show()
-    # print('test:', len(region_mks))
-
-    return region_mks, false_pos
-
-def fill_regions(edge_mask):
-    edge_mask = edge_mask
-    tag = 2
-    for i in range(edge_mask.shape[0]):
-        for j in range(edge_mask.shape[1]):
-            if edge_mask[i, j] == 0:
-                edge_mask = _flood_fill(edge_mask, i, j, tag)
-                tag += 1
-    return edge_mask
-
-def _flood_fill(edge_mask, x0, y0, tag):
-    new_edge_mask = np.array(edge_mask)
-    nodes = [(x0, y0)]
-    new_edge_mask[x0, y0] = tag
-    while len(nodes) > 0:
-        x, y = nodes.pop(0)
-        for (dx, dy) in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            if (0 <= x+dx < new_edge_mask.shape[0]) and (0 <= y+dy < new_edge_mask.shape[0]) and (new_edge_mask[x+dx, y+dy] == 0):
-                new_edge_mask[x+dx, y+dy] = tag
-                nodes.append((x+dx, y+dy))
-    return new_edge_mask
+def extract_regions_v2(junctions, juncs_on, lines_on):
 
+    # extract region masks
+    junctions, regions, false_pos = extract_loops(junctions, juncs_on, lines_on)
+    if len(regions) == 0:
+        return [], false_pos
+    return list(draw_polygons(junctions, regions)), false_pos
 
 if __name__ == '__main__':
 
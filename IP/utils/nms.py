@@ -0,0 +1,60 @@
+import numpy as np
+
+def point_dists(diffs, thresh):
+    """Lengths of the difference vectors diffs (..., 2), as np.linalg.norm gives them near thresh."""
+    dists = np.sqrt(np.sum(diffs*diffs, -1, dtype='float64'))
+    near = np.abs(dists-thresh) <= 1e-6*max(abs(thresh), 1.0)
+    if np.any(near):
+        dists[near] = [np.linalg.norm(d) for d in diffs[near]]
+    return dists
+
+def suppress_points(points, thresh, max_dense=128):
+    """Greedy suppression of points closer than thresh, in the given order, returns the kept indices."""
+    points = np.asarray(points)
+    n = points.shape[0]
+    if n == 0:
+        return []
+    if not thresh > 0:
+        return list(range(n))
+    suppressed = np.zeros(n, dtype='bool')
+    keep = []
+
+    # small inputs: rows of the distance matrix as boolean masks
+    if n <= max_dense:
+        close = point_dists(points[:, np.newaxis, :]-points[np.newaxis, :, :], thresh) < thresh
+        for i in range(n):
+            if not suppressed[i]:
+                keep.append(i)
+                suppressed |= close[i]
+        return keep
+
+    # large inputs: points bucketed by cell, non finite points are kept and suppress nothing
+    finite = np.all(np.isfinite(points), -1)
+    cells = np.zeros((n, 2), dtype='int64')
+    cells[finite] = np.floor(points[finite]/float(thresh)).astype('int64')
+    grid = dict()
+    for i in np.flatnonzero(finite):
+        grid.setdefault((cells[i, 0], cells[i, 1]), []).append(i)
+    grid = dict((key, np.array(inds)) for key, inds in grid.items())
+    for i in range(n):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        if not finite[i]:
+            continue
+        cx, cy = cells[i]
+        cands = [grid[(cx+dx, cy+dy)] for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (cx+dx, cy+dy) in grid]
+        cands = np.concatenate(cands)
+        suppressed[cands[point_dists(points[cands]-points[i], thresh) < thresh]] = True
+    return keep
+
+def nms(junctions, junc_confs, thetas, theta_confs, nms_thresh=4.0):
+
+    # most confident first, then drop junctions closer than nms_thresh to a kept one
+    inds = np.argsort(junc_confs)[::-1]
+    junc_confs_sorted = np.array(junc_confs[inds])
+    juncs_sorted = np.array(junctions[inds])
+    thetas_sorted = np.array(thetas[inds])
+    theta_confs_sorted = np.array(theta_confs[inds])
+    nms_inds = suppress_points(juncs_sorted, nms_thresh)
+    return juncs_sorted[nms_inds], junc_confs_sorted[nms_inds], thetas_sorted[nms_inds], theta_confs_sorted[nms_inds]
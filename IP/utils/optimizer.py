@@ -1,13 +1,18 @@
-from gurobipy import *
 import cv2
 import numpy as np
 import sys
 import csv
 import copy
+import heapq
+import time
 from utils import *
 from PIL import Image, ImageDraw, ImageOps, ImageFilter
 import matplotlib.pyplot as plt
-from utils.intersections import doIntersect
+from utils.intersections import doIntersect, SegmentIndex
+from utils.raster import getLineRaster, LineRaster
+from utils.rays import RegionRays
+from utils.regions import PreparedRegions, sample_contour
+from utils.solvers import get_backend
 from skimage import measure
 from rdp import rdp
 
@@ -23,12 +28,25 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
     region_weight=1000.0, post_process=False, \
     edge_map_weight=10.0, junctions_weight=1.0, inter_region_weight=10.0, wrong_dir_weight=1.0, closed_region_weight=1.0, 
     region_intersection_constraint=False, inter_region_constraint=False, intersection_slack_weight=10.0, \
-    junctions_soft=False, shared_edges=None, _id=None, _exp_tag=''):
+    junctions_soft=False, shared_edges=None, _id=None, _exp_tag='', line_raster=None, solver='gurobi', linearize=False, stats=None, \
+    prune_edges=False, prune_min_line_weight=None, prune_min_length=None, keep_model=None, contour_density=0.5, \
+    region_prep=None, time_limit=None, deadline=None, with_names=False):
+
+    # wall time per phase, reported through stats
+    timer = PhaseTimer()
+
+    # variable and constraint names are only formatted on request, the solution is
+    # decoded through the junction, line and region variables kept below
+    def label(fmt, *args):
+        return fmt.format(*args) if with_names else ''
 
     # create a new model
-    m = Model("building_reconstruction_baseline")
-    m.setParam( 'OutputFlag', False )
-    obj = LinExpr(0)
+    m = get_backend(solver, "building_reconstruction_baseline", linearize=linearize)
+    obj = m.lin_expr()
+
+    # objective terms scaled by a tunable weight are kept apart so a kept model
+    # can be re-solved with new weights (see resolveBuilding)
+    obj_terms = {'region_weight': m.lin_expr(), 'edge_map_weight': m.lin_expr(), 'junctions_weight': m.lin_expr()}
     num_junc = len(junctions)
 
     # list primitives
@@ -38,25 +56,44 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
         js_list = [k for k in js_list if len(thetas[k]) >= 2]
     ls_list = [(k, l) for k in js_list for l in js_list if l > k]
 
+    # line weights of candidate edges, the width-2 raster is only built when they are needed
+    def edge_weights(pairs):
+        raster = line_raster if line_raster is not None else getLineRaster(junctions, width=2)
+        return raster.mean(edge_map, pairs)
+
+    # drop candidate edges before building the model
+    num_candidates = len(ls_list)
+    if prune_edges:
+        # edges out of every angle set are forced off only when that constraint is hard
+        angle_prune = coner_to_edge_constraint and not junctions_soft
+        lw = edge_weights(ls_list) if prune_min_line_weight is not None else None
+        ls_list = pruneEdges(ls_list, junctions, thetas=thetas if angle_prune else None, angle_thresh=angle_thresh, \
+            line_weights=lw, min_line_weight=prune_min_line_weight, min_length=prune_min_length)
+    ls_index = SegmentIndex([junctions[k] for k, l in ls_list], [junctions[l] for k, l in ls_list])
+
     # create variables
     if with_corner_variables:
         js_var_dict = {}
         for j in js_list:
-            js_var_dict[j] = m.addVar(vtype = GRB.BINARY, name="junc_{}".format(j))
+            js_var_dict[j] = m.add_var('binary', name=label("junc_{}", j))
 
     ls_var_dict = {}
     for k, l in ls_list:
-        ls_var_dict[(k, l)] = m.addVar(vtype = GRB.BINARY, name="line_{}_{}".format(k, l))
+        ls_var_dict[(k, l)] = m.add_var('binary', name=label("line_{}_{}", k, l))
+
+    lw_dict = {}
+    if with_edge_confidence or with_corner_edge_confidence or coner_to_edge_constraint:
+        lw_dict = dict(zip(ls_list, edge_weights(ls_list)))
 
     # edgeness objective
     if with_edge_confidence:
         for k, l in ls_list:
-            lw = getLineWeight(edge_map, junctions[k], junctions[l]) 
-            obj += edge_map_weight*(lw-edge_threshold)*ls_var_dict[(k, l)] # favor edges with over .5?
+            lw = lw_dict[(k, l)]
+            obj_terms['edge_map_weight'] += (lw-edge_threshold)*ls_var_dict[(k, l)] # favor edges with over .5?
     elif with_corner_edge_confidence:
         for k, l in ls_list:
-            lw = getLineWeight(edge_map, junctions[k], junctions[l]) 
-            obj += edge_map_weight*(np.prod([corner_confs[k], corner_confs[l], lw])-corner_edge_thresh)*ls_var_dict[(k, l)] # favor edges with over .5?
+            lw = lw_dict[(k, l)]
+            obj_terms['edge_map_weight'] += (np.prod([corner_confs[k], corner_confs[l], lw])-corner_edge_thresh)*ls_var_dict[(k, l)] # favor edges with over .5?
     else:
         for k, l in ls_list:
             obj += ls_var_dict[(k, l)]
@@ -64,7 +101,8 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
     # corner-edge connectivity constraint
     if with_corner_variables:
         for k, l in ls_list:
-            m.addConstr((js_var_dict[k] + js_var_dict[l] - 2)*ls_var_dict[(k, l)] == 0, "c_{}_{}".format(k, l))
+            m.add_edge_corner_constr(ls_var_dict[(k, l)], js_var_dict[k], js_var_dict[l], label("c_{}_{}", k, l))
+    timer.lap('model')
 
 ##########################################################################################################
 ############################################### OPTIONAL #################################################
@@ -72,54 +110,28 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
     if use_regions:
         
         #  Preprocessing - Start
-        reg_list = []
+        # eroded masks and largest contours, computed here unless given for the building
+        if region_prep is None:
+            region_prep = PreparedRegions(regions, filter_size)
+        elif region_prep.filter_size != filter_size:
+            raise ValueError('region_prep was eroded with filter_size {}, not {}'.format(region_prep.filter_size, filter_size))
+        if regions is None:
+            regions = region_prep.regions
+        reg_list = list(region_prep.reg_list)
         reg_var_ls = {}
-        reg_sm ={}
-        reg_contour = {} 
-        for i, reg in enumerate(regions):
-            
-            # apply min filter 
-            reg_small = Image.fromarray(reg*255.0)
-            reg_small = reg_small.filter(ImageFilter.MinFilter(filter_size))
-            reg_small = np.array(reg_small)/255.0
-
-            # ignore too small regions
-            inds = np.argwhere(reg_small>0)
-            if np.array(inds).shape[0] > 0:
-
-                ret, thresh = cv2.threshold(np.array(reg_small*255.0).astype('uint8'), 127, 255, 0)
-                contours, _ = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
-                lg_contour = [None, 0]
-
-                for c in contours:
-                    cont = Image.new('L', (256, 256))
-                    dr = ImageDraw.Draw(cont)
-                    c = c.reshape(-1, 2)
-                    c = [(x, y) for x, y in c]
-                    if len(c) <= 2:
-                        continue
-                    dr.polygon(c, fill='white')
-                    size = (np.array(cont)/255.0).sum()
-                    if size > lg_contour[1]:
-                        lg_contour = [c, size]
-                contours = lg_contour[0]
-                contours = np.array(contours)
-
-                if len(contours.shape) > 0:
-                    reg_contour[i] = contours.reshape(-1, 2)
-                    inds = np.linspace(0, reg_contour[i].shape[0], min(int(reg_contour[i].shape[0]/2), reg_contour[i].shape[0]), endpoint=False).astype('int')
-                    reg_contour[i] = reg_contour[i][inds, :]
-                    reg_list.append(i)
-                    reg_var_ls[i] = m.addVar(vtype = GRB.BINARY, name="reg_{}".format(i))
-                    reg_sm[i] = reg_small
-                    obj += region_weight*reg_var_ls[i]
+        reg_sm = {}
+        for i in reg_list:
+            reg_var_ls[i] = m.add_var('binary', name=label("reg_{}", i))
+            reg_sm[i] = region_prep.reg_sm[i]
+            obj_terms['region_weight'] += reg_var_ls[i]
+        timer.lap('region_preprocessing')
         #  Preprocessing - End
         
         # Closed polygon constraint - Start
         if closed_region_constraint:
             for i in reg_list:
                 # add loop constraints
-                ths, pts = compute_normals(reg_contour[i], reg_sm[i])
+                ths, pts = compute_normals(region_prep.contour_points(i, contour_density), reg_sm[i])
                 # # DEBUG -- SAMPLED POINTS
                 # deb = Image.fromarray(reg_sm[i]*255.0).convert('RGB')
                 # dr = ImageDraw.Draw(deb)
@@ -130,40 +142,44 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
                 # plt.show()
                 other_regions = [regions[j] for j in reg_list if i != j]
                 sm_other_regions = [reg_sm[j] for j in reg_list if i != j]
-                for pt, th in zip(pts, ths):
+                # same as castRay on every point, masks are prepared once per region
+                rays = RegionRays(reg_sm[i], other_regions, ls_list, junctions, ray_length=1000.0)
+                for pt, th, (intersec_edges, intersec_region, self_intersect) in zip(pts, ths, rays.cast(pts, ths)):
                     # closed region soft constraint -- upperbound
-                    intersec_edges, intersec_region, self_intersect = castRay(pt, th, ls_list, junctions, regions[i], reg_sm[i], other_regions, ray_length=1000.0)
                     # if self_intersect:
                     #     intersec_edges, intersec_region, self_intersect = castRay(pt, th, ls_list, junctions, regions[i], reg_sm[i], other_regions, ray_length=20.0)
-                    sum_in_set = LinExpr(0)
+                    sum_in_set = m.lin_expr()
                     for e in list(intersec_edges):
                         k, l = e
                         sum_in_set += ls_var_dict[(k, l)]
                     if not intersec_region:
-                        slack_var = m.addVar(vtype=GRB.INTEGER, name="slack_var_{}_{}".format(th, i))
-                        m.addConstr(sum_in_set*reg_var_ls[i] <= reg_var_ls[i] + slack_var, "r2_{}_{}".format(th, i))
+                        slack_var = m.add_var('integer', name=label("slack_var_{}_{}", th, i))
+                        m.add_region_upper_constr(sum_in_set, reg_var_ls[i], slack_var, label("r2_{}_{}", th, i))
                         obj -= closed_region_weight * slack_var
-                        m.addConstr(slack_var >= 0)
+                        m.add_constr(slack_var >= 0)
                     if True:
                         # closed region hard constraint -- lowerbound
-                        slack_var = m.addVar(vtype=GRB.INTEGER)
-                        m.addConstr(sum_in_set*reg_var_ls[i] >= reg_var_ls[i]-slack_var, "r2_{}".format(th))
+                        slack_var = m.add_var('integer')
+                        m.add_region_lower_constr(sum_in_set, reg_var_ls[i], slack_var, label("r2_{}", th))
                         obj -= closed_region_weight * slack_var
-                        m.addConstr(slack_var >= 0)
+                        m.add_constr(slack_var >= 0)
+        timer.lap('closed_region_rays')
         # Closed polygon constraint - End
 
         # Region intersection constraint - Start
         if region_intersection_constraint:
+            hit_raster = getLineRaster(junctions, width=1)
             for i in reg_list:
                 # compute 
-                for k, l in ls_list:
-                    intersec = getIntersection(reg_sm[i], junctions[k], junctions[l])
+                intersecs = hit_raster.overlap(reg_sm[i], ls_list)
+                for (k, l), intersec in zip(ls_list, intersecs):
                     if intersec >= region_hit_threshold:
                         
-                        slack_var_up = m.addVar(vtype=GRB.INTEGER)
-                        m.addConstr(ls_var_dict[(k, l)]*reg_var_ls[i] <= slack_var_up)
-                        m.addConstr(slack_var_up >= 0)
+                        slack_var_up = m.add_var('integer')
+                        m.add_region_hit_constr(ls_var_dict[(k, l)], reg_var_ls[i], slack_var_up)
+                        m.add_constr(slack_var_up >= 0)
                         obj -= intersection_slack_weight * slack_var_up
+        timer.lap('region_intersection')
         # Region intersection constraint - End
         
         # Shared edge constraint - Start
@@ -177,6 +193,8 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
                         for k, edge_msk in enumerate(shared_edges[(_id, i, j)]):
 
                             norm = compute_orientation(edge_msk)
+                            if norm is None:
+                                continue
                             n1, n2 = np.array((norm[0], norm[1])), np.array((norm[2], norm[3]))
 
                             inds = np.array(np.where(reg_sm[i] > 0))
@@ -195,45 +213,35 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
 
                             ## DEBUG ##
                             n_inter = 0
-                            sum_in_set = LinExpr(0)
-                            for j1, j2 in ls_list: 
-                                # print(getIntersection(edge_msk, junctions[j1], junctions[j2]))
-#                                 print(getIntersection(edge_msk, junctions[j1], junctions[j2], width=2))
-#                                 if getIntersection(edge_msk, junctions[j1], junctions[j2], width=4) > 0.5:
-#                                 print(norm)
-                                
-                                q1 = junctions[j1]
-                                q2 = junctions[j2]
-#                                 print(n1, n2, j1, j2)
-                                if doIntersect(n1, n2, q1, q2):
-                                    sum_in_set += ls_var_dict[(j1, j2)]
-                                    n_inter += 1
-                                    dr.line((n1[0], n1[1], n2[0], n2[1]), fill='green', width=2)
+                            sum_in_set = m.lin_expr()
+                            for e in ls_index.query(n1, n2):
+                                j1, j2 = ls_list[e]
+                                sum_in_set += ls_var_dict[(j1, j2)]
+                                n_inter += 1
+                                dr.line((n1[0], n1[1], n2[0], n2[1]), fill='green', width=2)
 
                             if n_inter > 0:
-                                slack_var_up = m.addVar(vtype=GRB.INTEGER, name="slack_var_inter_up_{}_{}_{}".format(_id, i, j))
-                                slack_var_low = m.addVar(vtype=GRB.INTEGER, name="slack_var_inter_low_{}_{}_{}".format(_id, i, j))
-                                m.addConstr(sum_in_set >= 1 - slack_var_low)
-                                m.addConstr(sum_in_set <= 1 + slack_var_up)
-                                m.addConstr(slack_var_low >= 0)
-                                m.addConstr(slack_var_up >= 0)
+                                slack_var_up = m.add_var('integer', name=label("slack_var_inter_up_{}_{}_{}", _id, i, j))
+                                slack_var_low = m.add_var('integer', name=label("slack_var_inter_low_{}_{}_{}", _id, i, j))
+                                m.add_constr(sum_in_set >= 1 - slack_var_low)
+                                m.add_constr(sum_in_set <= 1 + slack_var_up)
+                                m.add_constr(slack_var_low >= 0)
+                                m.add_constr(slack_var_up >= 0)
                                 obj -= inter_region_weight * slack_var_low + inter_region_weight * slack_var_up
 
             ## DEBUG ##
             deb_im = Image.fromarray(deb_im_arr.astype('uint8'))
             deb_im.save('/local-scratch2/nnauata/outdoor_project/results/dump/{}.jpg'.format(_id))
             ## DEBUG ##
+            timer.lap('shared_edges')
             # Shared edge constraint - End
             
     # edge intersection constraint
     if intersection_constraint:
-        for k, (j0, j1) in enumerate(ls_list):
-            for l, (j2, j3) in enumerate(ls_list):
-                if l > k:
-                    p1, q1 = junctions[j0], junctions[j1]
-                    p2, q2 = junctions[j2], junctions[j3]
-                    if doIntersect(p1, q1, p2, q2):
-                        m.addConstr(ls_var_dict[(j0, j1)]*ls_var_dict[(j2, j3)] == 0, "i_{}_{}_{}_{}".format(j0, j1, j2, j3))
+        for k, l in ls_index.pairs():
+            (j0, j1), (j2, j3) = ls_list[k], ls_list[l]
+            m.add_exclusive_constr(ls_var_dict[(j0, j1)], ls_var_dict[(j2, j3)], label("i_{}_{}_{}_{}", j0, j1, j2, j3))
+        timer.lap('intersection')
 
     
     if coner_to_edge_constraint:
@@ -244,7 +252,7 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
             # if len(thetas[j1]) >= 2:
 
             # create list of lines for each junction
-            lines_sets = [LinExpr(0) for _ in range(len(thetas[j1])+1)]
+            lines_sets = [m.lin_expr() for _ in range(len(thetas[j1])+1)]
             lines_sets_deb = [list() for _ in range(len(thetas[j1])+1)]
             lines_max_in_sets = [0.0 for _ in range(len(thetas[j1])+1)]
             for j2 in js_list:
@@ -253,27 +261,27 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
                     # get line var
                     if (j1, j2) in ls_var_dict:
                         ls_var = ls_var_dict[(j1, j2)]  
-                    else:
+                    elif (j2, j1) in ls_var_dict:
                         ls_var = ls_var_dict[(j2, j1)]
+                    else:
+                        # pruned edge
+                        continue
 
                     # check each line angle at junction
                     in_sets = False
                     for i, a in enumerate(thetas[j1]):
 
-                        lb = (a-angle_thresh) if (a-angle_thresh) >= 0 else 360.0+(a-angle_thresh)
-                        up = (a+angle_thresh)%360.0
-
                         pt1 = junctions[j1]
                         pt2 = junctions[j2]
                         ajl = getAngle(pt1, pt2)
-                        if inBetween(ajl, lb, up):
+                        if inAngleSet(ajl, a, angle_thresh):
                             if use_edge_classifier:
                                 try:
                                     lw = lw_from_cls[(j1, j2)]
                                 except:
                                     lw = lw_from_cls[(j2, j1)]
                             else:
-                                lw = getLineWeight(edge_map, pt1, pt2) 
+                                lw = lw_dict[(j1, j2)] if (j1, j2) in lw_dict else lw_dict[(j2, j1)]
                             lines_max_in_sets[i] = max(lines_max_in_sets[i], lw)
                             lines_sets[i] += ls_var
                             in_sets = True
@@ -308,27 +316,28 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
             for i in range(len(thetas[j1])):
 
                 if use_junctions_with_var:
-                    junc_th_var = m.addVar(vtype = GRB.BINARY, name="angle_{}".format(j1))
-                    obj += junctions_weight*junc_th_var*(np.prod([corner_confs[j1], theta_confs[j1][i]]) - theta_threshold)
-                    m.addConstr(lines_sets[i] == junc_th_var, "a_{}_{}".format(i, j1))
+                    junc_th_var = m.add_var('binary', name=label("angle_{}", j1))
+                    obj_terms['junctions_weight'] += junc_th_var*(np.prod([corner_confs[j1], theta_confs[j1][i]]) - theta_threshold)
+                    m.add_constr(lines_sets[i] == junc_th_var, label("a_{}_{}", i, j1))
                     #  OLD
                     #obj += (np.prod([lines_max_in_sets[i], theta_confs[j1][i]])-theta_threshold)*junc_th_var
                     #set_sum += junc_th_var*lines_sets[i]
                     #m.addConstr(lines_sets[i] <= 1.0, "a_{}_{}".format(i, j1))
                 else:
-                    m.addConstr(lines_sets[i] <= 1.0, "a_{}_{}".format(i, j1))
+                    m.add_constr(lines_sets[i] <= 1.0, label("a_{}_{}", i, j1))
                     #  OLD
                     #set_sum += junc_th_var*lines_sets[i]
 
             # # add not in set -- SOFT
             if junctions_soft:
-                slack_var = m.addVar(vtype=GRB.INTEGER, name="slack_var_{}".format(j1))
-                m.addConstr(lines_sets[-1] - slack_var == 0, "a_{}_{}".format(-1, j1))
+                slack_var = m.add_var('integer', name=label("slack_var_{}", j1))
+                m.add_constr(lines_sets[-1] - slack_var == 0, label("a_{}_{}", -1, j1))
                 obj -= wrong_dir_weight * slack_var
-                m.addConstr(slack_var >= 0)
+                m.add_constr(slack_var >= 0)
             else:
                 # add not in set -- HARD
-                m.addConstr(lines_sets[-1] == 0, "a_{}_{}".format(-1, j1))
+                m.add_constr(lines_sets[-1] == 0, label("a_{}_{}", -1, j1))
+        timer.lap('corner_to_edge')
 
     # junction spatial constraint
     if corner_suppression:
@@ -346,47 +355,148 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
 
         # avoid duplicated constraints
         for js_tuple in junc_sets:
-            junc_expr = LinExpr(0)
+            junc_expr = m.lin_expr()
             for j in np.array(js_tuple):
                 junc_expr += js_var_dict[j]
-            m.addConstr(junc_expr <= 1, "s_{}".format(j1))
+            m.add_constr(junc_expr <= 1, label("s_{}", j1))
 
     # degree constraint
     if corner_min_degree_constraint:
         for j in js_list:
 
             # degree expression
-            deg_j = QuadExpr(0)
+            deg_j = m.lin_expr()
             for k, l in ls_list:
                 if (j == k) or (j == l):
                     deg_j += ls_var_dict[(k, l)]
 
             # degree constraint - active junctions must have degree >= 2
-            m.addConstr(deg_j*js_var_dict[j] >= 2*js_var_dict[j], "d_1_{}".format(j))
+            m.add_min_degree_constr(deg_j, js_var_dict[j], 2, label("d_1_{}", j))
+    timer.lap('other_constraints')
 
     # set optimizer
-    m.setObjective(obj, GRB.MAXIMIZE)
+    weights = {'region_weight': region_weight, 'edge_map_weight': edge_map_weight, 'junctions_weight': junctions_weight}
+    m.set_objective(obj + sum(weights[w]*obj_terms[w] for w in sorted(obj_terms)))
+    timer.lap('model')
+    # a deadline (time.time()) charges the model building to the solver time
+    if deadline is not None:
+        time_limit = max(deadline-time.time(), 0.0)
+    if time_limit is not None:
+        m.set_time_limit(time_limit)
+    m.optimize()
+    timer.lap('optimize')
+
+    # keep the model resident for resolveBuilding
+    handles = {'junc': js_var_dict if with_corner_variables else {}, 'line': ls_var_dict, 'reg': reg_var_ls if use_regions else {}}
+    parse_args = dict(handles=handles, junctions=junctions, regions=regions, with_corner_variables=with_corner_variables, \
+        use_regions=use_regions, post_process=post_process, filter_size=filter_size, region_prep=region_prep)
+    if keep_model is not None:
+        keep_model.update({'m': m, 'obj': obj, 'obj_terms': obj_terms, 'weights': weights, 'parse_args': parse_args})
+
+    solution = parseSolution(m, **parse_args)
+    timer.lap('parse')
+    if stats is not None:
+        stats.update({'_id': _id, 'solver': m.name, 'time_limit': time_limit})
+        stats.update(m.get_stats())
+        stats.update(timer.record())
+        stats['num_junctions'] = len(js_list)
+        stats['num_regions'] = len(reg_list) if use_regions else 0
+        stats['num_candidate_edges'] = num_candidates
+        stats['num_pruned_edges'] = num_candidates-len(ls_list)
+    return solution
+
+def resolveBuilding(model, stats=None, time_limit=None, **weights):
+    """Re-solve a model kept by reconstructBuilding(keep_model={}) with new objective weights, warm-started from the previous solution."""
+    m = model['m']
+    for w in weights:
+        if w not in model['obj_terms']:
+            raise ValueError('unknown objective weight: {}'.format(w))
+    model['weights'].update(weights)
+    timer = PhaseTimer()
+    m.set_start()
+    m.set_objective(model['obj'] + sum(model['weights'][w]*model['obj_terms'][w] for w in sorted(model['obj_terms'])))
+    if time_limit is not None:
+        m.set_time_limit(time_limit)
+    timer.lap('model')
     m.optimize()
+    timer.lap('optimize')
+    solution = parseSolution(m, **model['parse_args'])
+    timer.lap('parse')
+    if stats is not None:
+        stats['solver'] = m.name
+        stats.update(m.get_stats())
+        stats.update(timer.record())
+    return solution
+
+# formulations tried in order by reconstructBuildingWithBudget, each one drops more of the model
+BUDGET_TIERS = [
+    ('full', {}),
+    ('no_closed_region', {'closed_region_constraint': False}),
+    ('no_intersection', {'intersection_constraint': False}),
+    ('baseline', {'use_regions': False, 'region_intersection_constraint': False, 'shared_edges': None, \
+        'coner_to_edge_constraint': False, 'corner_min_degree_constraint': False, 'corner_suppression': False}),
+]
+
+def reconstructBuildingWithBudget(junctions, edge_map, time_budget, fallback_share=0.2, stats=None, **kwargs):
+    """reconstructBuilding(**kwargs) within time_budget seconds of wall time, falling back to the
+    cheaper BUDGET_TIERS when a tier ends without a solution (stats: fallback_tier, tiers, budget_time)."""
+    start = time.time()
+    end = start+time_budget
+
+    # tiers that change the model, the first one keeps 1-fallback_share of the budget
+    plan, config = [], dict(kwargs)
+    for k, (tier, overrides) in enumerate(BUDGET_TIERS):
+        if k > 0 and all(config.get(key) is None or config.get(key) is False for key in overrides):
+            continue
+        config = dict(config, **overrides)
+        plan.append((tier, config))
+    tiers = []
+    for k, (tier, config) in enumerate(plan):
+        now = time.time()
+        if k > 0 and now >= end:
+            break
+
+        # fallback tiers split what is left
+        if k == 0 and len(plan) > 1:
+            deadline = start+(1.0-fallback_share)*time_budget
+        else:
+            deadline = now+(end-now)/(len(plan)-k)
+        tier_stats = {}
+        solution = reconstructBuilding(junctions, edge_map, deadline=deadline, stats=tier_stats, **config)
+        use_regions = config.get('use_regions')
+        tiers.append('{}:{}'.format(tier, tier_stats['status']))
+        if tier_stats['sol_count'] > 0:
+            break
 
-    # parse solution
-    juncs_on = []
-    lines_on = []
+    # the baseline has no region variables, no region is on
+    if kwargs.get('use_regions') and not use_regions:
+        solution = solution+([],)
+    if stats is not None:
+        stats.update(tier_stats)
+        stats['fallback_tier'] = tier if tier_stats['sol_count'] > 0 else 'empty'
+        stats['time_limit_reached'] = tier_stats['status'] == 'time_limit'
+        stats['tiers'] = ','.join(tiers)
+        stats['budget_time'] = time.time()-start
+    return solution
+
+def parseSolution(m, handles, junctions, regions, with_corner_variables, use_regions, post_process, filter_size=11, region_prep=None):
+
+    # parse solution - values of the junction, line and region variables (handles, by
+    # corner, edge and region index, in creation order) read in one call
+    kinds = ['junc', 'line', 'reg']
+    values = m.get_var_values([var for kind in kinds for var in handles[kind].values()])
+    on, start = {}, 0
+    for kind in kinds:
+        keys = list(handles[kind].keys())
+        on[kind] = [key for key, x in zip(keys, values[start:start+len(keys)]) if x >= .5]
+        start += len(keys)
+    juncs_on = on['junc']
+    lines_on = on['line']
     regs_sm_on = []
-    for v in m.getVars():
-        if 'junc' in v.varName and v.x >= .5:
-            juncs_on.append(int(v.varName.split('_')[-1]))
-        elif 'line' in v.varName and v.x >= .5:
-            lines_on.append((int(v.varName.split('_')[-2]), int(v.varName.split('_')[-1])))
-        elif 'reg' in v.varName and v.x >= .5:
-            #print('REGION ON')
-            reg_id = int(v.varName.split('_')[-1])
-            reg = regions[reg_id]
-            reg_small = Image.fromarray(reg*255.0)
-            reg_small = reg_small.filter(ImageFilter.MinFilter(filter_size))
-            regs_sm_on.append(reg_small)
-        elif 'slack_var_inter' in v.varName:
-            continue
-            # print(v.varName, v.x)
+    if len(on['reg']) > 0 and region_prep is None:
+        region_prep = PreparedRegions(regions, filter_size)
+    for reg_id in on['reg']:
+        regs_sm_on.append(region_prep.eroded_image(reg_id))
 
     if not with_corner_variables:
         juncs_on = np.array(list(set(sum(lines_on, ()))))
@@ -405,97 +515,111 @@ def reconstructBuilding(junctions, edge_map, regions=None, with_weighted_junctio
 ############################################ HELPER FUNCTIONS ############################################
 ##########################################################################################################
 
-def remove_junctions(junctions, juncs_on, lines_on, delta=10.0):
+class PhaseTimer():
+    """Wall time of the phases of one reconstructBuilding or resolveBuilding call."""
+    phases = ['model', 'region_preprocessing', 'closed_region_rays', 'region_intersection', 'shared_edges', \
+        'intersection', 'corner_to_edge', 'other_constraints', 'optimize', 'parse']
 
-    curr_juncs_on, curr_lines_on = list(juncs_on), list(lines_on)
-    while True:
-        new_lines_on, new_juncs_on = [], []
-        is_mod = False
-        for j1 in curr_juncs_on:
-            adj_js, adj_as, ls = [], [], []
-            for j2 in curr_juncs_on:
-                if ((j1, j2) in curr_lines_on) or ((j2, j1) in curr_lines_on):
-                    adj_js.append(j2)
-                    pt1 = junctions[j1]
-                    pt2 = junctions[j2]
-                    adj_as.append(getAngle(pt1, pt2))
-                    ls.append((j1, j2))
-
-            if len(adj_js) > 2 or is_mod or len(adj_js) == 1:
-                new_juncs_on.append(j1)
-                new_lines_on += ls
-            elif len(adj_js) == 2:
-                diff = np.abs(180.0-np.abs(adj_as[0]-adj_as[1]))
-                if diff >= delta:
-                    new_juncs_on.append(j1)
-                    new_lines_on += ls
-                else:
-                    new_lines_on.append((adj_js[0], adj_js[1]))
-                    is_mod = True
-        curr_juncs_on, curr_lines_on = list(new_juncs_on), list(new_lines_on)
-        if not is_mod:
-            break
+    def __init__(self):
+        self.times = dict((phase, 0.0) for phase in self.phases)
+        self.last = time.time()
 
-    # clean repeated edges
-    clean_lines_on = []
-    for j1, j2 in curr_lines_on:
-        in_list = False
-        for j3, j4 in clean_lines_on:
-            if (j1 == j3 and j2 == j4) or (j1 == j4 and j2 == j3):
-                  in_list = True
-        if not in_list:
-            clean_lines_on.append((j1, j2))
+    def lap(self, phase):
+        now = time.time()
+        self.times[phase] += now-self.last
+        self.last = now
 
+    def record(self):
+        # time_<phase> for every phase and time_total
+        record = dict(('time_{}'.format(phase), self.times[phase]) for phase in self.phases)
+        record['time_total'] = sum(self.times.values())
+        return record
+
+def remove_junctions(junctions, juncs_on, lines_on, delta=10.0):
+
+    # the first junction (in juncs_on order) of degree 2 whose edges are within delta degrees
+    # of collinear is replaced by an edge between its neighbours, until there is none; only
+    # the two neighbours need to be checked again
+    juncs = list(juncs_on)
+    rank = {j: r for r, j in enumerate(juncs)}
+    adj = {j: set() for j in juncs}
+    for j1, j2 in lines_on:
+        if j1 in rank and j2 in rank:
+            j1, j2 = juncs[rank[j1]], juncs[rank[j2]]
+            adj[j1].add(j2)
+            adj[j2].add(j1)
+
+    def neighbours(j):
+        return sorted(adj[j], key=rank.get)
+
+    def collinear(j):
+        if len(adj[j]) != 2:
+            return False
+        a1, a2 = [getAngle(junctions[j], junctions[n]) for n in neighbours(j)]
+        return np.abs(180.0-np.abs(a1-a2)) < delta
+
+    queue = [rank[j] for j in juncs if collinear(j)]
+    heapq.heapify(queue)
+    while len(queue) > 0:
+        j = juncs[heapq.heappop(queue)]
+        if j not in adj or not collinear(j):
+            continue
+        n1, n2 = neighbours(j)
+        for n in (n1, n2):
+            adj[n].discard(j)
+        del adj[j]
+        if n1 in adj and n2 in adj:
+            adj[n1].add(n2)
+            adj[n2].add(n1)
+            for n in (n1, n2):
+                if collinear(n):
+                    heapq.heappush(queue, rank[n])
+
+    # junctions left with edges, each edge once from its first junction
+    curr_juncs_on = [j for j in juncs if j in adj and len(adj[j]) > 0]
+    clean_lines_on = [(j1, j2) for j1 in curr_juncs_on for j2 in neighbours(j1) if rank[j2] >= rank[j1]]
     return curr_juncs_on, clean_lines_on
 
+_orientation_raster = None
+
+def getOrientationRaster():
+
+    # width-4 lines through the image center, one per degree, drawn once
+    global _orientation_raster
+    if _orientation_raster is None:
+        ends = []
+        for an in range(360):
+            rad = np.radians(an)
+            dy = np.sin(rad)*100.0
+            dx = np.cos(rad)*100.0
+            ends += [(127+dx, 127+dy), (127-dx, 127-dy)]
+        _orientation_raster = LineRaster(ends, [(2*an, 2*an+1) for an in range(360)], width=4)
+    return _orientation_raster
+
 def compute_orientation(edge_mask, imsize=256):
 
-	inds = np.array(np.where(edge_mask>0))
-	y, x = np.mean(inds, -1)
-
-# 	deb_im = Image.fromarray(edge_mask*255).convert('RGB')
-# 	dr = ImageDraw.Draw(deb_im)
-# 	dr.ellipse((x-2, y-2, x+2, y+2), fill='red')
-# 	deb_im.save('./debug_cm.jpg')
-	deltas = 127-np.mean(inds, -1)[:, np.newaxis]
-
-	new_inds = (inds+deltas).astype('int')
-	centralized_edge_mask = np.zeros_like(edge_mask)
-	centralized_edge_mask[new_inds[0, :], new_inds[1, :]] = 1.0
-	centralized_edge_mask = Image.fromarray((centralized_edge_mask*255).astype('uint8'))
-
-	max_inliers = 0.0
-	best_angle = None
-	best_norm = None
-	for an in range(360):
-		rad = np.radians(an)
-		dy = np.sin(rad)*100.0
-		dx = np.cos(rad)*100.0
-		x0, y0 = 127+dx, 127+dy
-		x1, y1 = 127-dx, 127-dy
-
-		intersec = getIntersection(centralized_edge_mask, (x0, y0), (x1, y1), width=4)
-		if intersec > max_inliers:
-			max_inliers = intersec
-			best_angle = (int(x0), int(y0), int(x1), int(y1))
-			rad = np.radians(an+90.0)
-			dy = np.sin(rad)*8.0
-			dx = np.cos(rad)*8.0
-			x0, y0 = 127+dx, 127+dy
-			x1, y1 = 127-dx, 127-dy
-			best_norm = (int(x0), int(y0), int(x1), int(y1))
-
-# 	centralized_edge_mask = centralized_edge_mask.convert('RGB')
-# 	dr = ImageDraw.Draw(deb_im)
-# 	best_angle = (best_angle[0]-deltas[1], best_angle[1]-deltas[0], best_angle[2]-deltas[1], best_angle[3]-deltas[0])
-# 	dr.line(best_angle, fill='green', width=4)
-	best_norm = (best_norm[0]-deltas[1], best_norm[1]-deltas[0], best_norm[2]-deltas[1], best_norm[3]-deltas[0])
-# 	dr.line(best_norm, fill='magenta', width=1)
-# 	dr.ellipse((125, 125, 129, 129), fill='blue', width=4)
-# 	deb_im.save('./debug_best_angle.jpg')
-# 	print('HUE')
-
-	return best_norm
+    # the 360 lines through the centered mask are scored in one pass, None without inliers
+    inds = np.array(np.where(edge_mask>0))
+    if inds.shape[1] == 0:
+        return None
+    deltas = 127-np.mean(inds, -1)[:, np.newaxis]
+    new_inds = (inds+deltas).astype('int')
+    centralized_edge_mask = np.zeros_like(edge_mask)
+    centralized_edge_mask[new_inds[0, :], new_inds[1, :]] = 1.0
+    centralized_edge_mask = (centralized_edge_mask*255).astype('uint8')
+
+    # first angle with the most inliers
+    inliers = getOrientationRaster().overlap(centralized_edge_mask)
+    an = int(np.argmax(inliers))
+    if not inliers[an] > 0.0:
+        return None
+    rad = np.radians(an+90.0)
+    dy = np.sin(rad)*8.0
+    dx = np.cos(rad)*8.0
+    x0, y0 = 127+dx, 127+dy
+    x1, y1 = 127-dx, 127-dy
+    best_norm = (int(x0), int(y0), int(x1), int(y1))
+    return (best_norm[0]-deltas[1], best_norm[1]-deltas[0], best_norm[2]-deltas[1], best_norm[3]-deltas[0])
 
 # 	for k in range(360):
 
@@ -509,58 +633,57 @@ def compute_orientation(edge_mask, imsize=256):
 #         x1, y1 = p2
 # 	return
 
-def compute_normals(contour, reg_sm):
-
-    # deb = Image.fromarray(reg_sm*255.0).convert('RGB')
-    # dr = ImageDraw.Draw(deb)
-    thetas = []
-    points = []
-    p1 = contour[-1]
-    for k, p2 in enumerate(contour):
-
-        # compute ray
-        p3 = contour[(k+1)%contour.shape[0]]
-        a21 = getAngle(p2, p1)
-        a23 = getAngle(p2, p3)
-        an = (a21+a23)/2.0
-        ray_im = Image.new('L', (256, 256))
-        draw = ImageDraw.Draw(ray_im)
-        x1, y1 = p2
-        rad = np.radians(an)
-        dy = np.sin(rad)*10.0
-        dx = np.cos(rad)*10.0
-        x2, y2 = x1+dx, y1+dy
-        draw.line((x1, y1, x2, y2), fill='white')
-        ray = np.array(ray_im)/255.0
-        intersect = np.logical_and(ray, reg_sm).sum()/(ray.sum()+1e-8)
-        if intersect > 0.2:
-            an = (an+180)%360
-        thetas.append(an)
-        points.append(p2)
-
-        # # debug
-        # x1, y1 = p2
-        # rad = np.radians(an)
-        # dy = np.sin(rad)*10.0
-        # dx = np.cos(rad)*10.0
-        # x2, y2 = x1+dx, y1+dy
-        
-        # x3, y3 = p3
-        # x4, y4 = p1
-        # print(intersect)
-        # # dr.ellipse((x4-1, y4-1, x4+1, y4+1), fill='blue')
-        # # dr.ellipse((x3-1, y3-1, x3+1, y3+1), fill='blue')
-        # dr.ellipse((x1-1, y1-1, x1+1, y1+1), fill='red')
-        # dr.line((x1, y1, x2, y2), fill='green')
-        # # debug
-
-        p1 = np.array(p2)
-
-    # plt.imshow(deb)
-    # plt.show()
-    return thetas, points
-
-def castRayRegion(pt, th, ls_list, junctions, sm_reg_i, sm_other_regs, l_reg, l_other_regs, other_regs_id, ray_length=1000.0, thresh=0.0):
+_ray_pixels = {}
+
+def getRayPixels(dx, dy):
+
+    # (x, y) offsets of a width-1 PIL line from (0, 0) to (dx, dy), integer end points
+    # are drawn the same wherever the line starts, up to the image border
+    if (dx, dy) not in _ray_pixels:
+        r = max(abs(dx), abs(dy))
+        ray_im = Image.new('L', (2*r+1, 2*r+1))
+        ImageDraw.Draw(ray_im).line((r, r, r+dx, r+dy), fill='white')
+        ys, xs = np.nonzero(np.array(ray_im))
+        _ray_pixels[(dx, dy)] = np.stack([xs-r, ys-r], -1)
+    return _ray_pixels[(dx, dy)]
+
+def compute_normals(contour, reg_sm, density=1.0):
+
+    # keep an evenly spaced fraction of the contour points, one normal per point
+    contour = sample_contour(contour, density)
+    if contour.shape[0] == 0:
+        return [], []
+
+    # bisector of the angles to the previous and next points, as getAngle
+    p2 = contour
+    p1 = np.roll(contour, 1, 0)
+    p3 = np.roll(contour, -1, 0)
+    def angles(pt1, pt2):
+        d = (pt2-pt1).astype('float64')
+        d = d/(np.sqrt(np.sum(d*d, -1))+1e-8)[:, np.newaxis]
+        ang = np.degrees(np.arctan2(-d[:, 1], d[:, 0]))
+        ang = np.where(ang < 0, (ang+360)%360, ang)
+        return 360-ang
+    an = (angles(p2, p1)+angles(p2, p3))/2.0
+
+    # 10px rays along the bisectors, drawn as in PIL from the truncated end points
+    rad = np.radians(an)
+    ends = np.trunc(p2+np.stack([np.cos(rad)*10.0, np.sin(rad)*10.0], -1)).astype('int64')
+    offsets = [getRayPixels(int(dx), int(dy)) for dx, dy in ends-p2]
+    ids = np.repeat(np.arange(len(offsets)), [o.shape[0] for o in offsets])
+    pix = p2[ids]+np.concatenate(offsets)
+    h, w = reg_sm.shape[:2]
+    valid = (pix[:, 0] >= 0) & (pix[:, 0] < w) & (pix[:, 1] >= 0) & (pix[:, 1] < h)
+    ids, pix = ids[valid], pix[valid]
+
+    # rays mostly inside the region are flipped outwards
+    n = contour.shape[0]
+    inside = np.bincount(ids, weights=np.asarray(reg_sm)[pix[:, 1], pix[:, 0]] != 0, minlength=n)
+    intersect = inside/(np.bincount(ids, minlength=n)+1e-8)
+    an = np.where(intersect > 0.2, (an+180)%360, an)
+    return list(an), list(p2)
+
+def castRayRegion(pt, th, ls_list, junctions, sm_reg_i, sm_other_regs, l_reg, l_other_regs, other_regs_id, ray_length=1000.0, thresh=0.0, ls_index=None):
 
     # compute ray
     x1, y1 = int(pt[0]), int(pt[1])
@@ -613,11 +736,10 @@ def castRayRegion(pt, th, ls_list, junctions, sm_reg_i, sm_other_regs, l_reg, l_
         xc, yc = closest_pt
 
         # collect intersecting edges
-        for i, ls in enumerate(ls_list):
-            k, l = ls
-            p2, q2 = junctions[k], junctions[l]
-            if doIntersect(p1, closest_pt, p2, q2):
-                intersec_set.add((k, l))
+        if ls_index is None:
+            ls_index = SegmentIndex([junctions[k] for k, l in ls_list], [junctions[l] for k, l in ls_list])
+        for i in ls_index.query(p1, closest_pt):
+            intersec_set.add(tuple(ls_list[i]))
 
         # DEBUG -- Draw intersecting edges
         for ls in list(intersec_set):
@@ -673,36 +795,35 @@ def castRayRegion(pt, th, ls_list, junctions, sm_reg_i, sm_other_regs, l_reg, l_
 
     return intersec_set, region_id, self_intersect
 
-def castRayBetweenRegions(p1, q1, ls_list, junctions, reg_i, reg_j):
+def castRayBetweenRegions(p1, q1, ls_list, junctions, reg_i, reg_j, ls_index=None):
 
     # collect intersecting edges
+    if ls_index is None:
+        ls_index = SegmentIndex([junctions[k] for k, l in ls_list], [junctions[l] for k, l in ls_list])
     intersec_set = set()
-    for i, ls in enumerate(ls_list):
-        k, l = ls
-        p2, q2 = junctions[k], junctions[l]
-        if doIntersect(p1, q1, p2, q2):
-            intersec_set.add((k, l))
-            # print(k, l)
-            # print(intersec_set)            
-            # # DEBUG
-            # comb_reg = np.stack([reg_i, reg_j])
-            # comb_reg = np.clip(np.sum(comb_reg, 0), 0, 1)
-            # comb_reg = Image.fromarray(comb_reg*255.0).convert('RGB')
-            # dr = ImageDraw.Draw(comb_reg)
-            # x1, y1 = p1
-            # x2, y2 = q1
-            # x3, y3 = p2
-            # x4, y4 = q2
-            # dr.line((x1, y1, x2, y2), fill='green', width=4) 
-            # dr.line((x3, y3, x4, y4), fill='red', width=1) 
-            # print(doIntersect(p1, q1, p2, q2))
-            # plt.figure()
-            # plt.imshow(comb_reg)
-            # plt.show()
+    for i in ls_index.query(p1, q1):
+        intersec_set.add(tuple(ls_list[i]))
+        # print(k, l)
+        # print(intersec_set)            
+        # # DEBUG
+        # comb_reg = np.stack([reg_i, reg_j])
+        # comb_reg = np.clip(np.sum(comb_reg, 0), 0, 1)
+        # comb_reg = Image.fromarray(comb_reg*255.0).convert('RGB')
+        # dr = ImageDraw.Draw(comb_reg)
+        # x1, y1 = p1
+        # x2, y2 = q1
+        # x3, y3 = p2
+        # x4, y4 = q2
+        # dr.line((x1, y1, x2, y2), fill='green', width=4) 
+        # dr.line((x3, y3, x4, y4), fill='red', width=1) 
+        # print(doIntersect(p1, q1, p2, q2))
+        # plt.figure()
+        # plt.imshow(comb_reg)
+        # plt.show()
         
     return intersec_set
 
-def castRay(pt, th, ls_list, junctions, large_region, region_small, other_regions, ray_length=1000.0, thresh=0.0):
+def castRay(pt, th, ls_list, junctions, large_region, region_small, other_regions, ray_length=1000.0, thresh=0.0, ls_index=None):
 
     # compute ray
     x1, y1 = int(pt[0]), int(pt[1])
@@ -712,13 +833,11 @@ def castRay(pt, th, ls_list, junctions, large_region, region_small, other_region
     x2, y2 = x1+dx, y1+dy
 
     # collect intersecting edges
+    if ls_index is None:
+        ls_index = SegmentIndex([junctions[k] for k, l in ls_list], [junctions[l] for k, l in ls_list])
     intersec_set = set()
-    for i, ls in enumerate(ls_list):
-        k, l = ls
-        p1, q1 = (x1, y1), (x2, y2)
-        p2, q2 = junctions[k], junctions[l]
-        if doIntersect(p1, q1, p2, q2):
-            intersec_set.add((k, l))
+    for i in ls_index.query((x1, y1), (x2, y2)):
+        intersec_set.add(tuple(ls_list[i]))
 
     # # DEBUG
     # deb = Image.fromarray(region_small*255.0).convert('RGB')
@@ -879,92 +998,32 @@ def inBetween(n, a, b):
         return a <= n and n <= b
     return a <= n or n <= b
 
-def castRay(pt, th, ls_list, junctions, large_region, region_small, other_regions, ray_length=1000.0, thresh=0.0):
-
-    # compute ray
-    x1, y1 = int(pt[0]), int(pt[1])
-    rad = np.radians(th)
-    dy = np.sin(rad)*ray_length
-    dx = np.cos(rad)*ray_length
-    x2, y2 = x1+dx, y1+dy
+def inAngleSet(ajl, a, angle_thresh):
+    # line angle within angle_thresh of the junction angle a
+    lb = (a-angle_thresh) if (a-angle_thresh) >= 0 else 360.0+(a-angle_thresh)
+    up = (a+angle_thresh)%360.0
+    return inBetween(ajl, lb, up)
 
-    # collect intersecting edges
-    intersec_set = set()
-    for i, ls in enumerate(ls_list):
-        k, l = ls
-        p1, q1 = (x1, y1), (x2, y2)
-        p2, q2 = junctions[k], junctions[l]
-        if doIntersect(p1, q1, p2, q2):
-            intersec_set.add((k, l))
+def pruneEdges(ls_list, junctions, thetas=None, angle_thresh=None, line_weights=None, min_line_weight=None, min_length=None):
 
-    # # DEBUG
-    # deb = Image.fromarray(region_small*255.0).convert('RGB')
-    # dr = ImageDraw.Draw(deb) 
-    # for ls in list(intersec_set):
-    #     k, l = ls
-    #     p2, q2 = junctions[k], junctions[l]
-    #     x3, y3 = p2
-    #     x4, y4 = q2
-    #     dr.line((x3, y3, x4, y4), fill='red', width=1)
-    # dr.line((x1, y1, x2, y2), fill='green', width=4)
-    # plt.imshow(deb)
-    # plt.show()
-    
-
-    # check intersection with other regions
-    intersec_region = False
-    if len(other_regions) > 0:
-        comb_reg = np.clip(np.sum(np.array(other_regions), 0), 0, 1)
-
-        # cast ray
-        ray_im = Image.new('L', (256, 256))
-        dr = ImageDraw.Draw(ray_im) 
-        dr.line((x1, y1, x2, y2), fill='white', width=8)
-        ray = np.array(ray_im)/255.0
-        intersec = np.array(np.where(np.logical_and(ray, comb_reg)>0))
-        intersec_region = (intersec.shape[1] > 0)
-        
-        # # DEBUG
-        # print(comb_reg.shape)
-        # comb_reg = Image.fromarray(comb_reg*255.0).convert('RGB')
-        # dr = ImageDraw.Draw(comb_reg) 
-        # dr.line((x1, y1, x2, y2), fill='green', width=4)
-
-        # print(intersec)
-        # print(intersec_region)
-        # plt.figure()
-        # plt.imshow(comb_reg)
-        # plt.show()
-    
-    # check self intersection
-    ray_im = Image.new('L', (256, 256))
-    dr = ImageDraw.Draw(ray_im) 
-    dr.line((x1, y1, x2, y2), fill='white', width=8)
-    dr.ellipse((x1-4, y1-4, x1+4, y1+4), fill='black')
-    ray = np.array(ray_im)/255.0
-    self_intersect = np.logical_and(ray, region_small).sum()/(ray.sum()+1e-8)
-    self_inter = False
-    if self_intersect > thresh:
-        intersec_region = True
-        self_inter = True
-    # # DEBUG
-    # print(self_intersect)
-    # deb = Image.fromarray(region_small*255.0).convert('RGB')
-    # dr = ImageDraw.Draw(deb) 
-    # # for k, l in list(intersec_set):
-    # #     p2, q2 = junctions[k], junctions[l]
-    # #     x3, y3 = p2
-    # #     x4, y4 = q2
-    # #     dr.line((x3, y3, x4, y4), fill='red', width=1)
-
-    # print(intersec_region)
-
-    # dr.line((x1, y1, x2, y2), fill='green', width=1)
-    # plt.imshow(deb)
-    # plt.show()
-    # # DEBUG
+    # drop edges out of every angle set at either end (same test as the
+    # corner-to-edge constraint), too weak or too short
+    new_ls_list = []
+    for n, (j1, j2) in enumerate(ls_list):
+        pt1 = junctions[j1]
+        pt2 = junctions[j2]
+        if thetas is not None:
+            if not any(inAngleSet(getAngle(pt1, pt2), a, angle_thresh) for a in thetas[j1]):
+                continue
+            if not any(inAngleSet(getAngle(pt2, pt1), a, angle_thresh) for a in thetas[j2]):
+                continue
+        if min_line_weight is not None and not line_weights[n] >= min_line_weight:
+            continue
+        if min_length is not None and np.linalg.norm(np.array(pt1)-np.array(pt2)) < min_length:
+            continue
+        new_ls_list.append((j1, j2))
 
-    return intersec_set, intersec_region, self_inter
+    return new_ls_list
 
 def filterOutlineEdges(ls_list, junctions, angles, angle_thresh):
 
@@ -0,0 +1,81 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+class LineRaster():
+    """Pixel indices of the PIL lines between junction pairs, to score all pairs against a map at once."""
+    def __init__(self, junctions, pairs=(), width=1, imsize=256):
+        self.junctions = np.array(junctions)
+        self.width = width
+        self.imsize = imsize
+        self.pairs = []
+        self.pair_index = {}
+        self.pix = np.zeros(0, dtype='int64')
+        self.ids = np.zeros(0, dtype='int64')
+        self.counts = np.zeros(0, dtype='int64')
+        self.add(pairs)
+
+    def add(self, pairs):
+
+        # rasterize only pairs not seen yet
+        new_pairs = [tuple(pair) for pair in pairs if tuple(pair) not in self.pair_index]
+        if len(new_pairs) == 0:
+            return
+
+        # draw on a shared canvas and only read back the line bounding box
+        im = Image.new('L', (self.imsize, self.imsize))
+        dr = ImageDraw.Draw(im)
+        pad = self.width + 2
+        pix, ids, counts = [], [], []
+        for pair in new_pairs:
+            k, l = pair
+            x1, y1 = self.junctions[k]
+            x2, y2 = self.junctions[l]
+            box = (max(int(np.floor(min(x1, x2)))-pad, 0), max(int(np.floor(min(y1, y2)))-pad, 0), \
+                min(int(np.ceil(max(x1, x2)))+pad, self.imsize), min(int(np.ceil(max(y1, y2)))+pad, self.imsize))
+            dr.line((x1, y1, x2, y2), width=self.width, fill='white')
+            if box[2] > box[0] and box[3] > box[1]:
+                crop = np.array(im.crop(box))
+                ys, xs = np.nonzero(crop)
+                dr.rectangle(box, fill=0)
+            else:
+                ys, xs = np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+            self.pair_index[pair] = len(self.pairs)
+            self.pairs.append(pair)
+            pix.append((ys+box[1])*self.imsize + (xs+box[0]))
+            ids.append(np.full(ys.shape[0], self.pair_index[pair], dtype='int64'))
+            counts.append(ys.shape[0])
+
+        self.pix = np.concatenate([self.pix] + pix).astype('int64')
+        self.ids = np.concatenate([self.ids] + ids).astype('int64')
+        self.counts = np.concatenate([self.counts, np.array(counts, dtype='int64')])
+
+    def mean(self, value_map, pairs=None):
+
+        # average of value_map under every rasterized line
+        if pairs is not None:
+            self.add(pairs)
+        sums = np.bincount(self.ids, weights=np.asarray(value_map, dtype='float64').ravel()[self.pix], minlength=len(self.pairs))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums/self.counts
+        if pairs is None:
+            return means
+        return means[[self.pair_index[tuple(pair)] for pair in pairs]]
+
+    def overlap(self, mask, pairs=None):
+        # fraction of line pixels falling on mask, as in getIntersection
+        return self.mean(np.asarray(mask) > 0, pairs)
+
+_line_raster_cache = {}
+
+def getLineRaster(junctions, width=1, imsize=256):
+
+    # keep one raster per width for the last building seen, so consecutive
+    # calls on the same junctions (e.g. experiments 0-6) reuse it; pairs are
+    # only rasterized when first scored
+    junctions = np.array(junctions)
+    key = (junctions.shape, junctions.dtype.str, junctions.tobytes())
+    cached = _line_raster_cache.get((width, imsize))
+    if cached is None or cached[0] != key:
+        cached = (key, LineRaster(junctions, width=width, imsize=imsize))
+        _line_raster_cache[(width, imsize)] = cached
+    return cached[1]
@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+from utils.intersections import doIntersectBatch
+
+# distances to a mask that decide the width-8 raster tests of castRay without rendering,
+# tuned against PIL's rasterizer: a width-8 line covers no pixel farther than ~4.8 from
+# the segment and every pixel closer than ~2.8 to it from 2px past its start, the start
+# ellipse blacks out pixels within ~4.3; rays in between are rendered
+MISS_DIST = 6.0
+HIT_DIST = 2.3
+HIT_START = 2.0
+ELLIPSE_DIST = 5.0
+
+class RegionRays():
+    """Rays cast from the contour of one region, same triples as castRay in optimizer.py."""
+
+    pad = 8
+
+    def __init__(self, region_small, other_regions, ls_list, junctions, ray_length=1000.0, thresh=0.0, width=8, imsize=256):
+        self.ls_list = [tuple(ls) for ls in ls_list]
+        self.ps = np.array([junctions[k] for k, l in self.ls_list], dtype='float64').reshape(-1, 2)
+        self.qs = np.array([junctions[l] for k, l in self.ls_list], dtype='float64').reshape(-1, 2)
+        self.ray_length = ray_length
+        self.thresh = thresh
+        self.width = width
+        self.imsize = imsize
+
+        # masks as tested in castRay, kept as flat pixel indices
+        region_small = np.asarray(region_small) > 0
+        self.self_pix = np.flatnonzero(region_small)
+        self.self_dt = self._distance(region_small)
+        self.other_pix, self.other_dt = None, None
+        if len(other_regions) > 0:
+            other_regions = np.clip(np.sum(np.array(other_regions), 0), 0, 1) > 0
+            self.other_pix = np.flatnonzero(other_regions)
+            self.other_dt = self._distance(other_regions)
+
+    def _distance(self, mask):
+
+        # distance to the closest mask pixel on a padded canvas, None if empty
+        if not mask.any():
+            return None
+        canvas = np.full((self.imsize+2*self.pad, self.imsize+2*self.pad), 255, dtype='uint8')
+        canvas[self.pad:self.pad+self.imsize, self.pad:self.pad+self.imsize][mask] = 0
+        return cv2.distanceTransform(canvas, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+    def _decide(self, dt, starts, dirs, min_start):
+
+        # 1 hit, 0 miss, -1 undecided, from the distance transform at unit steps along every ray
+        if dt is None:
+            return np.zeros(starts.shape[0], dtype='int64')
+        lo, hi = -self.pad, self.imsize-1+self.pad
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t1 = np.where(dirs != 0, (lo-starts)/dirs, -np.inf)
+            t2 = np.where(dirs != 0, (hi-starts)/dirs, np.inf)
+        t_max = np.clip(np.max(np.maximum(t1, t2), -1), 0.0, self.ray_length)
+        ts = np.arange(0.0, np.ceil(t_max.max())+1.0)
+        pts = np.rint(starts[:, np.newaxis, :]+ts[np.newaxis, :, np.newaxis]*dirs[:, np.newaxis, :]).astype('int64')
+        pts = np.clip(pts+self.pad, 0, self.imsize-1+2*self.pad)
+        ds = dt[pts[..., 1], pts[..., 0]]
+        ds[ts[np.newaxis, :] > t_max[:, np.newaxis]+1.0] = np.inf
+
+        # a sample is at most 0.5 from the ray and 0.71 from its pixel
+        miss = ds.min(-1)-1.21 > MISS_DIST
+        hit = np.any((ds+0.71 <= HIT_DIST) & (ts[np.newaxis, :] >= min_start+HIT_DIST), -1)
+        return np.where(hit, 1, np.where(miss, 0, -1))
+
+    def cast(self, pts, ths):
+        """Cast a ray from every pt along th, returns castRay's (intersec_set, intersec_region, self_inter) triples."""
+        if len(pts) == 0:
+            return []
+
+        # ray end points, computed as in castRay
+        starts, ends = [], []
+        for pt, th in zip(pts, ths):
+            x1, y1 = int(pt[0]), int(pt[1])
+            rad = np.radians(th)
+            dy = np.sin(rad)*self.ray_length
+            dx = np.cos(rad)*self.ray_length
+            starts.append((x1, y1))
+            ends.append((x1+dx, y1+dy))
+        starts, ends = np.array(starts, dtype='float64'), np.array(ends, dtype='float64')
+        dirs = (ends-starts)/self.ray_length
+
+        # all rays against all segments at once
+        n_rays, n_segs = starts.shape[0], self.ps.shape[0]
+        hit = np.zeros((n_rays, n_segs), dtype='bool')
+        if n_segs > 0:
+            hit = doIntersectBatch(np.repeat(starts, n_segs, 0), np.repeat(ends, n_segs, 0), \
+                np.tile(self.ps, (n_rays, 1)), np.tile(self.qs, (n_rays, 1))).reshape(n_rays, n_segs)
+
+        # region tests the distance transforms decide, the ratio test only reduces to a hit test for thresh 0
+        other = np.zeros(n_rays, dtype='int64')
+        if self.other_pix is not None:
+            other = self._decide(self.other_dt, starts, dirs, HIT_START)
+        own = np.full(n_rays, -1, dtype='int64')
+        if self.thresh == 0:
+            own = self._decide(self.self_dt, starts, dirs, ELLIPSE_DIST)
+
+        results = []
+        for r in range(n_rays):
+            intersec_set = set()
+            for i in np.where(hit[r])[0]:
+                intersec_set.add(self.ls_list[i])
+            intersec_region, self_inter = bool(other[r] == 1), bool(own[r] == 1)
+
+            # render the rest as in castRay
+            if other[r] < 0 or own[r] < 0:
+                x1, y1 = int(starts[r, 0]), int(starts[r, 1])
+                x2, y2 = ends[r]
+                ray_im = Image.new('L', (self.imsize, self.imsize))
+                dr = ImageDraw.Draw(ray_im)
+                dr.line((x1, y1, x2, y2), fill='white', width=self.width)
+                if other[r] < 0:
+                    ray = np.frombuffer(ray_im.tobytes(), dtype='uint8')
+                    intersec_region = bool(np.any(ray[self.other_pix]))
+                if own[r] < 0:
+                    dr.ellipse((x1-4, y1-4, x1+4, y1+4), fill='black')
+                    ray = np.frombuffer(ray_im.tobytes(), dtype='uint8')
+                    self_inter = bool(np.count_nonzero(ray[self.self_pix])/(np.count_nonzero(ray)+1e-8) > self.thresh)
+
+            if self_inter:
+                intersec_region = True
+            results.append((intersec_set, intersec_region, self_inter))
+        return results
@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+from PIL import Image
+from utils.loop_iou import polygon_crops
+
+def min_filter_regions(region_mks, filter_size=11):
+
+    # ImageFilter.MinFilter(filter_size) of every mask*255, in one call: the masks are
+    # edge-padded as PIL does and stacked, the padding keeps them from mixing
+    region_mks = np.array(region_mks)
+    if region_mks.shape[0] == 0:
+        return np.zeros((0, 256, 256), dtype='float32')
+    r = filter_size//2
+    padded = np.pad((region_mks*255.0).astype('float32'), ((0, 0), (r, r), (r, r)), mode='edge')
+    n, h, w = padded.shape
+    kernel = np.ones((filter_size, filter_size), dtype='uint8')
+    eroded = cv2.erode(padded.reshape(n*h, w), kernel, borderType=cv2.BORDER_REPLICATE).reshape(n, h, w)
+    return eroded[:, r:h-r, r:w-r]
+
+def erode_regions(region_mks, filter_size=11):
+
+    # eroded masks in [0, 1], as np.array(MinFilter output)/255.0
+    return min_filter_regions(region_mks, filter_size)/255.0
+
+def sample_contour(contour, density=1.0):
+
+    # keep an evenly spaced fraction of the contour points
+    contour = np.array(contour)
+    inds = np.linspace(0, contour.shape[0], min(int(contour.shape[0]*density), contour.shape[0]), endpoint=False).astype('int')
+    return contour[inds, :]
+
+def largest_contour(reg_sm):
+
+    # outer and inner contours of the thresholded eroded mask, with more than two points
+    ret, thresh = cv2.threshold(np.array(reg_sm*255.0).astype('uint8'), 127, 255, 0)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)
+    contours = [c.reshape(-1, 2) for c in contours if c.shape[0] > 2]
+    if len(contours) <= 1:
+        return contours[0] if len(contours) > 0 else None
+
+    # several candidates: pixels filled by ImageDraw.polygon, the first largest one wins
+    starts = np.cumsum([0]+[c.shape[0] for c in contours])
+    polys = [range(starts[k], starts[k+1]) for k in range(len(contours))]
+    sizes = [np.count_nonzero(crop) for _, _, crop in polygon_crops(np.concatenate(contours), polys)]
+    return contours[int(np.argmax(sizes))]
+
+class PreparedRegions():
+    """Eroded region masks of one building and their largest contours, see reconstructBuilding(region_prep=...)."""
+
+    def __init__(self, regions, filter_size=11):
+        self.regions = regions
+        self.filter_size = filter_size
+        self.eroded = min_filter_regions(regions, filter_size) # float32 MinFilter output, 0-255
+        self.reg_sm = self.eroded/255.0
+        self.sizes = [int(np.count_nonzero(m)) for m in self.reg_sm]
+
+        # regions left with a contour after erosion, in order
+        self.contours = {}
+        for i, reg_small in enumerate(self.reg_sm):
+            if self.sizes[i] > 0:
+                c = largest_contour(reg_small)
+                if c is not None:
+                    self.contours[i] = c
+        self.reg_list = sorted(self.contours)
+        self._samples = {}
+
+    def __len__(self):
+        return len(self.reg_sm)
+
+    def contour_points(self, i, density=1.0):
+        """Evenly spaced fraction density of the contour points of region i."""
+        if (i, density) not in self._samples:
+            self._samples[(i, density)] = sample_contour(self.contours[i], density)
+        return self._samples[(i, density)]
+
+    def eroded_image(self, i):
+        """Eroded region i as the PIL image MinFilter(filter_size) gives (mode 'F')."""
+        return Image.fromarray(self.eroded[i])
@@ -0,0 +1,75 @@
+import os
+import pickle as p
+from collections import OrderedDict
+
+class SharedEdgesStore():
+    """Shared edge masks keyed by (_id, i, j), one pickle per building loaded on first access."""
+    def __init__(self, root=None, shards=None, cache_size=8):
+        self.root = root
+        self.shards = shards
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def ids(self):
+        if self.shards is not None:
+            return list(self.shards.keys())
+        return sorted(fname[:-4] for fname in os.listdir(self.root) if fname.endswith('.pkl'))
+
+    def building(self, _id):
+        # entries of a single building, {} if it has none
+        if self.shards is not None:
+            return self.shards.get(_id, {})
+        if _id in self.cache:
+            self.cache.move_to_end(_id)
+            return self.cache[_id]
+        fname = '{}/{}.pkl'.format(self.root, _id)
+        entries = {}
+        if os.path.exists(fname):
+            with open(fname, 'rb') as f:
+                entries = p.load(f, encoding='latin1')
+        self.cache[_id] = entries
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entries
+
+    def __contains__(self, key):
+        return key in self.building(key[0])
+
+    def __getitem__(self, key):
+        return self.building(key[0])[key]
+
+    def get(self, key, default=None):
+        return self.building(key[0]).get(key, default)
+
+def group_shared_edges(shared_edges):
+    # split a global {(_id, i, j): masks} dict per building, in one pass
+    shards = {}
+    for key in shared_edges:
+        shards.setdefault(key[0], {})[key] = shared_edges[key]
+    return SharedEdgesStore(shards=shards)
+
+def write_shared_edges(shared_edges, root):
+    # one shard per building
+    os.makedirs(root, exist_ok=True)
+    store = group_shared_edges(shared_edges)
+    for _id in store.ids():
+        with open('{}/{}.pkl'.format(root, _id), 'wb') as f:
+            p.dump(store.building(_id), f, protocol=p.HIGHEST_PROTOCOL)
+
+def open_shared_edges(fname):
+
+    # use the sharded store next to the global pickle if it exists,
+    # e.g. shared_edges_no_bkg/ for shared_edges_no_bkg.pkl
+    root = os.path.splitext(fname)[0]
+    if os.path.isdir(root):
+        return SharedEdgesStore(root)
+    with open(fname, 'rb') as f:
+        return group_shared_edges(p.load(f, encoding='latin1'))
+
+if __name__ == '__main__':
+
+    # split a global pickle into per-building shards
+    import sys
+    fname = sys.argv[1]
+    with open(fname, 'rb') as f:
+        write_shared_edges(p.load(f, encoding='latin1'), os.path.splitext(fname)[0])
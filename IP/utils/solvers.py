@@ -0,0 +1,276 @@
+import time
+import numpy as np
+
+try:
+    import gurobipy
+except ImportError:
+    gurobipy = None
+
+try:
+    import pulp
+except ImportError:
+    pulp = None
+
+# status codes as lowercase names, e.g. 'optimal' or 'time_limit'
+GUROBI_STATUS = {}
+if gurobipy is not None:
+    GUROBI_STATUS = dict((getattr(gurobipy.GRB.Status, k), k.lower()) for k in dir(gurobipy.GRB.Status) if k.isupper())
+
+class SolverBackend():
+    """Minimal MIP model interface used by reconstructBuilding, the objective is maximized."""
+    name = None
+
+    def __init__(self, model_name, verbose=False):
+        self.model_name = model_name
+        self.verbose = verbose
+
+    def add_var(self, vtype='binary', name=''):
+        raise NotImplementedError
+
+    def lin_expr(self):
+        raise NotImplementedError
+
+    def add_constr(self, constr, name=''):
+        raise NotImplementedError
+
+    def set_objective(self, obj):
+        raise NotImplementedError
+
+    def optimize(self):
+        raise NotImplementedError
+
+    def get_values(self):
+        # (name, value) for every variable, in creation order, 0 when there is no solution
+        raise NotImplementedError
+
+    def get_var_values(self, variables):
+        # values of the given variables as one array, 0 when there is no solution
+        raise NotImplementedError
+
+    def set_time_limit(self, seconds):
+        # cap the run time of the next optimize() calls, None to lift the cap; optimize()
+        # then returns the best solution found so far, see sol_count in get_stats()
+        raise NotImplementedError
+
+    def set_start(self):
+        # use the current solution as MIP start of the next optimize()
+        raise NotImplementedError
+
+    def get_stats(self):
+        # model size, solve time, status, number of solutions found, MIP gap and node count
+        # of the last optimize(), nan where the backend does not report them
+        raise NotImplementedError
+
+    def expr_upper_bound(self, expr):
+        # upper bound of a linear expression over binary variables
+        raise NotImplementedError
+
+    # products of binaries - exact linear encodings
+    def add_edge_corner_constr(self, ls_var, js_var_k, js_var_l, name=''):
+        # (js_k + js_l - 2)*ls == 0  <=>  ls <= js_k, ls <= js_l
+        self.add_constr(ls_var <= js_var_k, name)
+        self.add_constr(ls_var <= js_var_l, name)
+
+    def add_exclusive_constr(self, var_a, var_b, name=''):
+        # var_a*var_b == 0  <=>  var_a + var_b <= 1
+        self.add_constr(var_a + var_b <= 1, name)
+
+    def add_min_degree_constr(self, deg_expr, js_var, min_degree, name=''):
+        # deg*js >= min_degree*js  <=>  deg >= min_degree*js
+        self.add_constr(deg_expr >= min_degree*js_var, name)
+
+    def add_region_upper_constr(self, sum_expr, reg_var, slack_var, name=''):
+        # sum*reg <= reg + slack, big-M on reg with M the bound of sum
+        big_m = self.expr_upper_bound(sum_expr)
+        self.add_constr(sum_expr <= reg_var + slack_var + big_m*(1 - reg_var), name)
+
+    def add_region_lower_constr(self, sum_expr, reg_var, slack_var, name=''):
+        # sum*reg >= reg - slack  <=>  sum >= reg - slack, since sum >= 0
+        self.add_constr(sum_expr >= reg_var - slack_var, name)
+
+    def add_region_hit_constr(self, ls_var, reg_var, slack_var, name=''):
+        # ls*reg <= slack  <=>  ls + reg - 1 <= slack
+        self.add_constr(ls_var + reg_var - 1 <= slack_var, name)
+
+class GurobiBackend(SolverBackend):
+    """Gurobi adapter, products of binaries as quadratic constraints unless linearize is set."""
+    name = 'gurobi'
+
+    def __init__(self, model_name, verbose=False, linearize=False):
+        if gurobipy is None:
+            raise ImportError('gurobipy is required for the gurobi backend')
+        super(GurobiBackend, self).__init__(model_name, verbose)
+        self.linearize = linearize
+        self.m = gurobipy.Model(model_name)
+        self.m.setParam('OutputFlag', verbose)
+
+    def add_var(self, vtype='binary', name=''):
+        vtype = gurobipy.GRB.BINARY if vtype == 'binary' else gurobipy.GRB.INTEGER
+        return self.m.addVar(vtype=vtype, name=name)
+
+    def lin_expr(self):
+        return gurobipy.LinExpr(0)
+
+    def add_constr(self, constr, name=''):
+        return self.m.addConstr(constr, name)
+
+    def set_objective(self, obj):
+        self.m.setObjective(obj, gurobipy.GRB.MAXIMIZE)
+
+    def optimize(self):
+        self.m.optimize()
+
+    def get_values(self):
+        if self.m.SolCount == 0:
+            return [(v.varName, 0.0) for v in self.m.getVars()]
+        return [(v.varName, v.x) for v in self.m.getVars()]
+
+    def get_var_values(self, variables):
+        if self.m.SolCount == 0 or len(variables) == 0:
+            return np.zeros(len(variables))
+        return np.array(self.m.getAttr('X', variables))
+
+    def set_time_limit(self, seconds):
+        self.m.setParam('TimeLimit', gurobipy.GRB.INFINITY if seconds is None else seconds)
+
+    def set_start(self):
+        if self.m.SolCount > 0:
+            for v in self.m.getVars():
+                v.Start = v.X
+
+    def get_stats(self):
+        # the gap is only defined once there is an incumbent
+        mip_gap = self.m.MIPGap if self.m.SolCount > 0 else float('nan')
+        return {'num_vars': self.m.NumVars, 'num_constrs': self.m.NumConstrs, \
+            'num_qconstrs': self.m.NumQConstrs, 'solve_time': self.m.Runtime, \
+            'status': GUROBI_STATUS.get(self.m.Status, str(self.m.Status)), 'sol_count': self.m.SolCount, \
+            'mip_gap': mip_gap, 'node_count': self.m.NodeCount}
+
+    def expr_upper_bound(self, expr):
+        return expr.getConstant() + sum(max(expr.getCoeff(i), 0.0) for i in range(expr.size()))
+
+    def add_edge_corner_constr(self, ls_var, js_var_k, js_var_l, name=''):
+        if self.linearize:
+            return super(GurobiBackend, self).add_edge_corner_constr(ls_var, js_var_k, js_var_l, name)
+        self.m.addConstr((js_var_k + js_var_l - 2)*ls_var == 0, name)
+
+    def add_exclusive_constr(self, var_a, var_b, name=''):
+        if self.linearize:
+            return super(GurobiBackend, self).add_exclusive_constr(var_a, var_b, name)
+        self.m.addConstr(var_a*var_b == 0, name)
+
+    def add_min_degree_constr(self, deg_expr, js_var, min_degree, name=''):
+        if self.linearize:
+            return super(GurobiBackend, self).add_min_degree_constr(deg_expr, js_var, min_degree, name)
+        self.m.addConstr(deg_expr*js_var >= min_degree*js_var, name)
+
+    def add_region_upper_constr(self, sum_expr, reg_var, slack_var, name=''):
+        if self.linearize:
+            return super(GurobiBackend, self).add_region_upper_constr(sum_expr, reg_var, slack_var, name)
+        self.m.addConstr(sum_expr*reg_var <= reg_var + slack_var, name)
+
+    def add_region_lower_constr(self, sum_expr, reg_var, slack_var, name=''):
+        if self.linearize:
+            return super(GurobiBackend, self).add_region_lower_constr(sum_expr, reg_var, slack_var, name)
+        self.m.addConstr(sum_expr*reg_var >= reg_var - slack_var, name)
+
+    def add_region_hit_constr(self, ls_var, reg_var, slack_var, name=''):
+        if self.linearize:
+            return super(GurobiBackend, self).add_region_hit_constr(ls_var, reg_var, slack_var, name)
+        self.m.addConstr(ls_var*reg_var <= slack_var, name)
+
+class PulpBackend(SolverBackend):
+    """Open-source adapter through PuLP, solved with CBC or HiGHS."""
+    solvers = {'cbc': 'PULP_CBC_CMD', 'highs': 'HiGHS'}
+
+    def __init__(self, model_name, verbose=False, solver='cbc'):
+        if pulp is None:
+            raise ImportError('pulp is required for the {} backend'.format(solver))
+        super(PulpBackend, self).__init__(model_name, verbose)
+        self.name = solver
+        self.time_limit = None
+        self.warm_start = False
+        self.solver = self.get_solver()
+        self.m = pulp.LpProblem(model_name, pulp.LpMaximize)
+        self.vars = []
+        self.var_names = []
+        self.solve_time = 0.0
+
+    def get_solver(self):
+        # solver command with the time limit and warm start set so far
+        options = {'msg': self.verbose}
+        if self.time_limit is not None:
+            options['timeLimit'] = self.time_limit
+        if self.warm_start and self.name == 'cbc':
+            options['warmStart'] = True
+        return getattr(pulp, self.solvers[self.name])(**options)
+
+    def has_solution(self):
+        return self.m.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible)
+
+    def add_var(self, vtype='binary', name=''):
+        # pulp needs unique names, keep the given one aside for decoding
+        cat = pulp.LpBinary if vtype == 'binary' else pulp.LpInteger
+        var = pulp.LpVariable('v{}'.format(len(self.vars)), lowBound=0, cat=cat)
+        self.vars.append(var)
+        self.var_names.append(name)
+        return var
+
+    def lin_expr(self):
+        return pulp.LpAffineExpression()
+
+    def add_constr(self, constr, name=''):
+        self.m += constr
+
+    def set_objective(self, obj):
+        self.m.setObjective(obj)
+
+    def optimize(self):
+        start = time.time()
+        self.m.solve(self.solver)
+        self.solve_time = time.time()-start
+
+    def get_values(self):
+        # without a solution cbc leaves the relaxation values in place
+        if not self.has_solution():
+            return [(name, 0.0) for name in self.var_names]
+        return [(name, var.varValue or 0.0) for name, var in zip(self.var_names, self.vars)]
+
+    def get_var_values(self, variables):
+        if not self.has_solution():
+            return np.zeros(len(variables))
+        return np.array([var.varValue or 0.0 for var in variables], dtype='float64')
+
+    def set_time_limit(self, seconds):
+        self.time_limit = seconds
+        self.solver = self.get_solver()
+
+    def set_start(self):
+        # only cbc reads the start through pulp, highs ignores it
+        for var in self.vars:
+            if var.varValue is not None:
+                var.setInitialValue(var.varValue)
+        self.warm_start = True
+        self.solver = self.get_solver()
+
+    def get_stats(self):
+        # pulp reports neither the gap nor the node count, and 'Optimal' for a solution
+        # found before the time limit, which is told apart by the solution status
+        status = pulp.LpStatus[self.m.status].lower().replace(' ', '_')
+        if self.m.sol_status == pulp.LpSolutionIntegerFeasible:
+            status = 'feasible' if self.time_limit is None else 'time_limit'
+        return {'num_vars': len(self.vars), 'num_constrs': self.m.numConstraints(), \
+            'num_qconstrs': 0, 'solve_time': self.solve_time, 'status': status, 'sol_count': int(self.has_solution()), \
+            'mip_gap': float('nan'), 'node_count': float('nan')}
+
+    def expr_upper_bound(self, expr):
+        expr = pulp.LpAffineExpression(expr)
+        return expr.constant + sum(max(coef, 0.0) for coef in expr.values())
+
+def get_backend(solver='gurobi', model_name='building_reconstruction', verbose=False, linearize=False):
+    # open-source backends are always linearized
+    if solver == 'gurobi':
+        return GurobiBackend(model_name, verbose=verbose, linearize=linearize)
+    if solver in PulpBackend.solvers:
+        return PulpBackend(model_name, verbose=verbose, solver=solver)
+    raise ValueError('unknown solver backend: {}'.format(solver))
@@ -10,6 +10,13 @@ from models.graph import EdgeClassifier
 from models.resnet import resnet152, resnet18
 import torch
 import random
+import hashlib
+from utils.raster import LineRaster
+from utils.bundle import open_bundle
+from utils.shared_edges import open_shared_edges
+from utils.nms import nms
+from utils.loop_iou import PackedRegions
+from utils.regions import erode_regions
 
 def draw_junctions(_id, junctions, path, thetas=None, theta_confs=None):
     # draw corners
@@ -113,30 +120,6 @@ def draw_regions(masks, _id, path):
     bg_img.save(path)
     return 
 
-def nms(junctions, junc_confs, thetas, theta_confs, nms_thresh=4.0):
-
-    inds = np.argsort(junc_confs)[::-1]
-    junc_confs_sorted = np.array(junc_confs[inds])
-    juncs_sorted = np.array(junctions[inds])
-    thetas_sorted = np.array(thetas[inds])
-    theta_confs_sorted = np.array(theta_confs[inds])
-
-    # get loop 
-    dists = np.apply_along_axis(np.linalg.norm, 2,\
-        juncs_sorted[:, None, :] - juncs_sorted[None, :, :])
-
-    # apply nms
-    keep_track = np.zeros(junc_confs_sorted.shape[0])
-    nms_inds = []
-    for i in range(junc_confs_sorted.shape[0]):
-        if (keep_track[i] == 0):
-            nms_inds.append(i)
-            for j in range(junc_confs_sorted.shape[0]):
-                if dists[i, j] < nms_thresh:
-                    keep_track[j] = 1
-
-    return juncs_sorted[nms_inds], junc_confs_sorted[nms_inds], thetas_sorted[nms_inds], theta_confs_sorted[nms_inds]
-
 def adjust_learning_rate(optimizer, epoch, LR, LR_param):
     #lr = LR * (0.1 ** (epoch // dropLR))
     LR_policy = LR_param.get('lr_policy', 'step')
@@ -210,71 +193,87 @@ def filter_angles(th, th_c, thresh=0.5):
         th_c_filtered.append(th_c_list[inds])
     return th_filtered, th_c_filtered
 
-def filter_regions(region_mks, shared_edges, _id, filter_size=11):
-
-    # sort by size
-    sizes = []
-    reg_sm = []
-    for i, reg_i in enumerate(region_mks):
-
-        # apply min filter 
-        reg_i_sm = Image.fromarray(reg_i*255.0)
-        reg_i_sm = reg_i_sm.filter(ImageFilter.MinFilter(filter_size))
-        reg_i_sm = np.array(reg_i_sm)/255.0
-        reg_sm.append(reg_i_sm)
-        sizes.append(reg_i_sm.sum())
+def suppress_regions(region_mks, filter_size=11):
 
+    # erode and sort by size, largest first
+    reg_sm = erode_regions(region_mks, filter_size)
+    sizes = [reg_i_sm.sum() for reg_i_sm in reg_sm]
     inds = np.argsort(sizes)[::-1]
-    sizes_sorted = np.array(sizes)[inds]
-    region_mks_sorted = np.array(region_mks)[inds]
-    reg_sm_sorted = np.array(reg_sm)[inds]
-    inds_sorted = np.array(inds)
 
     # filter zero sized
-    inds = np.where(sizes_sorted>0)
-    sizes_sorted = sizes_sorted[inds]
-    region_mks_sorted = region_mks_sorted[inds]
-    reg_sm_sorted = reg_sm_sorted[inds]
-    inds_sorted = inds_sorted[inds]
-
-    # suppress regions
-    suppressed = np.zeros(region_mks_sorted.shape[0])
-    for i, reg_i in enumerate(region_mks_sorted):
-        for j, reg_j in enumerate(region_mks_sorted):
-            if i != j and not suppressed[i] and not suppressed[j]:
-                intersec = np.logical_and(reg_sm_sorted[i], reg_sm_sorted[j])
-                intersec = np.array(np.where(intersec>0))
-                if intersec.shape[1] > 0:
-                    suppressed[j] = 1
-
-                    # # DEBUG
-                    # deb_1 = Image.fromarray(reg_i*255.0)
-                    # deb_2 = Image.fromarray(reg_j*255.0)
-                    # plt.figure()
-                    # plt.imshow(deb_1)
-                    # plt.figure()
-                    # plt.imshow(deb_2)
-                    # plt.show()
-
-    regions_filtered = [m for i, m in enumerate(region_mks_sorted) if not suppressed[i]]
-    regions_filtered = np.array(regions_filtered)
-    
+    inds = inds[np.array(sizes)[inds] > 0]
+
+    # keep a region unless a larger kept one overlaps it, only bounding boxes that meet are compared
+    packed = PackedRegions.from_masks(reg_sm[inds])
+    touching = packed.intersects(packed)
+    suppressed = np.zeros(inds.shape[0], dtype='bool')
+    kept = []
+    for i in range(inds.shape[0]):
+        if not suppressed[i]:
+            kept.append(inds[i])
+            suppressed |= touching[i]
+    return kept
+
+def filter_regions(region_mks, shared_edges, _id, filter_size=11):
+
+    # regions kept after suppression, largest first
+    region_mks = np.array(region_mks)
+    kept = suppress_regions(region_mks, filter_size)
+    regions_filtered = np.array([region_mks[i] for i in kept])
+
     # revert indices
     inds_map = {}
-    curr_j = 0
-    for k, ind in enumerate(inds_sorted):
-        if not suppressed[k]:
-            inds_map[ind] = curr_j
-            curr_j += 1
+    for curr_j, ind in enumerate(kept):
+        inds_map[ind] = curr_j
 
-    # reindex shared edges
+    # reindex shared edges, touching only this building's entries
     shared_edges_per_id = {}
-    for (_id, old_i, old_j) in shared_edges.keys():
-        if (old_i in inds_map) and (old_j in inds_map): 
-            shared_edges_per_id[(_id, inds_map[old_i], inds_map[old_j])] = shared_edges[(_id, old_i, old_j)]
+    entries = shared_edges.building(_id) if hasattr(shared_edges, 'building') else shared_edges
+    for (key_id, old_i, old_j) in entries.keys():
+        if (key_id == _id) and (old_i in inds_map) and (old_j in inds_map): 
+            shared_edges_per_id[(key_id, inds_map[old_i], inds_map[old_j])] = entries[(key_id, old_i, old_j)]
 
     return regions_filtered, shared_edges_per_id
 
+def load_shared_edges(_ids, shared_edges_fname, bundle_dir=None):
+
+    # the shared edges store, not opened when every building has a bundle (see preprocess_bundles.py)
+    if bundle_dir is not None and all(os.path.exists('{}/{}.npz'.format(bundle_dir, _id)) for _id in _ids):
+        return None
+    return open_shared_edges(shared_edges_fname)
+
+def load_building(_id, res_dir, edge_dir, region_dir, shared_edges, annot_dir=None, bundle_dir=None, nms_thresh=8.0):
+
+    # read the bundle written by preprocess_bundles.py if there is one
+    if bundle_dir is not None and os.path.exists('{}/{}.npz'.format(bundle_dir, _id)):
+        return open_bundle('{}/{}.npz'.format(bundle_dir, _id))
+
+    # load detections and apply non maxima supression
+    with open('{}/{}.jpg_5.pkl'.format(res_dir, _id), 'rb') as f:
+        c = p.load(f, encoding='latin1')
+    cs, cs_c, th, th_c = nms(c['junctions'], c['junc_confs'], c['thetas'], c['theta_confs'], nms_thresh=nms_thresh)
+
+    # load annotations
+    graph_annot = None
+    if annot_dir is not None:
+        v_set = np.load(open('{}/{}.npy'.format(annot_dir, _id), 'rb'),  encoding='bytes', allow_pickle=True)
+        graph_annot = dict(v_set[()])
+        # gen_teaser.py read the same files through [b'graph'], run_ablation_experiments.py
+        # as is; both forms are accepted so one loader (and one bundle) serves both scripts
+        if b'graph' in graph_annot:
+            graph_annot = graph_annot[b'graph']
+
+    # load edge map and region masks
+    edge_map = np.array(Image.open('{}/{}.jpg'.format(edge_dir, _id)).convert('L'))/255.0
+    region_mks = np.load('{}/{}.npy'.format(region_dir, _id))
+    region_mks, shared_edges_per_id = filter_regions(region_mks, shared_edges, _id)
+    if hasattr(shared_edges, 'building'):
+        shared_edges = shared_edges.building(_id)
+
+    return {'_id': _id, 'cs': cs, 'cs_c': cs_c, 'th': th, 'th_c': th_c, 'edge_map': edge_map,
+            'region_mks': region_mks, 'shared_edges': shared_edges, 'shared_edges_per_id': shared_edges_per_id,
+            'graph_annot': graph_annot}
+
 def load_annots(graph):
 
     # map corners
@@ -328,59 +327,106 @@ def stress(all_numbers):
         continue
     return
 
-def get_edge_scores(junctions, regions, rgb_folder, _id, epoch=1, model='resnet152'):
-
-    # load model
-    resnet = resnet152(pretrained=False).cuda()
-    edge_classifier = EdgeClassifier(resnet)
-    edge_classifier = edge_classifier.cuda()
-    edge_classifier = edge_classifier.eval()
-
-    # open RGB image
-    split = 'det'
-    out_size = 256
-    rgb_path = os.path.join(rgb_folder, _id +'.jpg')
-    rgb = Image.open(rgb_path).resize((out_size, out_size))
-    rgb = np.array(rgb)/255.0
-    model_path = '/home/nelson/Workspace/building_reconstruction/working_model/binary_edge_classifier_with_regions/saved_models/edge_classifier_{}_{}_iter_{}.pth'.format(model, split, epoch)
-    edge_classifier.load_state_dict(torch.load(model_path))
-
-    # check backup -- save time
-    temp_dir = './temp/{}/'.format(model)
-    if not os.path.isdir(temp_dir):
-        os.makedirs(temp_dir)
-
-    backup_path = '{}/{}_{}_{}.npy'.format(temp_dir, _id, epoch, split)
-    if os.path.isfile(backup_path):
-        return np.load(open(backup_path, 'rb'),  encoding='bytes').item()
-
-    # combine regions
-    all_reg = np.zeros((out_size, out_size))
-    for k, reg in enumerate(regions):
-        reg = Image.fromarray(reg*255.0).resize((out_size, out_size))
-        reg = np.array(reg)/255.0
-        inds = np.array(np.where(reg==1))
-        all_reg[inds[0, :], inds[1, :]] = k
-
-    # draw edge
-    lw_from_cls = {}
-    for k, c1 in enumerate(junctions):
-        for l, c2 in enumerate(junctions):
-            if k > l:
-                edge = Image.new('L', (out_size, out_size))
-                dr = ImageDraw.Draw(edge)
-                x1, y1 = c1
-                x2, y2 = c2
-                div = 256.0/out_size
-                dr.line((int(x1/div), int(y1/div), int(x2/div), int(y2/div)), fill="white", width=int(4/div))
-                edge = np.array(edge)/255.0
-                imgs = np.concatenate([rgb.transpose(2, 0, 1), edge[np.newaxis, :, :], all_reg[np.newaxis, :, :]], 0)
-                imgs = torch.from_numpy(imgs).cuda().float()
-                prob = edge_classifier(imgs.unsqueeze(0))
-                prob = prob.detach().cpu().numpy()
-                lw_from_cls[(k, l)] = prob[0]
-
-    # save backup
-    np.save(open(backup_path, 'wb'), lw_from_cls)
-
-    return lw_from_cls
\ No newline at end of file
+class EdgeScorer():
+    """Edge classifier loaded once per process, scores are cached on disk per building and checkpoint."""
+    def __init__(self, model='resnet152', epoch=1, split='det', device=None, batch_size=32, out_size=256, \
+        cache_dir='./temp', model_path=None):
+        self.model = model
+        self.epoch = epoch
+        self.split = split
+        self.device = device if device is not None else ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.batch_size = batch_size
+        self.out_size = out_size
+        self.cache_dir = '{}/{}'.format(cache_dir, model)
+        if model_path is None:
+            model_path = '/home/nelson/Workspace/building_reconstruction/working_model/binary_edge_classifier_with_regions/saved_models/edge_classifier_{}_{}_iter_{}.pth'.format(model, split, epoch)
+        self.model_path = model_path
+        self.edge_classifier = None
+        self.version = None
+
+    def load(self):
+
+        # load model and hash its checkpoint, only once
+        if self.edge_classifier is not None:
+            return
+        resnet = resnet152(pretrained=False) if self.model == 'resnet152' else resnet18(pretrained=False)
+        edge_classifier = EdgeClassifier(resnet)
+        edge_classifier.load_state_dict(torch.load(self.model_path, map_location=self.device))
+        self.edge_classifier = edge_classifier.to(self.device).eval()
+        self.version = self.checkpoint_hash()
+
+    def checkpoint_hash(self):
+        sha = hashlib.sha1()
+        with open(self.model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def cache_path(self, junctions, regions, _id):
+        if self.version is None:
+            self.version = self.checkpoint_hash()
+        sha = hashlib.sha1()
+        for x in [_id, self.version, self.out_size, np.asarray(junctions, dtype='float64').tobytes(), \
+            np.asarray(regions, dtype='float64').tobytes()]:
+            sha.update(str(x).encode() if not isinstance(x, bytes) else x)
+        return '{}/{}.npz'.format(self.cache_dir, sha.hexdigest())
+
+    def __call__(self, junctions, regions, rgb_folder, _id):
+
+        # check cache
+        cache_path = self.cache_path(junctions, regions, _id)
+        if os.path.isfile(cache_path):
+            with np.load(cache_path) as f:
+                return {(int(k), int(l)): prob for (k, l), prob in zip(f['pairs'], f['probs'])}
+        self.load()
+
+        # open RGB image
+        out_size = self.out_size
+        rgb_path = os.path.join(rgb_folder, _id +'.jpg')
+        rgb = Image.open(rgb_path).resize((out_size, out_size))
+        rgb = np.array(rgb)/255.0
+
+        # combine regions
+        all_reg = np.zeros((out_size, out_size))
+        for k, reg in enumerate(regions):
+            reg = Image.fromarray(reg*255.0).resize((out_size, out_size))
+            reg = np.array(reg)/255.0
+            inds = np.array(np.where(reg==1))
+            all_reg[inds[0, :], inds[1, :]] = k
+
+        # rasterize every edge once, same lines as drawing them one by one
+        div = 256.0/out_size
+        juncs = [(int(x/div), int(y/div)) for x, y in junctions]
+        pairs = [(k, l) for k in range(len(junctions)) for l in range(len(junctions)) if k > l]
+        raster = LineRaster(juncs, pairs, width=int(4/div), imsize=out_size)
+
+        # run in mini-batches sharing the rgb and region channels
+        base = torch.from_numpy(np.concatenate([rgb.transpose(2, 0, 1), all_reg[np.newaxis, :, :]], 0)).float().to(self.device)
+        probs = []
+        with torch.no_grad():
+            for start in range(0, len(pairs), self.batch_size):
+                end = min(start+self.batch_size, len(pairs))
+                lo, hi = np.searchsorted(raster.ids, [start, end])
+                edges = np.zeros((end-start, out_size*out_size), dtype='float32')
+                edges[raster.ids[lo:hi]-start, raster.pix[lo:hi]] = 1.0
+                edges = torch.from_numpy(edges.reshape(-1, 1, out_size, out_size)).to(self.device)
+                imgs = torch.cat([base[:3].expand(end-start, -1, -1, -1), edges, base[3:].expand(end-start, -1, -1, -1)], 1)
+                probs.append(self.edge_classifier(imgs).detach().cpu().numpy())
+        probs = np.concatenate(probs) if len(probs) > 0 else np.zeros(0, dtype='float32')
+
+        # save to cache
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.savez(cache_path, pairs=np.array(pairs, dtype='int64').reshape(-1, 2), probs=probs)
+
+        return {pair: prob for pair, prob in zip(pairs, probs)}
+
+_edge_scorers = {}
+
+def get_edge_scores(junctions, regions, rgb_folder, _id, epoch=1, model='resnet152', device=None, batch_size=32):
+
+    # one scorer (and model) per process and checkpoint
+    key = (model, epoch, device)
+    if key not in _edge_scorers:
+        _edge_scorers[key] = EdgeScorer(model=model, epoch=epoch, device=device, batch_size=batch_size)
+    _edge_scorers[key].batch_size = batch_size
+    return _edge_scorers[key](junctions, regions, rgb_folder, _id)
\ No newline at end of file
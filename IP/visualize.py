@@ -18,12 +18,12 @@ corner_dir = '{}/dets/corners/'.format(prefix)
 annot_dir = '{}/annot/'.format(prefix)
 region_dir = '/{}/regions_no_bkg/'.format(prefix)
 shared_edges_fname = '{}/shared_edges_no_bkg.pkl'.format(prefix)
-
-with open(shared_edges_fname, 'rb') as f:
-    shared_edges = p.load(f, encoding='latin1')
+bundle_dir = '{}/bundles'.format(prefix)
 
 with open('{}/valid_list.txt'.format(prefix)) as f:
     _ids = [x.strip() for x in f.readlines()]
+
+shared_edges = load_shared_edges(_ids, shared_edges_fname, bundle_dir)
         
 os.makedirs('viz/PC', exist_ok=True)
 os.makedirs('viz/PE', exist_ok=True)
@@ -37,23 +37,12 @@ for _id in _ids:
 
     print(_id)
 
-    # load detections
-    fname = '{}/{}.jpg_5.pkl'.format(res_dir, _id)
-    with open(fname, 'rb') as f:
-        c = p.load(f, encoding='latin1')
-
-    # apply non maxima supression
-    cs, cs_c, th, th_c = nms(c['junctions'], c['junc_confs'], c['thetas'], c['theta_confs'], nms_thresh=8.0)
-
-    # load edge map
-    edge_map_path = '{}/{}.jpg'.format(edge_dir, _id)
+    # load post-nms detections, edge map and filtered region masks
+    b = load_building(_id, res_dir, edge_dir, region_dir, shared_edges, bundle_dir=bundle_dir)
+    cs, cs_c, th, th_c = b['cs'], b['cs_c'], b['th'], b['th_c']
+    edge_map = b['edge_map']
+    region_mks, shared_edges_per_id = b['region_mks'], b['shared_edges_per_id']
     im_path = '{}/{}.jpg'.format(rgb_dir, _id)
-    edge_map = np.array(Image.open(edge_map_path).convert('L'))/255.0
-
-    # load region masks
-    region_path = '{}/{}.npy'.format(region_dir, _id)
-    region_mks = np.load(region_path)
-    region_mks, shared_edges_per_id = filter_regions(region_mks, shared_edges, _id)
 
     # visualize all
 
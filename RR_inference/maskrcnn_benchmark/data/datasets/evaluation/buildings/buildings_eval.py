@@ -91,8 +91,14 @@ def do_buildings_evaluation(dataset, predictions, box_only, output_folder, iou_t
         deb_im.save('/local-scratch2/nnauata/outdoor_project/results/dump/edges_{}.jpg'.format(_building_id))
         ### DEBUG ###
 
-    with open("{}/shared_edges_no_bkg.pkl".format(shared_edges_folder),"wb") as f:
-        p.dump(im_shared_edges, f)
+    # one shard per building, read lazily by IP/utils/shared_edges.py
+    shards = defaultdict(dict)
+    for key, ms in im_shared_edges.items():
+        shards[key[0]][key] = ms
+    os.makedirs("{}/shared_edges_no_bkg".format(shared_edges_folder), exist_ok=True)
+    for _building_id, entries in shards.items():
+        with open("{}/shared_edges_no_bkg/{}.pkl".format(shared_edges_folder, _building_id),"wb") as f:
+            p.dump(entries, f)
 
     return
 
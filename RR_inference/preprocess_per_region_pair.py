@@ -1,9 +1,24 @@
 import numpy as np
 import pickle as p
 import os
+import importlib.util
 from PIL import Image, ImageDraw, ImageFilter
 import random
 
+def load_ip_module(name):
+
+    # load IP/utils/{name}.py by path as ip_{name}, putting IP on sys.path would let its
+    # top-level utils package shadow other utils imports
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'IP', 'utils', '{}.py'.format(name))
+    spec = importlib.util.spec_from_file_location('ip_{}'.format(name), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# region labeling and junction nms shared with IP
+fill_regions = load_ip_module('labeling').fill_regions
+nms = load_ip_module('nms').nms
+
 def getIntersection(region_map, j1, j2):
     x1, y1 = j1
     x2, y2 = j2
@@ -153,28 +168,6 @@ def compute_edges_mask(graph):
             draw.line((x1, y1, x2, y2), width=1, fill='white')
     return np.array(im) 
 
-def _flood_fill(edge_mask, x0, y0, tag):
-    new_edge_mask = np.array(edge_mask)
-    nodes = [(x0, y0)]
-    new_edge_mask[x0, y0] = tag
-    while len(nodes) > 0:
-        x, y = nodes.pop(0)
-        for (dx, dy) in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            if (0 <= x+dx < new_edge_mask.shape[0]) and (0 <= y+dy < new_edge_mask.shape[0]) and (new_edge_mask[x+dx, y+dy] == 0):
-                new_edge_mask[x+dx, y+dy] = tag
-                nodes.append((x+dx, y+dy))
-    return new_edge_mask
-
-def fill_regions(edge_mask):
-    edge_mask = edge_mask
-    tag = 2
-    for i in range(edge_mask.shape[0]):
-        for j in range(edge_mask.shape[1]):
-            if edge_mask[i, j] == 0:
-                edge_mask = _flood_fill(edge_mask, i, j, tag)
-                tag += 1
-    return edge_mask
-
 def assign_regions(regions_annot, regions_det, thresh=0.8):
     reg_det_annot = {}
     for i, reg_d in enumerate(regions_det):
@@ -184,30 +177,6 @@ def assign_regions(regions_annot, regions_det, thresh=0.8):
                 reg_det_annot[i] = j
     return reg_det_annot
 
-def nms(junctions, junc_confs, thetas, theta_confs, nms_thresh=4.0):
-
-    inds = np.argsort(junc_confs)[::-1]
-    junc_confs_sorted = np.array(junc_confs[inds])
-    juncs_sorted = np.array(junctions[inds])
-    thetas_sorted = np.array(thetas[inds])
-    theta_confs_sorted = np.array(theta_confs[inds])
-
-    # get loop 
-    dists = np.apply_along_axis(np.linalg.norm, 2,\
-        juncs_sorted[:, None, :] - juncs_sorted[None, :, :])
-
-    # apply nms
-    keep_track = np.zeros(junc_confs_sorted.shape[0])
-    nms_inds = []
-    for i in range(junc_confs_sorted.shape[0]):
-        if (keep_track[i] == 0):
-            nms_inds.append(i)
-            for j in range(junc_confs_sorted.shape[0]):
-                if dists[i, j] < nms_thresh:
-                    keep_track[j] = 1
-
-    return juncs_sorted[nms_inds], junc_confs_sorted[nms_inds], thetas_sorted[nms_inds], theta_confs_sorted[nms_inds]
-
 ######## PREPROCESS DATA ########
 dataset_folder = '/local-scratch2/nnauata/cities_dataset'
 annots_folder = '{}/annot'.format(dataset_folder)